@@ -1,18 +1,28 @@
-import tkinter as tk
-from ui_main import MainApp
-from theme import setup_theme
-from storage import load_state
+import startup_trace
+import os
+import sys
+
+def _trace_save(path, ms, merged, snapshot_ms, error):
+    name = f"{os.path.basename(path)} 合并 {merged} 次，取快照 {snapshot_ms:.1f} ms"
+    startup_trace.record("save", name + (f" 失败：{error}" if error else ""), ms)
 
 def main():
+    # 界面模块在此导入：进程池子进程（spawn）会重新导入本模块，但只需 importers
+    import tkinter as tk
+    from ui_main import MainApp
+    from theme import setup_theme
+    from storage import get_pref, flush_prefs, flush_saves, set_save_observer
+    startup_trace.mark("imports_done")
+    set_save_observer(_trace_save)
     root = tk.Tk()
     root.title("个人记账本")
     try:
-        s = load_state()
-        mode = (s.get("prefs", {}) or {}).get("theme", "light")
+        mode = get_pref("theme", "light")
     except Exception:
         mode = "light"
     setup_theme(root, mode)
-    app = MainApp(root)
+    with startup_trace.span("build", "MainApp"):
+        app = MainApp(root)
     app.pack(fill=tk.BOTH, expand=True)
     try:
         setup_theme(root, mode)
@@ -20,6 +30,15 @@ def main():
         pass
     root.geometry("1400x800")
     root.mainloop()
+    flush_prefs()
+    try:
+        flush_saves()
+    except OSError as e:
+        print(f"账本保存失败：{e}", file=sys.stderr)
 
 if __name__ == "__main__":
+    # 多文件导入使用进程池，打包为 exe 后子进程需经此入口启动
+    import multiprocessing
+    multiprocessing.freeze_support()
+    startup_trace.install()
     main()
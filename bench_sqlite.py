@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+import storage
+from utils import gen_id
+
+# SQLite 性能档位基准：批量写入吞吐、query_transactions / aggregate_sums 延迟
+# 用法：python bench_sqlite.py --rows 200000 --profiles default balanced performance
+
+def _make_rows(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    base = datetime(2019, 1, 1)
+    cats = ["三餐", "交通", "娱乐", "医疗", "学习", "日用品", "工资", "外快"]
+    accs = ["现金", "支付宝", "微信", "浦发银行", "中信银行"]
+    rows = []
+    for i in range(n):
+        dt = base + timedelta(seconds=rnd.randint(0, 6 * 365 * 86400))
+        typ = "收入" if rnd.random() < 0.2 else "支出"
+        rows.append({
+            "id": gen_id(),
+            "time": dt.isoformat(),
+            "amount": round(rnd.uniform(1, 2000), 2),
+            "category": rnd.choice(cats),
+            "ttype": typ,
+            "account": rnd.choice(accs),
+            "to_account": None,
+            "from_account": None,
+            "note": f"商户{rnd.randint(1, 5000)} 订单{i}",
+            "record_time": datetime.now().isoformat(),
+            "record_source": "基准测试",
+        })
+    return rows
+
+def _timeit(fn, repeat: int):
+    best = None
+    total = 0.0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        total += dt
+        best = dt if best is None or dt < best else best
+    return best * 1000.0, total / repeat * 1000.0
+
+def run_profile(name: str, rows, workdir: str, batch: int, repeat: int):
+    # 每个档位使用独立账本，数据库随账本路径落在 bench_<档位>.db
+    storage.set_ledger_path(os.path.join(workdir, f"bench_{name}.json"))
+    db_path = storage.get_current_db_path()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    mgr = storage.get_connection_manager()
+    mgr.configure(storage.SQLITE_PROFILES[name])
+    t0 = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        storage.sync_batch_to_db(rows[i:i + batch])
+    ins = time.perf_counter() - t0
+    mgr.checkpoint(mode="TRUNCATE")
+    months = sorted({r["time"][:7] for r in rows})
+    month = months[len(months) // 2]
+    year = month[:4]
+    res = {"profile": name, "insert_rows_per_s": len(rows) / ins if ins > 0 else 0.0}
+    res["query_month"] = _timeit(lambda: storage.query_transactions({"month": month}), repeat)
+    res["query_year_sorted"] = _timeit(lambda: storage.query_transactions({"year": year, "order_col": "amount", "order_desc": True}, 200, 0), repeat)
+    res["query_term"] = _timeit(lambda: storage.query_transactions({"term": "商户42"}), repeat)
+    res["aggregate_month"] = _timeit(lambda: storage.aggregate_sums({"month": month}), repeat)
+    res["aggregate_all"] = _timeit(lambda: storage.aggregate_sums({}), repeat)
+    mgr.close()
+    try:
+        res["db_mb"] = os.path.getsize(db_path) / 1024.0 / 1024.0
+    except OSError:
+        res["db_mb"] = 0.0
+    return res
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="SQLite 性能档位基准测试")
+    ap.add_argument("--rows", type=int, default=100000)
+    ap.add_argument("--batch", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--profiles", nargs="*", default=list(storage.SQLITE_PROFILES.keys()))
+    args = ap.parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="ledger_bench_")
+    old_ledger = storage.get_current_ledger_path()
+    try:
+        rows = _make_rows(args.rows)
+        print(f"rows={args.rows} batch={args.batch} repeat={args.repeat} sqlite={storage.sqlite3.sqlite_version}")
+        keys = ["query_month", "query_year_sorted", "query_term", "aggregate_month", "aggregate_all"]
+        print("profile      insert/s   " + "  ".join(f"{k}(best/avg ms)" for k in keys) + "  db_mb")
+        for name in args.profiles:
+            if name not in storage.SQLITE_PROFILES:
+                print(f"跳过未知档位: {name}")
+                continue
+            r = run_profile(name, rows, workdir, args.batch, args.repeat)
+            cells = "  ".join(f"{r[k][0]:.1f}/{r[k][1]:.1f}" for k in keys)
+            print(f"{name:<12} {r['insert_rows_per_s']:>9.0f}  {cells}  {r['db_mb']:.1f}")
+    finally:
+        storage.get_connection_manager().configure(None)
+        storage.set_ledger_path(old_ledger)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
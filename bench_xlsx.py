@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import random
+import zipfile
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+import xlsx_reader
+
+# XLSX 读取基准：流式 iterparse 读取 与 旧版整份 DOM 读取 的耗时、峰值内存对比
+# 用法：python bench_xlsx.py --rows 200000
+# 每种读取方式在独立子进程中运行，峰值内存取 /proc/self/status 的 VmHWM（ru_maxrss 会沿用父进程的峰值）
+
+_HEADER = ["交易时间", "交易分类", "交易对方", "商品说明", "收/支", "金额", "收/付款方式", "交易状态", "备注"]
+
+def make_workbook(path: str, n: int, seed: int = 7):
+    # 仿支付宝导出：两行说明 + 表头 + n 行，文本走共享字符串、金额为数值单元格
+    rnd = random.Random(seed)
+    base = datetime(2019, 1, 1)
+    strings = {}
+    def sid(s):
+        i = strings.get(s)
+        if i is None:
+            i = strings[s] = len(strings)
+        return i
+    def col(i):
+        s = ""
+        i += 1
+        while i:
+            i, r = divmod(i - 1, 26)
+            s = chr(65 + r) + s
+        return s
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        with z.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as raw:
+            def w(text):
+                raw.write(text.encode("utf-8"))
+            w('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            def row(r, vals):
+                cells = []
+                for i, v in enumerate(vals):
+                    ref = f"{col(i)}{r}"
+                    if isinstance(v, float):
+                        cells.append(f'<c r="{ref}"><v>{v}</v></c>')
+                    else:
+                        cells.append(f'<c r="{ref}" t="s"><v>{sid(v)}</v></c>')
+                w(f'<row r="{r}">' + "".join(cells) + "</row>")
+            row(1, ["支付宝交易明细"])
+            row(2, ["导出时间：" + datetime.now().strftime("%Y-%m-%d %H:%M:%S")])
+            row(3, _HEADER)
+            for i in range(n):
+                dt = base + timedelta(seconds=rnd.randint(0, 6 * 365 * 86400))
+                row(4 + i, [
+                    dt.strftime("%Y-%m-%d %H:%M:%S"), rnd.choice(["餐饮美食", "交通出行", "日用百货", "转账红包"]),
+                    f"商户{rnd.randint(1, 5000)}", f"订单{i}", rnd.choice(["收入", "支出", "不计收支"]),
+                    round(rnd.uniform(1, 2000), 2), rnd.choice(["余额宝", "花呗", "招商银行储蓄卡"]), "交易成功", "",
+                ])
+            w("</sheetData></worksheet>")
+        ss = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+              f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="{len(strings)}" uniqueCount="{len(strings)}">']
+        ss.extend(f"<si><t>{escape(s)}</t></si>" for s in strings)
+        ss.append("</sst>")
+        z.writestr("xl/sharedStrings.xml", "".join(ss))
+        z.writestr("[Content_Types].xml", '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"><Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/><Default Extension="xml" ContentType="application/xml"/><Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/><Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/><Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/></Types>')
+        z.writestr("_rels/.rels", '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships"><Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+        z.writestr("xl/workbook.xml", '<?xml version="1.0" encoding="UTF-8"?><workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets><sheet name="账单" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        z.writestr("xl/_rels/workbook.xml.rels", '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships"><Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/><Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/></Relationships>')
+
+def dom_read_rows(path: str):
+    # 旧版读取方式（对照）：共享字符串与整张工作表各 ET.fromstring 成完整 DOM 后再组装行
+    with zipfile.ZipFile(path) as z:
+        try:
+            root = ET.fromstring(z.read("xl/sharedStrings.xml"))
+            shared = ["".join(t.text for t in si.iter() if t.tag.endswith("t") and t.text is not None) for si in root if si.tag.endswith("si")]
+        except KeyError:
+            shared = []
+        root = ET.fromstring(z.read("xl/worksheets/sheet1.xml"))
+    rows = []
+    for row in root.iter():
+        if not row.tag.endswith("row"):
+            continue
+        cells = {}
+        max_idx = -1
+        for c in row:
+            if not c.tag.endswith("c"):
+                continue
+            ref = c.attrib.get("r", "")
+            letters = "".join(ch for ch in ref if ch.isalpha())
+            idx = xlsx_reader._col_to_index(letters) if letters else (max_idx + 1)
+            v = next((ch.text for ch in c if ch.tag.endswith("v")), None)
+            if c.attrib.get("t") == "s" and v is not None:
+                v = shared[int(v)]
+            cells[idx] = v if v is not None else ""
+            max_idx = max(max_idx, idx)
+        if max_idx >= 0:
+            vals = [""] * (max_idx + 1)
+            for i, v in cells.items():
+                vals[i] = v
+            rows.append(vals)
+    return rows
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def _run_one(mode: str, path: str):
+    t0 = time.perf_counter()
+    if mode == "dom":
+        n = len(dom_read_rows(path))
+    else:
+        n = sum(1 for _ in xlsx_reader.iter_xlsx_rows(path))
+    ms = (time.perf_counter() - t0) * 1000.0
+    rss = _peak_rss_mb()
+    print(f"{mode} {n} {ms:.0f} {rss:.0f}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="XLSX 读取基准测试")
+    ap.add_argument("--rows", type=int, default=200000)
+    ap.add_argument("--file", help="使用已有工作簿（默认生成临时工作簿）")
+    ap.add_argument("--check", action="store_true", help="测完后逐行比对两种方式的读取结果")
+    ap.add_argument("--run", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    if args.run:
+        _run_one(args.run, args.file)
+        return
+    workdir = tempfile.mkdtemp(prefix="bench_xlsx_")
+    path = args.file
+    if not path:
+        path = os.path.join(workdir, f"bench_{args.rows}.xlsx")
+        t0 = time.perf_counter()
+        make_workbook(path, args.rows)
+        print(f"生成 {args.rows} 行工作簿 {os.path.getsize(path) / 1048576:.1f} MB，用时 {time.perf_counter() - t0:.1f} s")
+    print(f"{'方式':<8}{'行数':>10}{'耗时(ms)':>12}{'峰值内存(MB)':>16}")
+    for mode in ("dom", "stream"):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", mode, "--file", path],
+                             capture_output=True, text=True, check=True).stdout.split()
+        print(f"{out[0]:<8}{out[1]:>10}{out[2]:>12}{out[3]:>16}")
+    if args.check:
+        same = all(a == b for a, b in zip(dom_read_rows(path), xlsx_reader.iter_xlsx_rows(path)))
+        print("两种方式读取结果" + ("一致" if same else "不一致"))
+    if not args.file:
+        try:
+            os.remove(path)
+            os.rmdir(workdir)
+        except OSError:
+            pass
+
+if __name__ == "__main__":
+    main()
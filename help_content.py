@@ -440,7 +440,9 @@ def get_help_content():
                 {
                     "title": "备份文件",
                     "content": (
-                        "data/backups/ledger_[userId]_YYYYMMDD_HHMMSS.json。"
+                        "data/backups/manifests/ledger_[userId]_YYYYMMDD_HHMMSS.json 为每次备份的清单，"
+                        "data/backups/objects/ 为压缩后的数据分块（按内容去重，多份备份共用未改动的月份）。"
+                        "请在“软件设置 - 备份管理”中查看、还原备份或调整保留策略。"
                     ),
                     "children": []
                 },
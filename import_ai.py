@@ -69,11 +69,14 @@ def ensure_failure_dir(base_dir):
         os.makedirs(failures_dir)
     return failures_dir
 
-def process_images(paths, account_names, import_dt: datetime, existing_transactions):
+def process_images(paths, account_names, import_dt: datetime, existing_transactions, progress=None):
+    # progress(已处理张数, 总张数) 每张图片识别前调用一次，可在其中抛出异常中止
     results = []
     failures = []
     dedupe = set()
-    for p in paths:
+    for i, p in enumerate(paths):
+        if progress is not None:
+            progress(i, len(paths))
         try:
             tokens = extract_text_from_image(p)
             amount = _parse_money_from_tokens(tokens)
@@ -1,10 +1,15 @@
+import io
+import os
 import csv
 import re
-from typing import List, Dict, Union
+import time
+import codecs
+import itertools
+from typing import List, Dict, Union, Iterator, Iterable, Optional
 from datetime import datetime, timedelta
 from models import TRANSACTION_TYPES
 from utils import parse_datetime, gen_id
-from xlsx_reader import read_xlsx, read_xlsx_rows
+from xlsx_reader import read_xlsx, read_xlsx_rows, iter_xlsx, HEADER_SCAN_ROWS
 
 STANDARD_TEMPLATE_COLUMNS = ["交易时间", "金额", "消费类别", "所属类别", "账户", "转入账户", "转出账户", "备注"]
 
@@ -22,99 +27,254 @@ def _parse_money(val) -> float:
     v = float(s)
     return abs(v)
 
+# 流式读取：按块解码、逐行交给 csv.reader，不把整份文件读成一个字符串
+# 表头查找行数上限 HEADER_SCAN_ROWS 与 XLSX 读取共用
+CSV_BLOCK_BYTES = 1 << 20
+# 编码识别只看文件开头：先读 ENCODING_PROBE_BYTES，全是 ASCII 时继续往后读，最多 ENCODING_PROBE_MAX
+ENCODING_PROBE_BYTES = 64 * 1024
+ENCODING_PROBE_MAX = 1 << 20
+# 开头识别错时流式解码到后文才出错（开头全是 ASCII 而后文是 GBK，或后文出现 GBK 之外、GB18030 才有的字），
+# 按此顺序换编码重新打开，跳过已交出的行继续；已交出的行含非 ASCII 字符时不能从 UTF-8 换到 GBK，照常报错
+ENCODING_FALLBACK = {"utf-8": "gbk", "gbk": "gb18030"}
+# 多文件导入的解析进程数，None 时按 CPU 核数
+IMPORT_WORKERS = None
+
+class _ByteCounter(io.RawIOBase):
+    # 记录已读字节数，供进度显示；prefix 为识别编码时已读出的开头，先于文件其余部分交出，整份文件只读一遍
+    def __init__(self, f, stats: Optional[Dict], prefix: bytes = None):
+        self._f = f
+        self._stats = stats
+        self._prefix = memoryview(prefix) if prefix else None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self._prefix is None
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if self._prefix is not None:
+            raise io.UnsupportedOperation("seek")
+        return self._f.seek(pos, whence)
+
+    def tell(self):
+        return self._f.tell()
+
+    def readinto(self, b):
+        if self._prefix is not None:
+            n = min(len(b), len(self._prefix))
+            b[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:] if n < len(self._prefix) else None
+        else:
+            n = self._f.readinto(b)
+        if self._stats is not None and n:
+            self._stats["bytes_read"] = self._stats.get("bytes_read", 0) + n
+        return n
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+def detect_encoding(head: bytes, final: bool = False) -> str:
+    # BOM 优先；否则对开头一段依次试解码 UTF-8、GBK、GB18030（末尾被截断的多字节字符不算错，除非已到文件尾）
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16"
+    for enc in ("utf-8", "gbk"):
+        try:
+            codecs.getincrementaldecoder(enc)().decode(head, final=final)
+            return enc
+        except UnicodeDecodeError:
+            pass
+    return "gb18030"
+
+def _open_text(path: str, stats: Optional[Dict] = None, encoding: str = None):
+    # 读一次原始字节：开头用于识别编码后原样接回流中，再逐块增量解码；stats 记录 encoding 与 detect_ms
+    # 指定 encoding 时（换编码重新打开）不再识别，也不改 stats 中的编码与总字节数
+    if encoding is not None:
+        return io.TextIOWrapper(io.BufferedReader(_ByteCounter(open(path, "rb"), stats), CSV_BLOCK_BYTES), encoding=encoding, errors="strict")
+    t0 = time.perf_counter()
+    f = open(path, "rb")
+    try:
+        head = f.read(ENCODING_PROBE_BYTES)
+        eof = len(head) < ENCODING_PROBE_BYTES
+        while not eof and head.isascii() and len(head) < ENCODING_PROBE_MAX:
+            more = f.read(ENCODING_PROBE_BYTES)
+            eof = len(more) < ENCODING_PROBE_BYTES
+            head += more
+        enc = detect_encoding(head, final=eof)
+    except Exception:
+        f.close()
+        raise
+    if stats is not None:
+        stats["encoding"] = enc
+        seen = stats.setdefault("encodings", [])
+        if enc not in seen:
+            seen.append(enc)
+        stats["detect_ms"] = stats.get("detect_ms", 0.0) + (time.perf_counter() - t0) * 1000.0
+        stats["bytes_total"] = stats.get("bytes_total", 0) + os.path.getsize(path)
+    raw = io.BufferedReader(_ByteCounter(f, stats, head), CSV_BLOCK_BYTES)
+    return io.TextIOWrapper(raw, encoding=enc, errors="strict")
+
+def _open_csv(path: str, stats: Optional[Dict] = None):
+    return _open_text(path, stats)
+
+def _csv_reader_rows(path: str, stats: Optional[Dict] = None) -> Iterator[List[str]]:
+    # csv.reader 逐行产出；解码出错时按 ENCODING_FALLBACK 换编码重读，已交出的行原样跳过，进度从头重新计
+    base = stats.get("bytes_read", 0) if stats is not None else 0
+    encodings = list(stats.get("encodings", [])) if stats is not None else []
+    enc = None
+    done = 0
+    ascii_only = True
+    while True:
+        f = _open_csv(path, stats) if enc is None else _open_text(path, stats, enc)
+        enc = f.encoding
+        try:
+            with f:
+                reader = csv.reader(f)
+                for _ in itertools.islice(reader, done):
+                    pass
+                for r in reader:
+                    if ascii_only and not all(v.isascii() for v in r):
+                        ascii_only = False
+                    done += 1
+                    yield r
+            return
+        except UnicodeDecodeError:
+            nxt = ENCODING_FALLBACK.get(enc)
+            if nxt is None or (enc == "utf-8" and not ascii_only):
+                raise
+            enc = nxt
+            if stats is not None:
+                stats["bytes_read"] = base
+                stats["encoding"] = enc
+                stats["encodings"] = encodings + ([enc] if enc not in encodings else [])
+
+def _read_text(path: str) -> str:
+    # 整份读入的文本（TXT）：解码出错时按 ENCODING_FALLBACK 换编码重读
+    f = _open_text(path)
+    while True:
+        enc = f.encoding
+        try:
+            with f:
+                return f.read()
+        except UnicodeDecodeError:
+            if enc not in ENCODING_FALLBACK:
+                raise
+            f = _open_text(path, encoding=ENCODING_FALLBACK[enc])
+
+def _is_header_row(r: List[str]) -> bool:
+    joined = ",".join(str(x).strip() for x in r)
+    has_time = ("交易时间" in joined) or ("交易创建时间" in joined) or ("格式化时间" in joined) or ("Formatted Time" in joined)
+    has_amt = ("金额" in joined) or ("金额(元)" in joined) or ("金额（元）" in joined) or ("交易金额" in joined) or ("Transaction Amount" in joined)
+    return has_time and has_amt
+
+def iter_csv(path: str, stats: Optional[Dict] = None) -> Iterator[Dict]:
+    # 逐行产出 {表头名: 值, 列i: 值}；表头前的说明行先缓存在 HEADER_SCAN_ROWS 行以内
+    reader = _csv_reader_rows(path, stats)
+    try:
+        head = []
+        header_idx = None
+        for r in reader:
+            head.append(r)
+            if _is_header_row(r):
+                header_idx = len(head) - 1
+                break
+            if len(head) >= HEADER_SCAN_ROWS:
+                break
+        if not head:
+            return
+        if header_idx is None:
+            header_idx = 0
+        header = [str(h).strip() for h in head[header_idx]]
+        keys = [((h if h else f"列{i}"), f"列{i}") for i, h in enumerate(header)]
+        def rows():
+            yield from head[header_idx + 1:]
+            yield from reader
+        for r in rows():
+            d = {}
+            for (key, col), v in zip(keys, r):
+                d[key] = v
+                d[col] = v
+            if any(str(v).strip() != '' for v in d.values()):
+                yield d
+    finally:
+        reader.close()
+
 def read_csv(path: str):
-    content = None
+    return list(iter_csv(path))
+
+def iter_csv_rows(path: str, stats: Optional[Dict] = None) -> Iterator[List[str]]:
+    reader = _csv_reader_rows(path, stats)
     try:
-        with open(path, "r", encoding="utf-8-sig") as f:
-            content = f.read()
-    except UnicodeDecodeError:
-        with open(path, "r", encoding="gbk", errors="strict") as f:
-            content = f.read()
-    import io
-    buf = io.StringIO(content)
-    rows_raw = list(csv.reader(buf))
-    if not rows_raw:
-        return []
-    header_idx = 0
-    for i, r in enumerate(rows_raw):
-        cells = [str(x).strip() for x in r]
-        joined = ",".join(cells)
-        has_time = ("交易时间" in joined) or ("交易创建时间" in joined) or ("格式化时间" in joined) or ("Formatted Time" in joined)
-        has_amt = ("金额" in joined) or ("金额(元)" in joined) or ("金额（元）" in joined) or ("交易金额" in joined) or ("Transaction Amount" in joined)
-        if has_time and has_amt:
-            header_idx = i
-            break
-    header = [str(h).strip() for h in rows_raw[header_idx]]
-    out = []
-    for r in rows_raw[header_idx+1:]:
-        d = {}
-        for i in range(min(len(header), len(r))):
-            key = header[i] if header[i] else f"列{i}"
-            d[key] = r[i]
-            d[f"列{i}"] = r[i]
-        if any(str(v).strip() != '' for v in d.values()):
-            out.append(d)
-    return out
+        for r in reader:
+            if any(str(v).strip() != '' for v in r):
+                yield r
+    finally:
+        reader.close()
 
 def read_csv_rows(path: str) -> List[List[str]]:
-    content = None
-    try:
-        with open(path, "r", encoding="utf-8-sig") as f:
-            content = f.read()
-    except UnicodeDecodeError:
-        with open(path, "r", encoding="gbk", errors="strict") as f:
-            content = f.read()
-    import io
-    buf = io.StringIO(content)
-    rows_raw = list(csv.reader(buf))
-    out = []
-    for r in rows_raw:
-        if any(str(v).strip() != '' for v in r):
-            out.append(r)
-    return out
+    return list(iter_csv_rows(path))
 
-def import_standard_rows(rows: List[Dict], account_names: List[str]) -> List[Dict]:
+class _RowError(ValueError):
+    # 单行解析失败：汇总后按“第N行 原因：值”提示
+    def __init__(self, reason: str, value=""):
+        super().__init__(reason)
+        self.reason = reason
+        self.value = value
+
+def _failure_message(failures, count: int = None) -> str:
+    msg_lines = [f"导入失败：存在 {count if count is not None else len(failures)} 条错误"]
+    for i, (row_idx, reason, val) in enumerate(failures[:3], start=1):
+        msg_lines.append(f"{i}) 第{row_idx}行 {reason}：\"{str(val)[:60]}\"")
+    return "\n".join(msg_lines)
+
+def _check_standard_header(r: Dict):
     required_check = [c for c in STANDARD_TEMPLATE_COLUMNS if c != "交易时间"]
+    for k in required_check:
+        if k not in r:
+            missing = [x for x in required_check if x not in r]
+            raise ValueError(f"文件不是标准模板或列名不完整。\n缺失列：{','.join(missing)}\n系统要求包含：{','.join(STANDARD_TEMPLATE_COLUMNS)}")
+    if ("交易时间" not in r) and ("格式化时间" not in r):
+        raise ValueError(f"文件不是标准模板或缺少时间列。\n请包含 '交易时间'。\n系统要求包含：{','.join(STANDARD_TEMPLATE_COLUMNS)}")
+
+def import_standard_rows(rows: List[Dict], account_names: List[str]) -> List[Dict]:
     for r in rows[:1]:
-        for k in required_check:
-            if k not in r:
-                missing = [x for x in required_check if x not in r]
-                raise ValueError(f"文件不是标准模板或列名不完整。\n缺失列：{','.join(missing)}\n系统要求包含：{','.join(STANDARD_TEMPLATE_COLUMNS)}")
-        if ("交易时间" not in r) and ("格式化时间" not in r):
-            raise ValueError(f"文件不是标准模板或缺少时间列。\n请包含 '交易时间'。\n系统要求包含：{','.join(STANDARD_TEMPLATE_COLUMNS)}")
-    out = []
-    for r in rows:
-        ttype = r.get("所属类别", "").strip()
-        acc = r.get("账户", "").strip()
-        if acc and acc not in account_names:
-            raise ValueError("账户不存在")
-        to_acc = r.get("转入账户", "").strip() or None
-        from_acc = r.get("转出账户", "").strip() or None
-        if ttype == "还款" and not (to_acc or acc):
-            raise ValueError("还款需要目标账户")
-        amt = _parse_money(r.get("金额", "0"))
-        tstr = str(r.get("格式化时间", r.get("交易时间", ""))).strip()
-        dt = None
-        try:
-            if tstr and all(ch.isdigit() or ch == '.' for ch in tstr):
-                val = float(tstr)
-                dt = datetime(1899, 12, 30) + timedelta(days=val)
-            else:
-                dt = parse_datetime(tstr)
-        except Exception:
+        _check_standard_header(r)
+    return [_standard_row(r, account_names) for r in rows]
+
+def _standard_row(r: Dict, account_names: List[str]) -> Dict:
+    ttype = r.get("所属类别", "").strip()
+    acc = r.get("账户", "").strip()
+    if acc and acc not in account_names:
+        raise ValueError("账户不存在")
+    to_acc = r.get("转入账户", "").strip() or None
+    from_acc = r.get("转出账户", "").strip() or None
+    if ttype == "还款" and not (to_acc or acc):
+        raise ValueError("还款需要目标账户")
+    amt = _parse_money(r.get("金额", "0"))
+    tstr = str(r.get("格式化时间", r.get("交易时间", ""))).strip()
+    dt = None
+    try:
+        if tstr and all(ch.isdigit() or ch == '.' for ch in tstr):
+            val = float(tstr)
+            dt = datetime(1899, 12, 30) + timedelta(days=val)
+        else:
             dt = parse_datetime(tstr)
-        out.append({
-            "id": gen_id(),
-            "time": dt.isoformat(),
-            "amount": amt,
-            "category": r.get("消费类别", "").strip(),
-            "ttype": ttype,
-            "account": acc,
-            "to_account": to_acc,
-            "from_account": from_acc,
-            "note": r.get("备注", "").strip(),
-        })
-    return out
+    except Exception:
+        dt = parse_datetime(tstr)
+    return {
+        "id": gen_id(),
+        "time": dt.isoformat(),
+        "amount": amt,
+        "category": r.get("消费类别", "").strip(),
+        "ttype": ttype,
+        "account": acc,
+        "to_account": to_acc,
+        "from_account": from_acc,
+        "note": r.get("备注", "").strip(),
+    }
 
 def import_standard_csv(path: str, account_names: List[str]) -> List[Dict]:
     rows = read_csv(path)
@@ -146,304 +306,450 @@ def detect_platform(rows: List[Dict]) -> str:
         return "wechat"
     return "unknown"
 
+def _wechat_row(r: Dict, account_names: List[str]) -> Dict:
+    required_any = ["交易时间", "金额(元)"]
+    if not all(k in r for k in required_any):
+        raise _RowError("缺少必填列", ",".join([k for k in required_any if k not in r]))
+    tstr = str(r.get("交易时间", "")).strip()
+    if not tstr:
+        raise _RowError("交易时间为空")
+    try:
+        dt = parse_datetime(tstr)
+    except Exception:
+        raise _RowError("交易时间解析失败", tstr)
+    io = str(r.get("收/支", "")).strip()
+    ttype = "收入" if io == "收入" else "支出"
+    try:
+        amt = _parse_money(r.get("金额(元)", "0"))
+    except Exception:
+        raise _RowError("金额不可解析", str(r.get("金额(元)", "")))
+    category = str(r.get("交易类型", "")).strip()
+    prod = str(r.get("商品", "")).strip()
+    partner = str(r.get("交易对方", "")).strip()
+    note_raw = str(r.get("备注", "")).strip()
+    parts = [x for x in [category, partner, prod, note_raw] if x]
+    note = " | ".join(parts)
+    pay = str(r.get("支付方式", "")).strip()
+    account = pay if pay in account_names else ""
+    return {
+        "id": gen_id(),
+        "time": dt.isoformat(),
+        "amount": amt,
+        "category": category,
+        "ttype": ttype,
+        "account": account,
+        "to_account": None,
+        "from_account": None,
+        "note": note,
+        "platform": "wechat",
+        "parse_status": "ok",
+    }
+
 def map_wechat(rows: List[Dict], account_names: List[str]) -> List[Dict]:
     out = []
     failures = []
-    required_any = ["交易时间", "金额(元)"]
     for idx, r in enumerate(rows, start=1):
-        if not all(k in r for k in required_any):
-            failures.append((idx, "缺少必填列", ",".join([k for k in required_any if k not in r])))
-            continue
-        tstr = str(r.get("交易时间", "")).strip()
-        if not tstr:
-            failures.append((idx, "交易时间为空", ""))
-            continue
         try:
-            dt = parse_datetime(tstr)
-        except Exception:
-            failures.append((idx, "交易时间解析失败", tstr))
-            continue
-        io = str(r.get("收/支", "")).strip()
-        ttype = "收入" if io == "收入" else "支出"
-        try:
-            amt = _parse_money(r.get("金额(元)", "0"))
-        except Exception:
-            failures.append((idx, "金额不可解析", str(r.get("金额(元)", ""))))
-            continue
-        category = str(r.get("交易类型", "")).strip()
-        prod = str(r.get("商品", "")).strip()
-        partner = str(r.get("交易对方", "")).strip()
-        note_raw = str(r.get("备注", "")).strip()
-        parts = [x for x in [category, partner, prod, note_raw] if x]
-        note = " | ".join(parts)
-        pay = str(r.get("支付方式", "")).strip()
-        account = pay if pay in account_names else ""
-        out.append({
-            "id": gen_id(),
-            "time": dt.isoformat(),
-            "amount": amt,
-            "category": category,
-            "ttype": ttype,
-            "account": account,
-            "to_account": None,
-            "from_account": None,
-            "note": note,
-            "platform": "wechat",
-            "parse_status": "ok",
-        })
+            out.append(_wechat_row(r, account_names))
+        except _RowError as e:
+            failures.append((idx, e.reason, e.value))
     if failures:
-        msg_lines = [f"导入失败：存在 {len(failures)} 条错误"]
-        for i, (row_idx, reason, val) in enumerate(failures[:3], start=1):
-            msg_lines.append(f"{i}) 第{row_idx}行 {reason}：\"{str(val)[:60]}\"")
-        raise ValueError("\n".join(msg_lines))
+        raise ValueError(_failure_message(failures))
     if not out:
         raise ValueError("未识别到有效微信账单记录，请检查是否为官方导出模板")
     return out
 
+def _alipay_row(r: Dict, account_names: List[str]) -> Optional[Dict]:
+    # “不计收支”返回 None
+    # 时间与金额的多列名兼容
+    tstr = str(r.get("交易时间", r.get("交易创建时间", ""))).strip()
+    if not tstr:
+        raise _RowError("交易时间为空")
+    dt = parse_datetime(tstr)
+    io = str(r.get("收/支", "")).strip()
+    if io == "不计收支":
+        return None
+    ttype = "收入" if io == "收入" else "支出"
+    amt_raw = r.get("金额(元)", r.get("金额", r.get("金额（元）", "0")))
+    try:
+        amt = _parse_money(amt_raw)
+    except Exception:
+        raise _RowError("金额不可解析", str(amt_raw))
+    category = str(r.get("交易分类", "")).strip()
+    prod = str(r.get("商品说明", "")).strip() or str(r.get("商品名称", "")).strip()
+    partner = str(r.get("交易对方", "")).strip()
+    note_raw = str(r.get("备注", "")).strip()
+    parts = [x for x in [partner, prod, note_raw] if x]
+    note = " | ".join(parts)
+    pay = str(r.get("收/付款方式", r.get("支付方式", "")).strip())
+    account = pay if pay in account_names else ""
+    return {
+        "id": gen_id(),
+        "time": dt.isoformat(),
+        "amount": amt,
+        "category": category,
+        "ttype": ttype,
+        "account": account,
+        "to_account": None,
+        "from_account": None,
+        "note": note,
+        "platform": "alipay",
+        "parse_status": "ok",
+    }
+
 def map_alipay(rows: List[Dict], account_names: List[str]):
     out = []
     failures = []
     skipped_no_io = 0
     for idx, r in enumerate(rows, start=1):
-        # 时间与金额的多列名兼容
-        tstr = str(r.get("交易时间", r.get("交易创建时间", ""))).strip()
-        if not tstr:
-            failures.append((idx, "交易时间为空", ""))
-            continue
-        dt = parse_datetime(tstr)
-        io = str(r.get("收/支", "")).strip()
-        if io == "不计收支":
-            skipped_no_io += 1
-            continue
-        ttype = "收入" if io == "收入" else "支出"
-        amt_raw = r.get("金额(元)", r.get("金额", r.get("金额（元）", "0")))
         try:
-            amt = _parse_money(amt_raw)
-        except Exception:
-            failures.append((idx, "金额不可解析", str(amt_raw)))
+            t = _alipay_row(r, account_names)
+        except _RowError as e:
+            failures.append((idx, e.reason, e.value))
             continue
-        category = str(r.get("交易分类", "")).strip()
-        prod = str(r.get("商品说明", "")).strip() or str(r.get("商品名称", "")).strip()
-        partner = str(r.get("交易对方", "")).strip()
-        note_raw = str(r.get("备注", "")).strip()
-        parts = [x for x in [partner, prod, note_raw] if x]
-        note = " | ".join(parts)
-        pay = str(r.get("收/付款方式", r.get("支付方式", "")).strip())
-        account = pay if pay in account_names else ""
-        out.append({
-            "id": gen_id(),
-            "time": dt.isoformat(),
-            "amount": amt,
-            "category": category,
-            "ttype": ttype,
-            "account": account,
-            "to_account": None,
-            "from_account": None,
-            "note": note,
-            "platform": "alipay",
-            "parse_status": "ok",
-        })
+        if t is None:
+            skipped_no_io += 1
+        else:
+            out.append(t)
     if failures:
-        msg_lines = [f"导入失败：存在 {len(failures)} 条错误"]
-        for i, (row_idx, reason, val) in enumerate(failures[:3], start=1):
-            msg_lines.append(f"{i}) 第{row_idx}行 {reason}：\"{str(val)[:60]}\"")
-        raise ValueError("\n".join(msg_lines))
+        raise ValueError(_failure_message(failures))
     if not out and skipped_no_io == 0:
         raise ValueError("未识别到有效支付宝账单记录，请检查是否为官方导出模板或保存为CSV/XLSX再试")
     return out, {"skipped_no_io": skipped_no_io}
 
-def map_spdb(rows: List[Union[Dict, List[str]]], account_names: List[str]) -> List[Dict]:
-    e_idx, h_idx, j_idx = 4, 7, 9
-    failures = []
-    parsed = []
-    def extract_time(s: str):
-        s1 = ' '.join(str(s or '').strip().split())
-        m = re.search(r"(\d{4}/\d{1,2}/\d{1,2}\s+\d{1,2}:\d{2}(?::\d{2})?)", s1)
-        if m:
-            return {"kind": "text", "value": m.group(1)}
-        mcn = re.search(r"(\d{4}年\d{1,2}月\d{1,2}日\s+\d{1,2}:\d{2}:\d{2})", s1)
-        if mcn:
-            return {"kind": "cn", "value": mcn.group(1)}
-        if re.fullmatch(r"\d+(?:\.\d+)?", s1):
-            return {"kind": "excel", "value": float(s1)}
-        return {"kind": "none", "value": s1}
-    def parse_time_str(s: str):
-        from datetime import datetime
+def _spdb_time(s: str):
+    s1 = ' '.join(str(s or '').strip().split())
+    m = re.search(r"(\d{4}/\d{1,2}/\d{1,2}\s+\d{1,2}:\d{2}(?::\d{2})?)", s1)
+    if m:
+        return {"kind": "text", "value": m.group(1)}
+    mcn = re.search(r"(\d{4}年\d{1,2}月\d{1,2}日\s+\d{1,2}:\d{2}:\d{2})", s1)
+    if mcn:
+        return {"kind": "cn", "value": mcn.group(1)}
+    if re.fullmatch(r"\d+(?:\.\d+)?", s1):
+        return {"kind": "excel", "value": float(s1)}
+    return {"kind": "none", "value": s1}
+
+def _spdb_parse_time(s: str):
+    try:
+        return datetime.strptime(s, "%Y/%m/%d %H:%M:%S")
+    except Exception:
         try:
-            return datetime.strptime(s, "%Y/%m/%d %H:%M:%S")
+            return datetime.strptime(s, "%Y/%m/%d %H:%M")
         except Exception:
-            try:
-                return datetime.strptime(s, "%Y/%m/%d %H:%M")
-            except Exception:
-                return None
-    for idx, r in enumerate(rows, start=1):
-        t_raw = ''
-        if isinstance(r, list):
-            t_raw = str(r[2] if len(r) > 2 else '')
-        else:
-            t_raw = str((r.get("列2") or r.get("C") or ''))
-        ts = extract_time(t_raw)
-        if ts["kind"] == "none":
-            failures.append((idx, "时间缺失或不匹配", t_raw))
-            continue
-        if ts["kind"] == "excel":
-            try:
-                from datetime import datetime, timedelta
-                dt = datetime(1899, 12, 30) + timedelta(days=ts["value"])  # Excel序列日期
-            except Exception:
-                failures.append((idx, "Excel序列日期无法解析", ts["value"]))
-                continue
-        else:
-            val = ts["value"]
-            if ts["kind"] == "cn":
-                # 转换为斜杠格式
-                val = val.replace('年','/').replace('月','/').replace('日',' ')
-            dt = parse_time_str(val)
-            if dt is None:
-                failures.append((idx, "时间格式错误", ts["value"]))
-                continue
-        if isinstance(r, list):
-            s_amt = str(r[5] if len(r) > 5 else '0').strip()
-            e = str(r[e_idx] if len(r) > e_idx else '').strip()
-            h = str(r[h_idx] if len(r) > h_idx else '').strip()
-            j = str(r[j_idx] if len(r) > j_idx else '').strip()
-        else:
-            a_raw = r.get("列5") or r.get("F") or r.get("金额") or r.get("金额(元)") or r.get("交易金额") or r.get("Transaction Amount") or "0"
-            s_amt = str(a_raw).strip()
-            e = str(r.get("列4", r.get("E", "")).strip())
-            h = str(r.get("列7", r.get("H", "")).strip())
-            j = str(r.get("列9", r.get("J", "")).strip())
+            return None
+
+def _spdb_row(r: Union[Dict, List[str]], account_names: List[str]) -> Dict:
+    e_idx, h_idx, j_idx = 4, 7, 9
+    t_raw = ''
+    if isinstance(r, list):
+        t_raw = str(r[2] if len(r) > 2 else '')
+    else:
+        t_raw = str((r.get("列2") or r.get("C") or ''))
+    ts = _spdb_time(t_raw)
+    if ts["kind"] == "none":
+        raise _RowError("时间缺失或不匹配", t_raw)
+    if ts["kind"] == "excel":
         try:
-            neg = (('-' in s_amt) or (float(s_amt) < 0))
+            dt = datetime(1899, 12, 30) + timedelta(days=ts["value"])  # Excel序列日期
         except Exception:
-            neg = ('-' in s_amt)
+            raise _RowError("Excel序列日期无法解析", ts["value"])
+    else:
+        val = ts["value"]
+        if ts["kind"] == "cn":
+            # 转换为斜杠格式
+            val = val.replace('年','/').replace('月','/').replace('日',' ')
+        dt = _spdb_parse_time(val)
+        if dt is None:
+            raise _RowError("时间格式错误", ts["value"])
+    if isinstance(r, list):
+        s_amt = str(r[5] if len(r) > 5 else '0').strip()
+        e = str(r[e_idx] if len(r) > e_idx else '').strip()
+        h = str(r[h_idx] if len(r) > h_idx else '').strip()
+        j = str(r[j_idx] if len(r) > j_idx else '').strip()
+    else:
+        a_raw = r.get("列5") or r.get("F") or r.get("金额") or r.get("金额(元)") or r.get("交易金额") or r.get("Transaction Amount") or "0"
+        s_amt = str(a_raw).strip()
+        e = str(r.get("列4", r.get("E", "")).strip())
+        h = str(r.get("列7", r.get("H", "")).strip())
+        j = str(r.get("列9", r.get("J", "")).strip())
+    try:
+        neg = (('-' in s_amt) or (float(s_amt) < 0))
+    except Exception:
+        neg = ('-' in s_amt)
+    try:
+        amt = _parse_money(s_amt)
+    except Exception:
+        raise _RowError("金额不可解析", s_amt)
+    ttype = "支出" if neg else "收入"
+    parts = [x for x in [e, h, j] if x]
+    note = " | ".join(parts)
+    account = "浦发银行" if "浦发银行" in account_names else ""
+    return {
+        "id": gen_id(),
+        "time": dt.isoformat(),
+        "amount": amt,
+        "category": "",
+        "ttype": ttype,
+        "account": account,
+        "to_account": None,
+        "from_account": None,
+        "note": note,
+        "platform": "spdb",
+        "parse_status": "ok",
+    }
+
+def map_spdb(rows: List[Union[Dict, List[str]]], account_names: List[str]) -> List[Dict]:
+    failures = []
+    parsed = []
+    for idx, r in enumerate(rows, start=1):
         try:
-            amt = _parse_money(s_amt)
-        except Exception:
-            failures.append((idx, "金额不可解析", s_amt))
-            continue
-        ttype = "支出" if neg else "收入"
-        parts = [x for x in [e, h, j] if x]
-        note = " | ".join(parts)
-        account = "浦发银行" if "浦发银行" in account_names else ""
-        parsed.append({
-            "id": gen_id(),
-            "time": dt.isoformat(),
-            "amount": amt,
-            "category": "",
-            "ttype": ttype,
-            "account": account,
-            "to_account": None,
-            "from_account": None,
-            "note": note,
-            "platform": "spdb",
-            "parse_status": "ok",
-        })
+            parsed.append(_spdb_row(r, account_names))
+        except _RowError as e:
+            failures.append((idx, e.reason, e.value))
     if failures:
-        msg_lines = [f"导入失败：存在 {len(failures)} 条错误"]
-        for i, (row_idx, reason, val) in enumerate(failures[:3], start=1):
-            msg_lines.append(f"{i}) 第{row_idx}行 {reason}：\"{str(val)[:60]}\"")
-        raise ValueError("\n".join(msg_lines))
+        raise ValueError(_failure_message(failures))
     return parsed
 
-def map_citic(rows: List[Dict], account_names: List[str]) -> List[Dict]:
-    def pick(d, subs):
-        for k in d.keys():
-            kl = str(k).lower()
-            for s in subs:
-                if s in kl or s in str(k):
-                    v = d.get(k)
-                    if v is not None and str(v).strip() != "":
-                        return v
+def _citic_pick(d, subs):
+    for k in d.keys():
+        kl = str(k).lower()
+        for s in subs:
+            if s in kl or s in str(k):
+                v = d.get(k)
+                if v is not None and str(v).strip() != "":
+                    return v
+    return None
+
+def _citic_norm_date(s):
+    ss = str(s or "").strip()
+    if ss.isdigit() and len(ss) == 8:
+        return f"{ss[0:4]}-{ss[4:6]}-{ss[6:8]}"
+    return ss
+
+def _citic_norm_time(s):
+    ss = str(s or "").strip()
+    if ss.isdigit() and len(ss) == 6:
+        return f"{ss[0:2]}:{ss[2:4]}:{ss[4:6]}"
+    if ss.isdigit() and len(ss) == 4:
+        return f"{ss[0:2]}:{ss[2:4]}:00"
+    return ss
+
+def _citic_num(s):
+    s0 = str(s if s is not None else "").strip()
+    s0 = s0.replace(",", "")
+    for sym in ["¥","￥","$","元"]:
+        s0 = s0.replace(sym, "")
+    s0 = s0.strip("'\"")
+    s0 = s0.replace('－','-').replace('—','-').replace('–','-')
+    if not s0:
+        return 0.0
+    try:
+        return float(s0)
+    except Exception:
+        return 0.0
+
+def _citic_row(r: Dict, account_names: List[str]) -> Optional[Dict]:
+    # 无日期或金额为零的行返回 None
+    pick = _citic_pick
+    date_val = r.get("交易日期") or pick(r, ["交易日期","date"]) or r.get("列2") or r.get("C")
+    time_val = r.get("交易时间") or pick(r, ["交易时间","time"]) or None
+    tstr = _citic_norm_date(date_val)
+    if not tstr:
         return None
+    if time_val:
+        tv = _citic_norm_time(time_val)
+        tstr = f"{tstr} {tv}" if tv else f"{tstr} 00:00:00"
+    else:
+        tstr = f"{tstr} 00:00:00"
+    dt = None
+    try:
+        dt = parse_datetime(tstr)
+    except Exception:
+        dt = parse_datetime(tstr)
+    inc_raw = r.get("收入金额") or pick(r, ["收入金额","income amount"]) or None
+    exp_raw = r.get("支出金额") or pick(r, ["支出金额","expense amount"]) or None
+    if inc_raw is None and exp_raw is None:
+        inc_raw = r.get("列5") or r.get("F")
+    inc_val = _citic_num(inc_raw)
+    exp_val = _citic_num(exp_raw)
+    amt = 0.0
+    ttype = "收入"
+    if inc_val > 0 and exp_val <= 0:
+        amt = inc_val
+        ttype = "收入"
+    elif exp_val > 0 and inc_val <= 0:
+        amt = exp_val
+        ttype = "支出"
+    elif inc_val > 0 and exp_val > 0:
+        amt = inc_val if inc_val >= exp_val else exp_val
+        ttype = "收入" if inc_val >= exp_val else "支出"
+    else:
+        v = _citic_num(inc_raw if inc_raw is not None else exp_raw)
+        if v == 0.0:
+            return None
+        ttype = "收入" if v >= 0 else "支出"
+        amt = abs(v)
+    note_parts = []
+    s1 = r.get("交易摘要") or pick(r, ["交易摘要","summary"]) or ""
+    s2 = r.get("对方用户名") or pick(r, ["对方用户名","counter party","username"]) or ""
+    if str(s1).strip():
+        note_parts.append(str(s1).strip())
+    if str(s2).strip():
+        note_parts.append(str(s2).strip())
+    note = " | ".join(note_parts)
+    account = "中信银行" if "中信银行" in account_names else ""
+    return {
+        "id": gen_id(),
+        "time": dt.isoformat(),
+        "amount": abs(float(amt)),
+        "category": "",
+        "ttype": ttype,
+        "account": account,
+        "to_account": None,
+        "from_account": None,
+        "note": note,
+        "platform": "citic",
+        "parse_status": "ok",
+    }
+
+def map_citic(rows: List[Dict], account_names: List[str]) -> List[Dict]:
     out = []
     for r in rows:
-        date_val = r.get("交易日期") or pick(r, ["交易日期","date"]) or r.get("列2") or r.get("C")
-        time_val = r.get("交易时间") or pick(r, ["交易时间","time"]) or None
-        def _norm_date(s):
-            ss = str(s or "").strip()
-            if ss.isdigit() and len(ss) == 8:
-                return f"{ss[0:4]}-{ss[4:6]}-{ss[6:8]}"
-            return ss
-        def _norm_time(s):
-            ss = str(s or "").strip()
-            if ss.isdigit() and len(ss) == 6:
-                return f"{ss[0:2]}:{ss[2:4]}:{ss[4:6]}"
-            if ss.isdigit() and len(ss) == 4:
-                return f"{ss[0:2]}:{ss[2:4]}:00"
-            return ss
-        tstr = _norm_date(date_val)
-        if not tstr:
-            continue
-        if time_val:
-            tv = _norm_time(time_val)
-            tstr = f"{tstr} {tv}" if tv else f"{tstr} 00:00:00"
-        else:
-            tstr = f"{tstr} 00:00:00"
-        dt = None
+        t = _citic_row(r, account_names)
+        if t is not None:
+            out.append(t)
+    return out
+
+def _iter_source(path: str, stats: Optional[Dict] = None, sheet=None) -> Iterable[Dict]:
+    pl = path.lower()
+    if pl.endswith(".csv"):
+        return iter_csv(path, stats)
+    if pl.endswith(".xlsx"):
+        return _iter_xlsx_counted(path, stats, sheet)
+    raise ValueError("仅支持CSV或XLSX导入，请将账单另存为CSV或Excel后再导入")
+
+def _iter_xlsx_counted(path: str, stats: Optional[Dict], sheet=None) -> Iterator[Dict]:
+    # 经计数包装打开，已读字节数按压缩后的文件大小计；不加缓冲层，工作表与共享字符串交替读取时 seek 不会反复整块重读
+    if stats is not None:
+        stats["bytes_total"] = stats.get("bytes_total", 0) + os.path.getsize(path)
+    with _ByteCounter(open(path, "rb"), stats) as f:
+        yield from iter_xlsx(f, sheet)
+
+def iter_import(path: str, account_names: List[str], platform: str = None, stats: Optional[Dict] = None, sheet=None) -> Iterator[Dict]:
+    # 流式导入：读取 → 识别表头与平台 → 逐行映射，逐条产出账单，内存占用与文件大小无关
+    # platform 为 alipay/wechat/spdb/citic/standard，None 时按首行自动识别（同 try_import）；sheet 指定 XLSX 工作表（名称或序号）
+    # stats 累计 rows（读入行数）、skipped_no_io、failure_count、bytes_read/bytes_total；
+    # 出现错误行后不再产出，读完后按各平台原有提示抛出 ValueError
+    if stats is None:
+        stats = {}
+    stats.setdefault("rows", 0)
+    stats.setdefault("skipped_no_io", 0)
+    it = iter(_iter_source(path, stats, sheet))
+    first = next(it, None)
+    if platform is None:
+        platform = detect_platform([first] if first is not None else [])
+        if platform not in ("wechat", "alipay"):
+            platform = "standard"
+    stats["platform"] = platform
+    if first is None:
+        rows = iter(())
+    else:
+        if platform == "standard":
+            _check_standard_header(first)
+        def _chain():
+            yield first
+            yield from it
+        rows = _chain()
+    mapper = {"wechat": _wechat_row, "alipay": _alipay_row, "spdb": _spdb_row, "citic": _citic_row, "standard": _standard_row}[platform]
+    failures = []
+    failure_count = 0
+    produced = 0
+    for idx, r in enumerate(rows, start=1):
+        stats["rows"] += 1
         try:
-            dt = parse_datetime(tstr)
-        except Exception:
-            dt = parse_datetime(tstr)
-        inc_raw = r.get("收入金额") or pick(r, ["收入金额","income amount"]) or None
-        exp_raw = r.get("支出金额") or pick(r, ["支出金额","expense amount"]) or None
-        if inc_raw is None and exp_raw is None:
-            inc_raw = r.get("列5") or r.get("F")
-        def _num(s):
-            s0 = str(s if s is not None else "").strip()
-            s0 = s0.replace(",", "")
-            for sym in ["¥","￥","$","元"]:
-                s0 = s0.replace(sym, "")
-            s0 = s0.strip("'\"")
-            s0 = s0.replace('－','-').replace('—','-').replace('–','-')
-            if not s0:
-                return 0.0
-            try:
-                return float(s0)
-            except Exception:
-                return 0.0
-        inc_val = _num(inc_raw)
-        exp_val = _num(exp_raw)
-        amt = 0.0
-        ttype = "收入"
-        if inc_val > 0 and exp_val <= 0:
-            amt = inc_val
-            ttype = "收入"
-        elif exp_val > 0 and inc_val <= 0:
-            amt = exp_val
-            ttype = "支出"
-        elif inc_val > 0 and exp_val > 0:
-            amt = inc_val if inc_val >= exp_val else exp_val
-            ttype = "收入" if inc_val >= exp_val else "支出"
+            t = mapper(r, account_names)
+        except _RowError as e:
+            failure_count += 1
+            stats["failure_count"] = failure_count
+            if len(failures) < 3:
+                failures.append((idx, e.reason, e.value))
+            continue
+        if failure_count:
+            continue
+        if t is None:
+            if platform == "alipay":
+                stats["skipped_no_io"] += 1
+            continue
+        produced += 1
+        yield t
+    if failures:
+        raise ValueError(_failure_message(failures, failure_count))
+    if platform == "wechat" and not produced:
+        raise ValueError("未识别到有效微信账单记录，请检查是否为官方导出模板")
+    if platform == "alipay" and not produced and not stats["skipped_no_io"]:
+        raise ValueError("未识别到有效支付宝账单记录，请检查是否为官方导出模板或保存为CSV/XLSX再试")
+
+def _parse_file(path: str, account_names: List[str], platform: str = None, sheet=None):
+    # 进程池中运行：整份文件读取并映射为账单列表，连同该文件的 stats 一起返回
+    stats = {}
+    return list(iter_import(path, account_names, platform, stats, sheet)), stats
+
+def _merge_stats(dst: Dict, src: Dict):
+    for k, v in src.items():
+        if k == "encodings":
+            seen = dst.setdefault(k, [])
+            seen.extend(e for e in v if e not in seen)
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            dst[k] = dst.get(k, 0) + v
         else:
-            v = _num(inc_raw if inc_raw is not None else exp_raw)
-            if v == 0.0:
-                continue
-            ttype = "收入" if v >= 0 else "支出"
-            amt = abs(v)
-        note_parts = []
-        s1 = r.get("交易摘要") or pick(r, ["交易摘要","summary"]) or ""
-        s2 = r.get("对方用户名") or pick(r, ["对方用户名","counter party","username"]) or ""
-        if str(s1).strip():
-            note_parts.append(str(s1).strip())
-        if str(s2).strip():
-            note_parts.append(str(s2).strip())
-        note = " | ".join(note_parts)
-        account = "中信银行" if "中信银行" in account_names else ""
-        out.append({
-            "id": gen_id(),
-            "time": dt.isoformat(),
-            "amount": abs(float(amt)),
-            "category": "",
-            "ttype": ttype,
-            "account": account,
-            "to_account": None,
-            "from_account": None,
-            "note": note,
-            "platform": "citic",
-            "parse_status": "ok",
-        })
-    return out
+            dst[k] = v
+
+def import_workers(n_files: int) -> int:
+    # 进程数按 CPU 核数，不超过文件数；IMPORT_WORKERS 可固定进程数（1 为不用进程池）
+    n = IMPORT_WORKERS or os.cpu_count() or 1
+    return max(1, min(n, n_files))
+
+def map_files(fn, paths: List[str], *args, workers: int = None) -> Iterator:
+    # 多个文件分发到进程池并行执行 fn(path, *args)，按文件顺序逐个产出结果；
+    # 在途任务不超过进程数的两倍，已解析未取走的文件不会全部堆在内存里。某个文件出错时取消其余任务并抛出
+    paths = list(paths)
+    workers = workers or import_workers(len(paths))
+    if workers <= 1:
+        for p in paths:
+            yield fn(p, *args)
+        return
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    ex = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        it = iter(paths)
+        for p in it:
+            pending.append(ex.submit(fn, p, *args))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            res = pending.popleft().result()
+            p = next(it, None)
+            if p is not None:
+                pending.append(ex.submit(fn, p, *args))
+            yield res
+    finally:
+        ex.shutdown(wait=True, cancel_futures=True)
+
+def iter_import_files(paths: List[str], account_names: List[str], platform: str = None, stats: Optional[Dict] = None, sheet=None) -> Iterator[Dict]:
+    # 多文件导入：单个文件时直接流式读取；多个文件时各自在进程池中读取映射，按文件顺序合并产出，
+    # 查重与入库仍由调用方在本进程中完成（见 storage.import_transactions）。stats 同 iter_import，按文件累加
+    if stats is None:
+        stats = {}
+    paths = list(paths)
+    if len(paths) == 1 or import_workers(len(paths)) <= 1:
+        for p in paths:
+            yield from iter_import(p, account_names, platform, stats, sheet)
+        return
+    for rows, st in map_files(_parse_file, paths, account_names, platform, sheet):
+        _merge_stats(stats, st)
+        yield from rows
 
 def try_import(path: str, account_names: List[str]):
     pl = path.lower()
@@ -470,13 +776,8 @@ def try_import(path: str, account_names: List[str]):
         r = import_standard_rows(rows, account_names)
         return {"rows": r, "stats": {"skipped_no_io": 0}}
     if pl.endswith(".txt"):
-        # 兼容TXT，尝试以GBK+制表符解析
-        try:
-            with open(path, "r", encoding="utf-8-sig") as f:
-                content = f.read()
-        except UnicodeDecodeError:
-            with open(path, "r", encoding="gbk") as f:
-                content = f.read()
+        # 兼容TXT，按识别出的编码以制表符解析
+        content = _read_text(path)
         lines = [l for l in content.splitlines() if l.strip()]
         # 寻找表头行
         header_idx = 0
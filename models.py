@@ -23,6 +23,8 @@ class Account:
     bill_day: int = 0
     repay_day: int = 0
     repay_offset: int = 0
+    # 期初余额：新建账户时的余额，重算余额以它为起点；旧数据为 None，按现有余额倒推
+    opening_balance: Optional[float] = None
 
     def to_dict(self):
         return asdict(self)
@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+import importlib.machinery
+from contextlib import contextmanager
+from datetime import datetime
+
+# 启动耗时追踪：记录本项目各模块导入耗时、页面构建耗时、首帧与可交互时间，写入 data/startup_trace.log
+# 运行期间的保存耗时（调用保存到落盘）也追加到同一日志
+# 须在其它项目模块之前导入（见 app.py），计时零点即本模块导入时刻
+
+_T0 = time.perf_counter()
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_PATH = os.path.join(BASE_DIR, "data", "startup_trace.log")
+LOG_MAX_BYTES = 512 * 1024
+
+_events = []
+_stack = []
+_finished = False
+_installed = False
+
+def _now_ms():
+    return (time.perf_counter() - _T0) * 1000.0
+
+def _fmt(ev):
+    kind, name, at, dur, self_ms = ev
+    line = f"{at:9.1f} ms  {kind:<6} {name}"
+    if dur is not None:
+        line += f"  {dur:.1f} ms"
+    if self_ms is not None:
+        line += f" (自身 {self_ms:.1f} ms)"
+    return line
+
+def _write(lines, header=False):
+    try:
+        os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+        mode = "a"
+        try:
+            if os.path.getsize(LOG_PATH) > LOG_MAX_BYTES:
+                mode = "w"
+        except OSError:
+            pass
+        with open(LOG_PATH, mode, encoding="utf-8") as f:
+            if header:
+                f.write(f"=== {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} pid={os.getpid()} python={sys.version.split()[0]} ===\n")
+            for line in lines:
+                f.write(line + "\n")
+    except Exception:
+        pass
+
+def _emit(kind, name, dur=None, self_ms=None):
+    ev = (kind, name, _now_ms(), dur, self_ms)
+    if _finished:
+        # 启动完成后的懒加载（页面首次进入等）逐条追加
+        _write([_fmt(ev)])
+    else:
+        _events.append(ev)
+
+class _TimedLoader:
+    def __init__(self, loader):
+        self._loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        start = time.perf_counter()
+        _stack.append(0.0)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            nested = _stack.pop()
+            dur = (time.perf_counter() - start) * 1000.0
+            if _stack:
+                _stack[-1] += dur
+            # 自身耗时不含其间导入的其它项目模块（标准库/第三方计入自身）
+            _emit("import", module.__name__, dur, dur - nested)
+
+class _TimedFinder:
+    @classmethod
+    def find_spec(cls, name, path=None, target=None):
+        if "." in name:
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(name, path)
+        if spec is None or spec.loader is None or not spec.origin:
+            return None
+        if os.path.dirname(os.path.abspath(spec.origin)) != BASE_DIR:
+            return None
+        spec.loader = _TimedLoader(spec.loader)
+        return spec
+
+def install():
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    # 插在 PathFinder 之前，内置/冻结模块仍走原有查找器
+    pos = len(sys.meta_path)
+    for i, finder in enumerate(sys.meta_path):
+        if finder is importlib.machinery.PathFinder:
+            pos = i
+            break
+    sys.meta_path.insert(pos, _TimedFinder)
+
+def mark(name):
+    _emit("mark", name)
+
+def record(kind, name, dur_ms):
+    # 由其它线程上报的耗时（如后台保存），启动完成后逐条追加
+    _emit(kind, name, dur_ms)
+
+@contextmanager
+def span(kind, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _emit(kind, name, (time.perf_counter() - start) * 1000.0)
+
+def watch_first_paint(widget, callback=None):
+    fired = {"v": False}
+    def fire(e=None):
+        if fired["v"]:
+            return
+        fired["v"] = True
+        mark("first_paint")
+        if callback is not None:
+            widget.after_idle(callback)
+    widget.bind("<Expose>", fire, add="+")
+    # 窗口未映射（最小化启动等）收不到 Expose 时兜底
+    widget.after(1500, fire)
+
+def finish():
+    global _finished
+    if _finished:
+        return
+    mark("interactive")
+    _finished = True
+    lines = [_fmt(ev) for ev in _events]
+    paint = next((ev[2] for ev in _events if ev[1] == "first_paint"), None)
+    summary = f"首帧 {paint:.1f} ms，" if paint is not None else ""
+    lines.append(f"{summary}可交互 {_events[-1][2]:.1f} ms")
+    _write(lines, header=True)
@@ -1,8 +1,20 @@
 import os
+import copy
+import time
+import zlib
+import hashlib
+import re
 import json
+import atexit
+import base64
+import calendar
 import sqlite3
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from models import Account, Transaction
 from utils import gen_id
 
@@ -29,16 +41,61 @@ def ensure_dirs():
     if not os.path.isdir(EXPORT_DIR):
         os.makedirs(EXPORT_DIR)
 
-def _db():
-    ensure_dirs()
-    conn = sqlite3.connect(LEDGER_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+_TX_COLUMNS = ["id", "time", "amount", "category", "ttype", "account", "to_account", "from_account", "note", "record_time", "record_source", "ts", "year", "ym", "ymd"]
+_TX_INSERT_SQL = "INSERT OR IGNORE INTO transactions(" + ", ".join(_TX_COLUMNS) + ") VALUES(" + ",".join("?" * len(_TX_COLUMNS)) + ")"
+_TX_UPDATE_SQL = "UPDATE transactions SET " + ", ".join(f"{c}=?" for c in _TX_COLUMNS[1:]) + " WHERE id=?"
+SCHEMA_VERSION = 1
 
-def _init_db():
-    conn = _db()
+def _time_keys(s) -> Tuple:
+    # 交易时间按墙上时间换算为整数键：ts 为 epoch 秒（按 UTC 计，不做时区换算），year/ym/ymd 如 2024/202401/20240115
+    try:
+        dt = datetime.fromisoformat(str(s or "").strip()[:19])
+    except ValueError:
+        return (None, None, None, None)
+    return (calendar.timegm(dt.timetuple()), dt.year, dt.year * 100 + dt.month, dt.year * 10000 + dt.month * 100 + dt.day)
+
+def _tx_row(t: Dict) -> Tuple:
+    return (
+        t.get("id"), t.get("time"), float(t.get("amount", 0)), t.get("category"),
+        t.get("ttype"), t.get("account"), t.get("to_account"), t.get("from_account"),
+        t.get("note"), t.get("record_time"), t.get("record_source"),
+    ) + _time_keys(t.get("time"))
+
+def _period_range(year: str = "", month: str = "") -> Optional[Tuple[int, int]]:
+    # 年/月筛选转换为 ts 上的半开区间 [lo, hi)
+    try:
+        if month:
+            y, m = int(month[:4]), int(month[5:7])
+            ny, nm = (y + 1, 1) if m == 12 else (y, m + 1)
+            return (calendar.timegm((y, m, 1, 0, 0, 0)), calendar.timegm((ny, nm, 1, 0, 0, 0)))
+        if year:
+            y = int(year[:4])
+            return (calendar.timegm((y, 1, 1, 0, 0, 0)), calendar.timegm((y + 1, 1, 1, 0, 0, 0)))
+    except (ValueError, IndexError):
+        return None
+    return None
+
+def _period_where(year: str, month: str, where: List[str], args: List):
+    rng = _period_range(year, month)
+    if rng:
+        where.append("ts>=? AND ts<?")
+        args.extend(rng)
+        if year and month and month[:4] != year[:4]:
+            where.append("year=?")
+            args.append(int(year[:4]) if year[:4].isdigit() else year)
+        return
+    if year:
+        where.append("substr(time,1,4)=?")
+        args.append(year)
+    if month:
+        where.append("substr(time,1,7)=?")
+        args.append(month)
+
+_TX_TABLE_SQL = "CREATE TABLE IF NOT EXISTS transactions (id TEXT PRIMARY KEY, time TEXT, amount REAL, category TEXT, ttype TEXT, account TEXT, to_account TEXT, from_account TEXT, note TEXT, record_time TEXT, record_source TEXT, ts INTEGER, year INTEGER, ym INTEGER, ymd INTEGER)"
+
+def _create_schema(conn):
     cur = conn.cursor()
-    cur.execute("CREATE TABLE IF NOT EXISTS transactions (id TEXT PRIMARY KEY, time TEXT, amount REAL, category TEXT, ttype TEXT, account TEXT, to_account TEXT, from_account TEXT, note TEXT, record_time TEXT, record_source TEXT)")
+    cur.execute(_TX_TABLE_SQL)
     cur.execute("CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, balance REAL, type TEXT, note TEXT, bank TEXT, last4 TEXT, credit_limit REAL, status TEXT, bill_day INTEGER, repay_day INTEGER, repay_offset INTEGER)")
     cur.execute("CREATE TABLE IF NOT EXISTS categories (scene TEXT, name TEXT, PRIMARY KEY(scene, name))")
     cur.execute("CREATE TABLE IF NOT EXISTS category_rules (scene TEXT, keyword TEXT, category TEXT, PRIMARY KEY(scene, keyword, category))")
@@ -51,7 +108,349 @@ def _init_db():
     cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_account ON transactions(account)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_ttype_category ON transactions(ttype, category)")
     conn.commit()
-    conn.close()
+    _migrate_schema(conn)
+    return _ensure_fts(conn)
+
+def _migrate_schema(conn):
+    # 依据 PRAGMA user_version 逐级升级旧库
+    cur = conn.cursor()
+    ver = int(cur.execute("PRAGMA user_version").fetchone()[0])
+    if ver < 1:
+        cols = {r[1] for r in cur.execute("PRAGMA table_info(transactions)").fetchall()}
+        for c in ("ts", "year", "ym", "ymd"):
+            if c not in cols:
+                cur.execute(f"ALTER TABLE transactions ADD COLUMN {c} INTEGER")
+        _backfill_time_keys(conn)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_ts ON transactions(ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_year_ym ON transactions(year, ym)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_ym ON transactions(ym)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_ymd ON transactions(ymd)")
+        cur.execute("PRAGMA user_version=1")
+    if ver < 2:
+        _create_aggregates(conn)
+        cur.execute("PRAGMA user_version=2")
+    if ver < 3:
+        # 游标分页：每个可排序列建 (排序键, id) 复合索引
+        for col, expr in _ORDER_KEYS.items():
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_tx_k_{col} ON transactions({expr}, id)")
+        cur.execute("PRAGMA user_version=3")
+    if ver < 4:
+        _create_balance_checkpoints(conn)
+        cur.execute("PRAGMA user_version=4")
+    if ver < 5:
+        _create_backup_tracking(conn)
+        cur.execute("PRAGMA user_version=5")
+    if ver < 6:
+        # 操作日志：每个带标签的批量修改记一行，payload 为 zlib 压缩的逆操作（见 LedgerBatch / undo_last）
+        cur.execute("CREATE TABLE IF NOT EXISTS op_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, created TEXT, label TEXT, rows INTEGER, undone INTEGER NOT NULL DEFAULT 0, payload BLOB)")
+        cur.execute("PRAGMA user_version=6")
+    conn.commit()
+
+# 排序键表达式须与索引定义逐字一致，查询才能走索引
+_ORDER_KEYS = {
+    "time": "coalesce(ts,-1)",
+    "record_time": "coalesce(record_time,'')",
+    "amount": "coalesce(amount,0)",
+    "category": "coalesce(category,'')",
+    "ttype": "coalesce(ttype,'')",
+    "account": "coalesce(account,'')",
+}
+
+_AGG_KEYS = ["ttype", "category", "account"]
+
+def _agg_add_sql(table: str, period_col: str, row: str) -> str:
+    return (f"INSERT INTO {table}({period_col}, ttype, category, account, sum, count) "
+            f"SELECT {row}.{period_col}, coalesce({row}.ttype,''), coalesce({row}.category,''), coalesce({row}.account,''), coalesce({row}.amount,0), 1 "
+            f"WHERE {row}.{period_col} IS NOT NULL "
+            f"ON CONFLICT({period_col}, ttype, category, account) DO UPDATE SET sum=sum+excluded.sum, count=count+1;")
+
+def _agg_sub_sql(table: str, period_col: str, row: str) -> str:
+    cond = f"{period_col}={row}.{period_col} AND ttype=coalesce({row}.ttype,'') AND category=coalesce({row}.category,'') AND account=coalesce({row}.account,'')"
+    return (f"UPDATE {table} SET sum=sum-coalesce({row}.amount,0), count=count-1 WHERE {cond}; "
+            f"DELETE FROM {table} WHERE {cond} AND count<=0;")
+
+def _create_aggregates(conn):
+    # 按日/按月的汇总表，由 transactions 上的触发器增量维护；漂移时用 rebuild_aggregates() 重算
+    cur = conn.cursor()
+    cur.execute("CREATE TABLE IF NOT EXISTS agg_daily (ymd INTEGER, ttype TEXT, category TEXT, account TEXT, sum REAL, count INTEGER, PRIMARY KEY(ymd, ttype, category, account))")
+    cur.execute("CREATE TABLE IF NOT EXISTS agg_monthly (ym INTEGER, ttype TEXT, category TEXT, account TEXT, sum REAL, count INTEGER, PRIMARY KEY(ym, ttype, category, account))")
+    add = _agg_add_sql("agg_daily", "ymd", "new") + " " + _agg_add_sql("agg_monthly", "ym", "new")
+    sub = _agg_sub_sql("agg_daily", "ymd", "old") + " " + _agg_sub_sql("agg_monthly", "ym", "old")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS tx_agg_ai AFTER INSERT ON transactions BEGIN {add} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS tx_agg_ad AFTER DELETE ON transactions BEGIN {sub} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS tx_agg_au AFTER UPDATE OF amount, ttype, category, account, ymd, ym ON transactions BEGIN {sub} {add} END")
+    _rebuild_aggregates(conn)
+
+def _rebuild_aggregates(conn):
+    cur = conn.cursor()
+    cur.execute("DELETE FROM agg_daily")
+    cur.execute("DELETE FROM agg_monthly")
+    cur.execute("INSERT INTO agg_daily(ymd, ttype, category, account, sum, count) SELECT ymd, coalesce(ttype,''), coalesce(category,''), coalesce(account,''), SUM(coalesce(amount,0)), COUNT(*) FROM transactions WHERE ymd IS NOT NULL GROUP BY 1, 2, 3, 4")
+    cur.execute("INSERT INTO agg_monthly(ym, ttype, category, account, sum, count) SELECT ymd / 100, ttype, category, account, SUM(sum), SUM(count) FROM agg_daily GROUP BY 1, 2, 3, 4")
+
+def rebuild_aggregates():
+    with db_transaction() as conn:
+        _rebuild_aggregates(conn)
+
+def _create_balance_checkpoints(conn):
+    # 余额检查点：每个有账单的月份一行/账户，记录截至该月末的累计余额变动
+    # 账单增删改时触发器删除受影响月份及以后的检查点，下次查询从最近的有效检查点向后补算
+    cur = conn.cursor()
+    cur.execute("CREATE TABLE IF NOT EXISTS balance_checkpoints (ym INTEGER, account TEXT, cum REAL, PRIMARY KEY(ym, account))")
+    cur.execute("CREATE TRIGGER IF NOT EXISTS tx_bal_ai AFTER INSERT ON transactions WHEN new.ym IS NOT NULL BEGIN DELETE FROM balance_checkpoints WHERE ym>=new.ym; END")
+    cur.execute("CREATE TRIGGER IF NOT EXISTS tx_bal_ad AFTER DELETE ON transactions WHEN old.ym IS NOT NULL BEGIN DELETE FROM balance_checkpoints WHERE ym>=old.ym; END")
+    cur.execute("CREATE TRIGGER IF NOT EXISTS tx_bal_au AFTER UPDATE OF amount, ttype, account, to_account, from_account, ym ON transactions "
+                "BEGIN DELETE FROM balance_checkpoints WHERE ym>=min(coalesce(old.ym, new.ym), coalesce(new.ym, old.ym)); END")
+
+def _create_backup_tracking(conn):
+    # 增量备份：触发器把有增删改的交易月份记入 backup_dirty（无有效时间记为 0），备份时只重读这些月份
+    # backup_meta.token 与最近一份清单的 db_token 一致时才可增量，否则整库重读
+    cur = conn.cursor()
+    cur.execute("CREATE TABLE IF NOT EXISTS backup_dirty (ym INTEGER PRIMARY KEY)")
+    cur.execute("CREATE TABLE IF NOT EXISTS backup_meta (k TEXT PRIMARY KEY, v TEXT)")
+    cur.execute("CREATE TRIGGER IF NOT EXISTS tx_bk_ai AFTER INSERT ON transactions BEGIN INSERT OR IGNORE INTO backup_dirty(ym) VALUES (coalesce(new.ym, 0)); END")
+    cur.execute("CREATE TRIGGER IF NOT EXISTS tx_bk_ad AFTER DELETE ON transactions BEGIN INSERT OR IGNORE INTO backup_dirty(ym) VALUES (coalesce(old.ym, 0)); END")
+    cur.execute("CREATE TRIGGER IF NOT EXISTS tx_bk_au AFTER UPDATE ON transactions "
+                "BEGIN INSERT OR IGNORE INTO backup_dirty(ym) VALUES (coalesce(old.ym, 0)); INSERT OR IGNORE INTO backup_dirty(ym) VALUES (coalesce(new.ym, 0)); END")
+
+_FTS_COLUMNS = ["note", "category", "account", "to_account", "from_account", "record_source"]
+
+def _ensure_fts(conn) -> bool:
+    # 账单搜索的 FTS5 外部内容索引（trigram 分词，支持中文子串）；未编译 FTS5/trigram 时返回 False 并回退 LIKE
+    # 注意：外部内容表按 rowid 关联，执行 VACUUM 后需调用 rebuild_fts()
+    cur = conn.cursor()
+    if cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='transactions_fts'").fetchone():
+        return True
+    cols = ", ".join(_FTS_COLUMNS)
+    new_cols = ", ".join(f"new.{c}" for c in _FTS_COLUMNS)
+    old_cols = ", ".join(f"old.{c}" for c in _FTS_COLUMNS)
+    try:
+        cur.execute(f"CREATE VIRTUAL TABLE transactions_fts USING fts5({cols}, content='transactions', content_rowid='rowid', tokenize='trigram')")
+    except sqlite3.OperationalError:
+        conn.rollback()
+        return False
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS tx_fts_ai AFTER INSERT ON transactions BEGIN INSERT INTO transactions_fts(rowid, {cols}) VALUES (new.rowid, {new_cols}); END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS tx_fts_ad AFTER DELETE ON transactions BEGIN INSERT INTO transactions_fts(transactions_fts, rowid, {cols}) VALUES ('delete', old.rowid, {old_cols}); END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS tx_fts_au AFTER UPDATE OF {cols} ON transactions BEGIN INSERT INTO transactions_fts(transactions_fts, rowid, {cols}) VALUES ('delete', old.rowid, {old_cols}); INSERT INTO transactions_fts(rowid, {cols}) VALUES (new.rowid, {new_cols}); END")
+    cur.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('rebuild')")
+    conn.commit()
+    return True
+
+def rebuild_fts():
+    if not fts_available():
+        return False
+    with db_transaction() as conn:
+        conn.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('rebuild')")
+    return True
+
+def fts_available() -> bool:
+    return _conn_mgr.fts_available()
+
+def _term_where(term: str, where: List[str], args: List):
+    like = f"%{term}%"
+    if len(term) < 3 or not fts_available():
+        where.append("(lower(time) LIKE ? OR lower(category) LIKE ? OR lower(ttype) LIKE ? OR lower(account) LIKE ? OR lower(to_account) LIKE ? OR lower(from_account) LIKE ? OR lower(note) LIKE ? OR lower(record_source) LIKE ? OR lower(id) LIKE ?)")
+        args.extend([like, like, like, like, like, like, like, like, like])
+        return
+    # trigram 至少 3 个字符；time/ttype/id 不在索引内，仅在词形可能命中时追加条件
+    ors = ["rowid IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)"]
+    args.append('"' + term.replace('"', '""') + '"')
+    types = [t for t in ("收入", "支出", "报销类收入", "报销类支出", "转账", "还款") if term in t]
+    if types:
+        ors.append("ttype IN (" + ",".join("?" * len(types)) + ")")
+        args.extend(types)
+    if all(ch in "0123456789-:t. " for ch in term):
+        ors.append("lower(time) LIKE ?")
+        args.append(like)
+    if all(ch in "0123456789abcdef" for ch in term):
+        ors.append("lower(id) LIKE ?")
+        args.append(like)
+    where.append("(" + " OR ".join(ors) + ")")
+
+def _backfill_time_keys(conn, batch: int = 5000):
+    cur = conn.cursor()
+    rows = cur.execute("SELECT id, time FROM transactions WHERE ts IS NULL").fetchall()
+    for i in range(0, len(rows), batch):
+        data = []
+        for r in rows[i:i + batch]:
+            data.append(_time_keys(r[1]) + (r[0],))
+        cur.executemany("UPDATE transactions SET ts=?, year=?, ym=?, ymd=? WHERE id=?", data)
+
+# SQLite 性能档位：default 为 SQLite 出厂设置（显式写出以便从 WAL 切回）
+SQLITE_PROFILES = {
+    "default": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "temp_store": "DEFAULT",
+        "mmap_size": 0,
+        "checkpoint_every": 0,
+    },
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "temp_store": "MEMORY",
+        "mmap_size": 268435456,
+        "checkpoint_every": 200,
+    },
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -262144,
+        "temp_store": "MEMORY",
+        "mmap_size": 1073741824,
+        "checkpoint_every": 1000,
+    },
+}
+DEFAULT_SQLITE_PROFILE = "balanced"
+
+def _ledger_prefs(state: Dict = None) -> Dict:
+    try:
+        return ((state if state is not None else load_state()).get("prefs", {}) or {})
+    except Exception:
+        return {}
+
+def get_sqlite_profile_name(state: Dict = None) -> str:
+    # 档位是本机设置，存于 prefs.json；旧账本 prefs 中的取值在未迁移或未改过档位前继续生效
+    name = get_pref("sqlite_profile") or _ledger_prefs(state).get("sqlite_profile")
+    return name if name in SQLITE_PROFILES else DEFAULT_SQLITE_PROFILE
+
+def set_sqlite_profile(name: str):
+    # 只写 prefs.json，不重写账本；各线程在下次取连接时按新档位重连
+    set_pref("sqlite_profile", name if name in SQLITE_PROFILES else DEFAULT_SQLITE_PROFILE, delay=0)
+    _conn_mgr.configure(None)
+
+def get_sqlite_profile(state: Dict = None) -> Dict:
+    prof = dict(SQLITE_PROFILES[get_sqlite_profile_name(state)])
+    # 允许在 sqlite_pragmas 中逐项覆盖
+    pragmas = get_pref("sqlite_pragmas")
+    if pragmas is None:
+        pragmas = _ledger_prefs(state).get("sqlite_pragmas")
+    for k, v in (pragmas or {}).items():
+        if k in prof:
+            prof[k] = v
+    return prof
+
+def _apply_pragmas(conn, prof: Dict):
+    cur = conn.cursor()
+    jm = str(prof.get("journal_mode") or "DELETE").upper()
+    if jm in ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"):
+        cur.execute(f"PRAGMA journal_mode={jm}")
+    sync = str(prof.get("synchronous") or "FULL").upper()
+    if sync in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        cur.execute(f"PRAGMA synchronous={sync}")
+    ts = str(prof.get("temp_store") or "DEFAULT").upper()
+    if ts in ("DEFAULT", "FILE", "MEMORY"):
+        cur.execute(f"PRAGMA temp_store={ts}")
+    cur.execute(f"PRAGMA cache_size={int(prof.get('cache_size') or -2000)}")
+    cur.execute(f"PRAGMA mmap_size={int(prof.get('mmap_size') or 0)}")
+
+class ConnectionManager:
+    # 每个线程复用一条长连接；建表/建索引每个进程每个数据库文件只执行一次
+    STATEMENT_CACHE_SIZE = 256
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._schema_ready = set()
+        self._fts = {}
+        self._profile = None
+        self._generation = 0
+
+    def configure(self, profile: Dict = None):
+        # 指定档位（None 表示读取 prefs）；各线程在下次取连接时按新档位重连
+        with self._lock:
+            self._profile = dict(profile) if profile else None
+            self._generation += 1
+        self._close_local()
+
+    def connection(self):
+        path = get_current_db_path()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "path", None) == path and getattr(self._local, "gen", None) == self._generation:
+            return conn
+        if conn is not None:
+            self._close_local()
+        ensure_dirs()
+        conn = sqlite3.connect(path, cached_statements=self.STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        prof = self._profile or get_sqlite_profile()
+        try:
+            _apply_pragmas(conn, prof)
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            if path not in self._schema_ready:
+                self._fts[path] = _create_schema(conn)
+                self._schema_ready.add(path)
+        self._local.conn = conn
+        self._local.path = path
+        self._local.gen = self._generation
+        self._local.checkpoint_every = int(prof.get("checkpoint_every") or 0)
+        self._local.commits = 0
+        return conn
+
+    def fts_available(self) -> bool:
+        self.connection()
+        return bool(self._fts.get(get_current_db_path()))
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        if conn.in_transaction:
+            # 嵌套调用并入外层事务，由外层统一提交
+            yield conn
+            return
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self._after_commit(conn)
+
+    def _after_commit(self, conn):
+        every = getattr(self._local, "checkpoint_every", 0)
+        if not every:
+            return
+        self._local.commits = getattr(self._local, "commits", 0) + 1
+        if self._local.commits >= every:
+            self._local.commits = 0
+            self.checkpoint(conn)
+
+    def checkpoint(self, conn=None, mode: str = "PASSIVE"):
+        conn = conn or self.connection()
+        mode = mode.upper() if mode.upper() in ("PASSIVE", "FULL", "RESTART", "TRUNCATE") else "PASSIVE"
+        try:
+            return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+        except sqlite3.Error:
+            return None
+
+    def _close_local(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        self._local.path = None
+        if conn is None:
+            return
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        self._close_local()
+
+_conn_mgr = ConnectionManager()
+
+def get_connection_manager() -> ConnectionManager:
+    return _conn_mgr
+
+def _db():
+    return _conn_mgr.connection()
+
+def db_transaction():
+    return _conn_mgr.transaction()
 
 def _get_backend():
     try:
@@ -60,6 +459,12 @@ def _get_backend():
     except Exception:
         return "sqlite"
 
+# sqlite：账单同时写 JSON 与 SQLite；sqlite_only：账单只在 SQLite，ledger.json 仅存配置；json：只写 JSON
+STORAGE_BACKENDS = ("sqlite", "sqlite_only", "json")
+
+def _uses_sqlite() -> bool:
+    return _get_backend() in ("sqlite", "sqlite_only")
+
 def ensure_user_dirs(user_id: str):
     ensure_dirs()
     up = os.path.join(USER_DIR, user_id)
@@ -88,25 +493,35 @@ def default_state():
         ],
         "prefs": {
             "freeze_assets": False,
-            "menu_layout": "classic",
             "user_management_enabled": False,
-            "theme": "light",
             "investments_enabled": True,
             "credit_cards_enabled": True,
-            "bill_list": {
-                "visible_columns": [
-                    "交易时间","金额","消费类别","所属类别","账户","转入账户","转出账户","备注","记账时间","记账来源","id"
-                ],
-                "time_format": "date"
-            },
-            "credit_cards": {
-                "visible_columns": [
-                    "银行","卡名","后四位","信用额度","账单日","还款日","还款偏移","今日账期天数","状态","备注"
-                ]
-            }
         },
     }
 
+# 界面偏好（主题、菜单布局、列宽/显示列、看板周期与分栏位置等）及本机的数据库性能档位存放在账本同目录的 prefs.json，不随账本读写
+UI_PREF_KEYS = ("theme", "menu_layout", "use_pagination", "bill_list", "credit_cards", "dashboard", "dashboard_list", "sqlite_profile", "sqlite_pragmas")
+
+def default_ui_prefs():
+    return {
+        "theme": "light",
+        "menu_layout": "classic",
+        "use_pagination": False,
+        "bill_list": {
+            "visible_columns": [
+                "交易时间","金额","消费类别","所属类别","账户","转入账户","转出账户","备注","记账时间","记账来源","id"
+            ],
+            "time_format": "date"
+        },
+        "credit_cards": {
+            "visible_columns": [
+                "银行","卡名","后四位","信用额度","账单日","还款日","还款偏移","今日账期天数","状态","备注"
+            ]
+        },
+        "dashboard": {},
+        "dashboard_list": {},
+    }
+
 def set_ledger_path(path: str):
     global CURRENT_LEDGER_PATH
     CURRENT_LEDGER_PATH = path or LEDGER_PATH
@@ -114,6 +529,13 @@ def set_ledger_path(path: str):
 def get_current_ledger_path() -> str:
     return CURRENT_LEDGER_PATH
 
+def get_current_db_path() -> str:
+    # 默认账本沿用 data/ledger.db；其它账本（如各用户目录）使用同目录同名的 .db
+    path = get_current_ledger_path()
+    if os.path.abspath(path) == os.path.abspath(LEDGER_PATH):
+        return LEDGER_DB_PATH
+    return os.path.splitext(path)[0] + ".db"
+
 def get_user_ledger_path(user_id: str) -> str:
     ensure_user_dirs(user_id)
     return os.path.join(USER_DIR, user_id, "ledger.json")
@@ -122,21 +544,189 @@ def get_user_invest_ledger_path(user_id: str) -> str:
     ensure_user_dirs(user_id)
     return os.path.join(USER_DIR, user_id, "invest_ledger.json")
 
-def load_state() -> Dict:
-    ensure_dirs()
-    path = get_current_ledger_path()
-    if not os.path.isfile(path):
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(default_state(), f, ensure_ascii=False, indent=2)
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    for a in data.get("accounts", []):
-        if "balance" in a:
-            a["balance"] = float(a["balance"])
-    for t in data.get("transactions", []):
+# 账本文件布局：首键 _layout 标记、账户/类别/偏好等小段在前、transactions 在最后；读取时只解析前面的小段
+_LAYOUT_MARK = "transactions_last"
+_json_decoder = json.JSONDecoder()
+_JSON_WS = re.compile(r"[ \t\n\r]*")
+
+class LedgerState(dict):
+    # 账本状态：transactions 在首次访问（[] / get / setdefault / in）时才解析或从数据库载入
+    # 未访问前 raw_transactions 保存原文，保存时原样写回；items()/keys() 不含尚未载入的 transactions
+    def __init__(self, data=()):
+        super().__init__(data)
+        self._loader = None
+        self._load_lock = threading.RLock()
+        self.raw_transactions = None
+        # 旧布局文件（transactions 不在最后）只能整份解析
+        self.legacy_layout = False
+
+    def set_loader(self, loader, raw: bytes = None):
+        dict.pop(self, "transactions", None)
+        self._loader = loader
+        self.raw_transactions = raw
+
+    def wrap_loader(self, fn):
+        # 在尚未执行的载入之后追加一步处理；已载入则立即处理
+        with self._load_lock:
+            loader = self._loader
+            if loader is None:
+                dict.__setitem__(self, "transactions", fn(dict.get(self, "transactions") or []))
+            else:
+                self._loader = lambda: fn(loader())
+
+    def tx_loaded(self) -> bool:
+        return self._loader is None
+
+    def _materialize(self):
+        if self._loader is None:
+            return
+        with self._load_lock:
+            loader = self._loader
+            if loader is not None:
+                dict.__setitem__(self, "transactions", loader())
+                self._loader = None
+                self.raw_transactions = None
+
+    def __getitem__(self, key):
+        if key == "transactions":
+            self._materialize()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key == "transactions":
+            self._materialize()
+        return dict.get(self, key, default)
+
+    def setdefault(self, key, default=None):
+        if key == "transactions":
+            self._materialize()
+        return dict.setdefault(self, key, default)
+
+    def pop(self, key, *default):
+        if key == "transactions":
+            self._materialize()
+        return dict.pop(self, key, *default)
+
+    def __contains__(self, key):
+        return (key == "transactions" and self._loader is not None) or dict.__contains__(self, key)
+
+    def __setitem__(self, key, value):
+        if key == "transactions":
+            self._loader = None
+            self.raw_transactions = None
+        dict.__setitem__(self, key, value)
+
+def _tx_loaded(state: Dict) -> bool:
+    return not isinstance(state, LedgerState) or state.tx_loaded()
+
+def _parse_head(text: str):
+    # 逐段解析顶层对象，遇到 transactions 时返回 (小段, transactions 值起始下标)；读到文本末尾仍未结束会抛 IndexError/ValueError
+    head = {}
+    idx = _JSON_WS.match(text, 0).end()
+    if text[idx] != "{":
+        raise ValueError("not an object")
+    idx += 1
+    while True:
+        idx = _JSON_WS.match(text, idx).end()
+        if text[idx] == "}":
+            return head, None
+        key, idx = _json_decoder.raw_decode(text, idx)
+        idx = _JSON_WS.match(text, idx).end()
+        if text[idx] != ":":
+            raise ValueError("bad object")
+        idx = _JSON_WS.match(text, idx + 1).end()
+        if key == "transactions":
+            return head, idx
+        head[key], idx = _json_decoder.raw_decode(text, idx)
+        idx = _JSON_WS.match(text, idx).end()
+        if text[idx] == "}":
+            return head, None
+        if text[idx] != ",":
+            raise ValueError("bad object")
+        idx += 1
+
+def _split_ledger_text(blob: bytes) -> Tuple[Dict, Optional[bytes]]:
+    # 新布局只解码并解析文件开头的小段，返回 (小段, transactions 原文字节)；旧布局或解析异常时整份解析
+    if b'"_layout"' in blob[:64]:
+        size = 1 << 16
+        while True:
+            text = blob[:size].decode("utf-8", "ignore")
+            try:
+                head, idx = _parse_head(text)
+            except (ValueError, IndexError):
+                if size >= len(blob):
+                    break
+                size *= 4
+                continue
+            if head.get("_layout") != _LAYOUT_MARK:
+                break
+            head.pop("_layout", None)
+            if idx is None:
+                return head, None
+            start = len(text[:idx].encode("utf-8"))
+            end = len(blob)
+            while end > start and blob[end - 1] in b" \t\r\n":
+                end -= 1
+            if blob[end - 1:end] != b"}":
+                break
+            end -= 1
+            while end > start and blob[end - 1] in b" \t\r\n":
+                end -= 1
+            if blob[start:start + 1] == b"[" and blob[end - 1:end] == b"]":
+                return head, blob[start:end]
+            break
+    data = json.loads(blob)
+    data.pop("_layout", None)
+    return data, None
+
+def _dump_ledger(f, state: Dict, indent: int = None, extra: Dict = None, with_transactions: bool = True, raw: bytes = None):
+    # 按新布局写出：_layout 标记在前，transactions 在最后；transactions 尚未载入时直接写回原文（raw 可由快照显式传入）
+    head = {"_layout": _LAYOUT_MARK}
+    head.update((k, v) for k, v in state.items() if k not in ("transactions", "_layout"))
+    if extra:
+        head.update(extra)
+    seps = None if indent else (",", ":")
+    if not with_transactions:
+        json.dump(head, f, ensure_ascii=False, indent=indent, separators=seps)
+        return
+    if raw is None and isinstance(state, LedgerState) and not state.tx_loaded():
+        raw = state.raw_transactions
+    if raw is None:
+        head["transactions"] = state.get("transactions", [])
+        json.dump(head, f, ensure_ascii=False, indent=indent, separators=seps)
+        return
+    text = json.dumps(head, ensure_ascii=False, indent=indent, separators=seps)
+    if indent:
+        f.write(text[:-1].rstrip() + ',\n' + ' ' * indent + '"transactions": ')
+    else:
+        f.write(text[:-1] + ',"transactions":')
+    # 原文为字节，绕过文本层直接写入
+    f.flush()
+    f.buffer.write(raw)
+    f.write("\n}" if indent else "}")
+
+def _normalize_transactions(txs):
+    for t in txs:
         if "category" not in t:
             mc = t.get("minor_category") or t.get("major_category") or ""
             t["category"] = mc
+    return txs
+
+def _read_state(path: str) -> Dict:
+    with open(path, "rb") as f:
+        blob = f.read()
+    head, raw = _split_ledger_text(blob)
+    del blob
+    data = LedgerState(head)
+    if raw is not None:
+        data.set_loader(lambda: _normalize_transactions(json.loads(raw)), raw)
+    elif "transactions" in head:
+        _normalize_transactions(head["transactions"])
+        data.legacy_layout = True
+    data = _replay_journal(path, data)
+    for a in data.get("accounts", []):
+        if "balance" in a:
+            a["balance"] = float(a["balance"])
     if "categories" not in data:
         data["categories"] = default_state()["categories"]
     if "account_types" not in data:
@@ -151,24 +741,1098 @@ def load_state() -> Dict:
         prefs = data.setdefault("prefs", {})
         if "freeze_assets" not in prefs:
             prefs["freeze_assets"] = False
-        if "menu_layout" not in prefs:
-            prefs["menu_layout"] = "classic"
-        if "theme" not in prefs:
-            prefs["theme"] = "light"
         if "investments_enabled" not in prefs:
             prefs["investments_enabled"] = True
         if "credit_cards_enabled" not in prefs:
             prefs["credit_cards_enabled"] = True
-        bl = prefs.setdefault("bill_list", {})
-        if "visible_columns" not in bl:
-            bl["visible_columns"] = default_state()["prefs"]["bill_list"]["visible_columns"]
-        if "time_format" not in bl:
-            bl["time_format"] = default_state()["prefs"]["bill_list"]["time_format"]
-        cc = prefs.setdefault("credit_cards", {})
-        if "visible_columns" not in cc:
-            cc["visible_columns"] = default_state()["prefs"]["credit_cards"]["visible_columns"]
     return data
 
+def _file_sig(path: str):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+class TxList(list):
+    # 交易列表：记录绕过 storage 函数的增删改（直接 append、整条替换等），由 save_state 一并落库
+    def __init__(self, rows=(), db_path: str = None):
+        super().__init__(rows)
+        self.db_path = db_path
+        self._upserts = {}
+        self._deletes = set()
+        # id -> 下标；追加时增量维护，插入/删除等改变位置的操作后置空，下次查找时重建
+        self._pos = None
+
+    def position(self, tx_id):
+        pos = self._pos
+        if pos is None:
+            pos = {}
+            for i, t in enumerate(self):
+                pos.setdefault(t.get("id"), i)
+            self._pos = pos
+        i = pos.get(tx_id)
+        if i is None:
+            return None
+        if i < len(self) and self[i].get("id") == tx_id:
+            return i
+        # 交易字典的 id 被原地改写等情况：重建后再查一次
+        self._pos = None
+        return self.position(tx_id)
+
+    def _touch(self, t):
+        if isinstance(t, dict) and t.get("id"):
+            self._deletes.discard(t["id"])
+            self._upserts[t["id"]] = t
+
+    def _drop(self, t):
+        if isinstance(t, dict) and t.get("id"):
+            self._upserts.pop(t["id"], None)
+            self._deletes.add(t["id"])
+
+    def append(self, t):
+        super().append(t)
+        self._touch(t)
+        if self._pos is not None:
+            self._pos.setdefault(t.get("id"), len(self) - 1)
+
+    def extend(self, rows):
+        rows = list(rows)
+        n = len(self)
+        super().extend(rows)
+        for i, t in enumerate(rows):
+            self._touch(t)
+            if self._pos is not None:
+                self._pos.setdefault(t.get("id"), n + i)
+
+    def __iadd__(self, rows):
+        self.extend(rows)
+        return self
+
+    def insert(self, i, t):
+        super().insert(i, t)
+        self._touch(t)
+        self._pos = None
+
+    def __setitem__(self, i, v):
+        old = self[i] if isinstance(i, slice) else [self[i]]
+        super().__setitem__(i, v)
+        for t in old:
+            self._drop(t)
+        for t in (self[i] if isinstance(i, slice) else [v]):
+            self._touch(t)
+        if isinstance(i, slice) or self._pos is None:
+            self._pos = None
+        else:
+            i = i % len(self)
+            if self._pos.get(old[0].get("id")) == i:
+                del self._pos[old[0].get("id")]
+            self._pos[v.get("id")] = i
+
+    def __delitem__(self, i):
+        old = self[i] if isinstance(i, slice) else [self[i]]
+        super().__delitem__(i)
+        for t in old:
+            self._drop(t)
+        self._pos = None
+
+    def remove(self, t):
+        super().remove(t)
+        self._drop(t)
+        self._pos = None
+
+    def pop(self, i=-1):
+        t = super().pop(i)
+        self._drop(t)
+        self._pos = None
+        return t
+
+    def clear(self):
+        for t in self:
+            self._drop(t)
+        super().clear()
+        self._pos = None
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._pos = None
+
+    def reverse(self):
+        super().reverse()
+        self._pos = None
+
+    def mark_dirty(self, t):
+        self._touch(t)
+
+    def mark_deleted(self, ids):
+        for i in ids:
+            self._upserts.pop(i, None)
+            self._deletes.add(i)
+
+    def mark_synced(self, ids):
+        for i in ids:
+            self._upserts.pop(i, None)
+            self._deletes.discard(i)
+
+    def replace_synced(self, rows):
+        # 批量操作已直接写库，整体替换内容但不记为待写
+        list.__setitem__(self, slice(None), rows)
+        self._pos = None
+
+    def checkpoint(self):
+        return (list(self), dict(self._upserts), set(self._deletes))
+
+    def restore(self, cp):
+        rows, ups, dels = cp
+        list.__setitem__(self, slice(None), rows)
+        self._upserts = ups
+        self._deletes = dels
+        self._pos = None
+
+    def take_pending(self):
+        ups = list(self._upserts.values())
+        dels = list(self._deletes)
+        self._upserts = {}
+        self._deletes = set()
+        return ups, dels
+
+class AccountList(list):
+    # 账户列表：名称 -> 账户记录 的索引；结构变化时置空重建，命中时校验名称以防记录被原地改名
+    def __init__(self, rows=()):
+        super().__init__(rows)
+        self._index = None
+
+    def invalidate(self):
+        self._index = None
+
+    def lookup(self, name):
+        idx = self._index
+        if idx is None:
+            idx = {}
+            for a in self:
+                idx.setdefault(a.get("name") or "", a)
+            self._index = idx
+        a = idx.get(name or "")
+        if a is not None and (a.get("name") or "") == (name or ""):
+            return a
+        # 未命中或已失效（记录被原地改名）：线性确认一次，找到则重建索引
+        for a in self:
+            if (a.get("name") or "") == (name or ""):
+                self._index = None
+                return a
+        return None
+
+def _invalidating(name):
+    def method(self, *args, **kwargs):
+        self._index = None
+        return getattr(list, name)(self, *args, **kwargs)
+    return method
+
+for _m in ("append", "extend", "insert", "remove", "pop", "clear", "__setitem__", "__delitem__", "__iadd__", "sort", "reverse"):
+    setattr(AccountList, _m, _invalidating(_m))
+
+def _account_list(state: Dict) -> AccountList:
+    accs = state.get("accounts")
+    if not isinstance(accs, AccountList):
+        accs = AccountList(accs or [])
+        state["accounts"] = accs
+    return accs
+
+def _tx_list(state: Dict) -> TxList:
+    # 外部整体替换成普通列表时就地包装；db_path 为空，保存时按内容重建数据库
+    txs = state.get("transactions")
+    if not isinstance(txs, TxList):
+        txs = TxList(txs or [])
+        state["transactions"] = txs
+    return txs
+
+def mark_transaction_dirty(state: Dict, t: Dict):
+    # 原地修改了交易字典后调用，保证 save_state 时写回数据库
+    txs = state.get("transactions")
+    if isinstance(txs, TxList):
+        txs.mark_dirty(t)
+
+def _replace_row(state: Dict, t: Dict, changes: Dict) -> Dict:
+    # 以改好的副本替换列表中的整行，不原地改字典：后台写盘线程可能正在序列化旧行（见 _ledger_snapshot）
+    txs = _tx_list(state)
+    new = dict(t, **changes)
+    i = txs.position(t.get("id"))
+    if i is not None:
+        list.__setitem__(txs, i, new)
+    return new
+
+def replace_transaction_fields(state: Dict, t: Dict, changes: Dict) -> Dict:
+    # 修改账单部分字段并记为待写，返回替换后的新行
+    new = _replace_row(state, t, changes)
+    mark_transaction_dirty(state, new)
+    return new
+
+def _mark_synced(state: Dict, ids):
+    txs = state.get("transactions")
+    if isinstance(txs, TxList):
+        txs.mark_synced(ids)
+
+def _wrap_transactions(data: Dict, fn):
+    if isinstance(data, LedgerState):
+        data.wrap_loader(fn)
+    else:
+        data["transactions"] = fn(data.get("transactions") or [])
+
+def _attach_transactions(data: Dict):
+    # sqlite_only 从数据库载入账单；sqlite 沿用 JSON 中的账单，数据库为空时补齐
+    # 账单均延后到首次访问时载入，只有需要补齐空库时才立即展开
+    data["accounts"] = AccountList(data.get("accounts") or [])
+    backend = ((data.get("prefs", {}) or {}).get("storage_backend") or "sqlite")
+    if backend not in ("sqlite", "sqlite_only"):
+        _wrap_transactions(data, lambda txs: TxList(txs))
+        return
+    db_path = get_current_db_path()
+    try:
+        conn = _db()
+        if backend == "sqlite_only":
+            def load_rows():
+                return TxList([dict(r) for r in _db().execute(_TX_SELECT + " ORDER BY rowid")], db_path)
+            if isinstance(data, LedgerState):
+                data.set_loader(load_rows)
+            else:
+                data["transactions"] = load_rows()
+            return
+        _wrap_transactions(data, lambda txs: TxList(txs, db_path))
+        if conn.execute("SELECT 1 FROM transactions LIMIT 1").fetchone() is None:
+            txs = data.get("transactions") or []
+            if txs:
+                with db_transaction() as c:
+                    c.executemany(_TX_INSERT_SQL, [_tx_row(t) for t in txs])
+    except sqlite3.Error:
+        pass
+
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+
+def _journal_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".journal"
+
+def _ledger_sig(path: str):
+    return (_file_sig(path), _file_sig(_journal_path(path)))
+
+def _dumps(v) -> str:
+    return json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+
+def _write_json_atomic(path: str, data: Dict, indent: int = None):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        if indent:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+        else:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _apply_tx_ops(txs: List, ops: List[Dict]) -> List:
+    pos = {t.get("id"): i for i, t in enumerate(txs)}
+    for rec in ops:
+        dels = set(rec.get("delete") or [])
+        if dels:
+            txs[:] = [t for t in txs if t.get("id") not in dels]
+            pos = {t.get("id"): i for i, t in enumerate(txs)}
+        for t in rec.get("upsert") or []:
+            i = pos.get(t.get("id"))
+            if i is None:
+                pos[t.get("id")] = len(txs)
+                txs.append(t)
+            else:
+                txs[i] = t
+    return txs
+
+def _replay_journal(path: str, data: Dict, limit: int = None) -> Dict:
+    # 在快照上按序重放日志；seq 不大于快照所记序号的记录已折叠进快照，跳过
+    # 末行不完整（写到一半时崩溃）则截掉，避免之后追加的记录接在残行后面
+    base = int(data.pop("_journal_seq", 0) or 0)
+    last = base
+    jp = _journal_path(path)
+    if not os.path.isfile(jp):
+        data["_journal_seq"] = last
+        return data
+    tx_ops = []
+    good = 0
+    torn = False
+    with open(jp, "rb") as f:
+        for line in f:
+            if limit is not None and good >= limit:
+                break
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("incomplete")
+                rec = json.loads(line)
+            except ValueError:
+                torn = True
+                break
+            good += len(line)
+            seq = int(rec.get("seq", 0))
+            if seq <= base:
+                continue
+            last = seq
+            op = rec.get("op")
+            if op == "set":
+                data[rec["key"]] = rec.get("value")
+            elif op == "del":
+                data.pop(rec["key"], None)
+            elif op == "tx":
+                tx_ops.append(rec)
+    if tx_ops:
+        if isinstance(data, LedgerState) and not data.tx_loaded():
+            # 账单延后到首次访问时再重放；原文已不是最新内容，不可再原样写回
+            data.wrap_loader(lambda txs: _apply_tx_ops(txs, tx_ops))
+            data.raw_transactions = None
+        else:
+            _apply_tx_ops(data.setdefault("transactions", []), tx_ops)
+    if torn and limit is None:
+        try:
+            with open(jp, "r+b") as f:
+                f.truncate(good)
+        except OSError:
+            pass
+    data["_journal_seq"] = last
+    return data
+
+class LedgerJournal:
+    # JSON 后端的追加式日志 ledger.journal：ledger.json 为快照，每次保存只追加本次改动（JSON Lines），读取时在快照上重放
+    # 顶层键按序列化文本比对，变了才整键记一条；账单只记 TxList 的待写增删；日志超过阈值后在后台折叠成新快照
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._path = None
+        self._txs = None
+        self._sigs = {}
+        self._seq = 0
+        self._gen = 0
+        self._owner = None
+        self._compacting = False
+
+    def adopt(self, state: Dict, path: str):
+        seq = int(state.pop("_journal_seq", 0) or 0)
+        with self._lock:
+            self._gen += 1
+            self._path = None
+            self._txs = None
+            self._sigs = {}
+            self._seq = seq
+            self._owner = None
+            if ((state.get("prefs", {}) or {}).get("storage_backend") or "sqlite") == "json":
+                self._path = path
+                self._owner = state
+                # 账单尚未载入时以首次载入的列表为基线
+                self._txs = state.get("transactions") if _tx_loaded(state) else None
+                self._sigs = {k: _dumps(v) for k, v in state.items() if k != "transactions"}
+                if getattr(state, "legacy_layout", False) and not self._compacting:
+                    # JSON 后端平时只追加日志，旧布局快照在后台改写一次，之后启动即可延迟解析账单
+                    self._compacting = True
+                    threading.Thread(target=self._compact_bg, args=(path, True), daemon=True).start()
+
+    def append(self, state: Dict, path: str) -> bool:
+        # 返回 False 表示需要整份写快照（首次保存、账单列表被整体替换、写日志失败等）
+        with self._lock:
+            if path != self._path:
+                return False
+            txs = None
+            if _tx_loaded(state):
+                txs = state.get("transactions")
+                if self._txs is None and state is self._owner:
+                    self._txs = txs
+                if not isinstance(txs, TxList) or txs is not self._txs:
+                    return False
+            elif state is not self._owner:
+                return False
+            seq = self._seq
+            sigs = {}
+            lines = []
+            for k, v in state.items():
+                if k == "transactions":
+                    continue
+                text = _dumps(v)
+                if self._sigs.get(k) != text:
+                    seq += 1
+                    sigs[k] = text
+                    lines.append(f'{{"seq":{seq},"op":"set","key":{_dumps(k)},"value":{text}}}')
+            gone = [k for k in self._sigs if k not in state]
+            for k in gone:
+                seq += 1
+                lines.append(_dumps({"seq": seq, "op": "del", "key": k}))
+            ups, dels = txs.take_pending() if txs is not None else ([], [])
+            if ups or dels:
+                seq += 1
+                lines.append(_dumps({"seq": seq, "op": "tx", "upsert": ups, "delete": dels}))
+            if not lines:
+                return True
+            jp = _journal_path(path)
+            try:
+                with open(jp, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                    size = f.tell()
+            except OSError:
+                return False
+            self._seq = seq
+            self._sigs.update(sigs)
+            for k in gone:
+                self._sigs.pop(k, None)
+            if size >= JOURNAL_COMPACT_BYTES and not self._compacting:
+                self._compacting = True
+                threading.Thread(target=self._compact_bg, args=(path,), daemon=True).start()
+            return True
+
+    def snapshot(self, state: Dict, path: str):
+        # 整份写紧凑快照（临时文件 + fsync + 改名）并清空日志
+        with self._lock:
+            txs = _tx_list(state)
+            txs.take_pending()
+            if path != self._path:
+                self._seq = 0
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                _dump_ledger(f, state, extra={"_journal_seq": self._seq})
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            try:
+                os.remove(_journal_path(path))
+            except OSError:
+                pass
+            self._gen += 1
+            self._path = path
+            self._owner = state
+            self._txs = txs
+            self._sigs = {k: _dumps(v) for k, v in state.items() if k != "transactions"}
+
+    def discard(self, path: str):
+        # 非 JSON 后端整份写出 ledger.json 后，旧日志已无意义
+        with self._lock:
+            self._path = None
+            self._txs = None
+            try:
+                os.remove(_journal_path(path))
+            except OSError:
+                pass
+
+    def compact(self, path: str = None, force: bool = False):
+        # 把日志折叠进新快照：锁外从磁盘读快照并重放、写临时文件，锁内只做改名与日志截断
+        path = path or self._path or get_current_ledger_path()
+        jp = _journal_path(path)
+        with self._compact_lock:
+            with self._lock:
+                has_journal = os.path.isfile(jp)
+                if not has_journal and not force:
+                    return False
+                gen = self._gen
+                seq = self._seq if path == self._path else None
+                end = os.path.getsize(jp) if has_journal else 0
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            data = _replay_journal(path, data, limit=end)
+            if seq is None:
+                seq = data["_journal_seq"]
+            data["_journal_seq"] = seq
+            tmp = path + ".compact"
+            with open(tmp, "w", encoding="utf-8") as f:
+                _dump_ledger(f, data)
+                f.flush()
+                os.fsync(f.fileno())
+            with self._lock:
+                if gen != self._gen:
+                    # 期间已整份写过快照，本次折叠作废
+                    os.remove(tmp)
+                    return False
+                os.replace(tmp, path)
+                rest = b""
+                if os.path.isfile(jp):
+                    with open(jp, "rb") as f:
+                        f.seek(end)
+                        rest = f.read()
+                if rest:
+                    with open(jp + ".tmp", "wb") as f:
+                        f.write(rest)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(jp + ".tmp", jp)
+                elif os.path.isfile(jp):
+                    os.remove(jp)
+            # 锁外刷新缓存签名：LedgerStore.get 持有缓存锁时会调用 adopt 取本锁，锁内调用会互相等待
+            _ledger_store.touch(path)
+            return True
+
+    def _compact_bg(self, path: str, force: bool = False):
+        try:
+            self.compact(path, force)
+        except Exception:
+            pass
+        finally:
+            self._compacting = False
+
+_journal = LedgerJournal()
+
+def compact_journal() -> bool:
+    _writer.flush()
+    # 同步折叠当前账本的日志（备份、复制账本文件前调用）
+    return _journal.compact(get_current_ledger_path())
+
+class LedgerStore:
+    # 进程内账本缓存：共享同一份解析结果，仅在文件 mtime/size 或内部版本号变化时重新解析
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._state = None
+        self._path = None
+        self._sig = None
+        self._version = 0
+        self._loaded_version = -1
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get(self) -> Dict:
+        ensure_dirs()
+        path = get_current_ledger_path()
+        with self._lock:
+            if not os.path.isfile(path):
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(default_state(), f, ensure_ascii=False, indent=2)
+            sig = _ledger_sig(path)
+            # 后台写盘未完成时文件签名尚未更新，内存对象即最新内容
+            if self._state is not None and self._path == path and self._loaded_version == self._version and (self._sig == sig or _writer.pending(path)):
+                return self._state
+            self._state = _read_state(path)
+            self._path = path
+            self._sig = sig
+            self._loaded_version = self._version
+            # 先登记快照再接入数据库，连接初始化时读取 prefs 不会递归重读
+            _attach_transactions(self._state)
+            _journal.adopt(self._state, path)
+            _migrate_openings(self._state)
+            return self._state
+
+    def put(self, state: Dict, path: str):
+        # 保存后直接以内存对象作为新快照，避免下次读取再解析一次
+        with self._lock:
+            self._version += 1
+            self._state = state
+            self._path = path
+            self._sig = _ledger_sig(path)
+            self._loaded_version = self._version
+
+    def touch(self, path: str):
+        # 日志折叠改写了文件但内容未变，只刷新文件签名
+        with self._lock:
+            if self._path == path:
+                self._sig = _ledger_sig(path)
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+
+    def batch(self, state: Dict = None, save: bool = True, label: str = None) -> "LedgerBatch":
+        return LedgerBatch(state if state is not None else self.get(), save, label)
+
+def _state_checkpoint(state: Dict):
+    # 写库失败时撤回内存改动用：各账户的余额与期初值、交易列表内容及待写标记
+    accs = [(a, {k: a[k] for k in ("balance", "opening_balance") if k in a}) for a in state.get("accounts", [])]
+    txs = _tx_list(state)
+    return accs, txs, txs.checkpoint()
+
+def _state_restore(state: Dict, cp):
+    accs, txs, tcp = cp
+    for a, vals in accs:
+        a.pop("opening_balance", None)
+        a.update(vals)
+    txs.restore(tcp)
+
+class LedgerBatch:
+    # 批量修改单元：累积增删改与余额变动，退出 with 时一次重建列表、一次事务批量写库、保存一次；出错则全部放弃
+    # 指定 label 时提交同时写入操作日志（被删行、改动前字段值、余额变动），可用 undo_last()/redo() 撤销重做
+    DELETE_CHUNK = 500
+
+    def __init__(self, state: Dict, save: bool = True, label: str = None):
+        self.state = state
+        self.save = save
+        self.label = label
+        self._adds = {}
+        self._updates = {}
+        self._deletes = set()
+        self._deltas = []
+        self._orig = {}
+        self._rebalance = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def get(self, tx_id: str):
+        # 返回批内最新版本
+        if tx_id in self._deletes:
+            return None
+        if tx_id in self._updates:
+            return self._updates[tx_id]
+        if tx_id in self._adds:
+            return self._adds[tx_id]
+        return get_transaction(self.state, tx_id)
+
+    def add(self, t, apply_delta: bool = True):
+        t = t.to_dict() if hasattr(t, "to_dict") else t
+        self._adds[t.get("id")] = t
+        if apply_delta:
+            self._deltas.append((t, 1))
+        return t
+
+    def _remember(self, tx_id: str, old: Dict):
+        # 记下批次开始前的原行，供操作日志生成逆操作
+        if self.label is not None and tx_id not in self._adds and tx_id not in self._orig:
+            self._orig[tx_id] = old
+
+    def update(self, tx_id: str, new, apply_delta: bool = True) -> bool:
+        new = new.to_dict() if hasattr(new, "to_dict") else new
+        old = self.get(tx_id)
+        if old is None:
+            return False
+        self._remember(tx_id, old)
+        if apply_delta:
+            self._deltas.append((old, -1))
+            self._deltas.append((new, 1))
+        if tx_id in self._adds:
+            self._adds[tx_id] = new
+        else:
+            self._updates[tx_id] = new
+        return True
+
+    def delete(self, tx_id: str, apply_delta: bool = True) -> bool:
+        old = self.get(tx_id)
+        if old is None:
+            return False
+        self._remember(tx_id, old)
+        if apply_delta:
+            self._deltas.append((old, -1))
+        if tx_id in self._adds:
+            del self._adds[tx_id]
+        else:
+            self._updates.pop(tx_id, None)
+            self._deletes.add(tx_id)
+        return True
+
+    def delta(self, t: Dict, sign: int):
+        self._deltas.append((t, sign))
+
+    def clear(self):
+        # 删除全部现有账单（不计余额变动，通常随后调用 rebalance()）
+        for t in list(_tx_list(self.state)):
+            self.delete(t.get("id"), apply_delta=False)
+        for tx_id in list(self._adds):
+            del self._adds[tx_id]
+
+    def rebalance(self):
+        # 提交时按批次后的全部账单重算账户余额（冻结资产时不改）
+        self._rebalance = True
+
+    def _apply_rebalance(self, conn=None):
+        # 清空后整体导入的口径：余额从零累加，期初余额随之归零
+        res = recompute_balances(self.state, apply=False, opening={})
+        if res["frozen"]:
+            return
+        for a in self.state.get("accounts", []):
+            a["opening_balance"] = 0.0
+        if not res["diff"]:
+            return
+        for a in self.state.get("accounts", []):
+            if a.get("name") in res["diff"]:
+                a["balance"] = res["balances"][a.get("name")]
+        if conn is not None:
+            conn.executemany("UPDATE accounts SET balance=? WHERE name=?", [(res["balances"][n], n) for n in res["diff"]])
+
+    def _op_payload(self, before: Dict[str, float], openings: Dict[str, Optional[float]]) -> Dict:
+        updated = []
+        for tx_id, new in self._updates.items():
+            old = self._orig.get(tx_id) or {}
+            keys = [k for k in set(old) | set(new) if old.get(k) != new.get(k)]
+            if keys:
+                updated.append([tx_id, {k: old.get(k) for k in keys}, {k: new.get(k) for k in keys}])
+        after = _account_balances(self.state)
+        balances = {}
+        for name in set(before) | set(after):
+            d = round(after.get(name, 0.0) - before.get(name, 0.0), 2)
+            if d:
+                balances[name] = d
+        # 期初余额（如覆盖导入从零重算时归零）记下改动前后的值，撤销/重做时整体替换
+        changed = {}
+        for a in self.state.get("accounts", []):
+            name = a.get("name")
+            if name in openings and openings[name] != a.get("opening_balance"):
+                changed[name] = [openings[name], a.get("opening_balance")]
+        return {
+            "added": list(self._adds.values()),
+            "deleted": [self._orig[tx_id] for tx_id in self._deletes if tx_id in self._orig],
+            "updated": updated,
+            "balances": balances,
+            "openings": changed,
+        }
+
+    def commit(self):
+        s = self.state
+        if not (self._adds or self._updates or self._deletes or self._deltas or self._rebalance):
+            if self.save:
+                save_state(s)
+            return
+        cp = _state_checkpoint(s)
+        try:
+            self._commit_rows(s)
+        except BaseException:
+            # 数据库事务已回滚，内存中的余额与列表一并还原，避免下次保存写出与库不一致的状态
+            _state_restore(s, cp)
+            raise
+        self._adds = {}
+        self._updates = {}
+        self._deletes = set()
+        self._deltas = []
+        self._orig = {}
+        self._rebalance = False
+        if self.save:
+            save_state(s)
+
+    def _commit_rows(self, s: Dict):
+        before = _account_balances(s) if self.label is not None else None
+        openings = {a.get("name"): a.get("opening_balance") for a in s.get("accounts", [])} if self.label is not None else None
+        for t, sign in self._deltas:
+            apply_transaction_delta(s, t, sign)
+        txs = _tx_list(s)
+        if self._updates or self._deletes:
+            rows = [self._updates.get(t.get("id"), t) for t in txs if t.get("id") not in self._deletes]
+            rows.extend(self._adds.values())
+        else:
+            rows = list(txs) + list(self._adds.values())
+        txs.replace_synced(rows)
+        if _uses_sqlite():
+            with db_transaction() as conn:
+                ids = list(self._deletes)
+                for i in range(0, len(ids), self.DELETE_CHUNK):
+                    chunk = ids[i:i + self.DELETE_CHUNK]
+                    conn.execute(f"DELETE FROM transactions WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+                if self._updates:
+                    conn.executemany(_TX_UPDATE_SQL, [_tx_row(d)[1:] + (tx_id,) for tx_id, d in self._updates.items()])
+                if self._adds:
+                    conn.executemany(_TX_INSERT_SQL, [_tx_row(d) for d in self._adds.values()])
+                if self._rebalance:
+                    self._apply_rebalance(conn)
+                # 操作日志与账单改动同一事务提交
+                if self.label is not None:
+                    _op_log_insert(conn, self.label, self._op_payload(before, openings))
+        else:
+            # JSON 后端由日志记下本批改动
+            for d in list(self._updates.values()) + list(self._adds.values()):
+                txs.mark_dirty(d)
+            txs.mark_deleted(self._deletes)
+            if self._rebalance:
+                self._apply_rebalance()
+            if self.label is not None:
+                with db_transaction() as conn:
+                    _op_log_insert(conn, self.label, self._op_payload(before, openings))
+
+_ledger_store = LedgerStore()
+
+# 操作日志：撤销/重做栈存于账本数据库 op_log 表，最多保留 OP_LOG_KEEP 条
+OP_LOG_KEEP = 50
+
+def _account_balances(state: Dict) -> Dict[str, float]:
+    return {a.get("name"): float(a.get("balance", 0) or 0) for a in state.get("accounts", [])}
+
+def _op_log_insert(conn, label: str, payload: Dict):
+    rows = len(payload["added"]) + len(payload["deleted"]) + len(payload["updated"])
+    blob = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+    # 新操作使已撤销的分支失效
+    conn.execute("DELETE FROM op_log WHERE undone=1")
+    conn.execute("INSERT INTO op_log(created, label, rows, undone, payload) VALUES(?,?,?,0,?)",
+                 (datetime.now().isoformat(timespec="seconds"), label, rows, sqlite3.Binary(blob)))
+    conn.execute("DELETE FROM op_log WHERE seq <= (SELECT max(seq) FROM op_log) - ?", (OP_LOG_KEEP,))
+
+def list_operations(limit: int = OP_LOG_KEEP) -> List[Dict]:
+    # 操作历史，新的在前；不读取 payload
+    rows = _db().execute("SELECT seq, created, label, rows, undone, length(payload) FROM op_log ORDER BY seq DESC LIMIT ?", (int(limit),)).fetchall()
+    return [{"seq": r[0], "created": r[1], "label": r[2], "rows": r[3], "undone": bool(r[4]), "bytes": r[5]} for r in rows]
+
+def _op_log_apply(s: Dict, payload: Dict, undo: bool):
+    # 撤销：删除新增行、还原改动前字段、插回被删行、扣回余额变动并还原期初余额；重做反之
+    # 行已被其它操作删除或已存在时跳过该行，不中断整体
+    sign = -1 if undo else 1
+    # 余额调整也放在批内；由调用方在外层事务提交后再保存
+    with LedgerBatch(s, save=False) as b:
+        added = payload.get("added") or []
+        deleted = payload.get("deleted") or []
+        for t in (added if undo else deleted):
+            b.delete(t.get("id"), apply_delta=False)
+        for tx_id, old, new in payload.get("updated") or []:
+            cur = b.get(tx_id)
+            if cur is not None:
+                b.update(tx_id, dict(cur, **(old if undo else new)), apply_delta=False)
+        for t in (deleted if undo else added):
+            if b.get(t.get("id")) is None:
+                b.add(dict(t), apply_delta=False)
+        deltas = payload.get("balances") or {}
+        for a in s.get("accounts", []):
+            d = deltas.get(a.get("name"))
+            if d:
+                a["balance"] = round(float(a.get("balance", 0) or 0) + sign * d, 2)
+        for name, (old, new) in (payload.get("openings") or {}).items():
+            a = find_account(s, name)
+            if a is not None:
+                a["opening_balance"] = old if undo else new
+
+def _op_log_step(undo: bool) -> Optional[Dict]:
+    conn = _db()
+    if undo:
+        r = conn.execute("SELECT seq, label, rows, payload FROM op_log WHERE undone=0 ORDER BY seq DESC LIMIT 1").fetchone()
+    else:
+        r = conn.execute("SELECT seq, label, rows, payload FROM op_log WHERE undone=1 ORDER BY seq ASC LIMIT 1").fetchone()
+    if r is None:
+        return None
+    payload = json.loads(zlib.decompress(r[3]).decode("utf-8"))
+    s = load_state()
+    cp = _state_checkpoint(s)
+    try:
+        with db_transaction() as c:
+            # 先改标记开启事务，批次的数据库写入并入同一事务一起提交
+            c.execute("UPDATE op_log SET undone=? WHERE seq=?", (1 if undo else 0, r[0]))
+            _op_log_apply(s, payload, undo)
+    except BaseException:
+        # 事务回滚时内存中的账单与余额一并还原
+        _state_restore(s, cp)
+        raise
+    save_state(s)
+    return {"seq": r[0], "label": r[1], "rows": r[2]}
+
+def undo_last() -> Optional[Dict]:
+    # 撤销最近一次未撤销的操作，返回 {"seq", "label", "rows"}；没有可撤销的操作时返回 None
+    return _op_log_step(True)
+
+def redo() -> Optional[Dict]:
+    # 重做最近一次撤销的操作
+    return _op_log_step(False)
+
+# 流式导入每块提交的条数
+IMPORT_CHUNK_ROWS = 2000
+
+def _import_seen_db(chunk: List[Dict]) -> set:
+    # 只取与本块同一秒的已有账单计算签名（走 ts 索引），不把全部账单签名读进内存
+    from utils import tx_signature
+    keys = {k for k in (_time_keys(t.get("time"))[0] for t in chunk) if k is not None}
+    seen = set()
+    if not keys:
+        return seen
+    sql = f"SELECT time, amount, note FROM transactions WHERE ts IN ({','.join('?' * len(keys))})"
+    for tm, amt, note in _db().execute(sql, list(keys)):
+        try:
+            seen.add(tx_signature({"time": tm, "amount": amt, "note": note}))
+        except Exception:
+            pass
+    return seen
+
+def import_transactions(rows, state: Dict = None, chunk_size: int = IMPORT_CHUNK_ROWS, prepare=None, progress=None) -> Dict:
+    # 流式导入：逐块查重（与已有账单及本次已导入的按 tx_signature 比较）、每块一个 LedgerBatch 提交并计入余额
+    # prepare(row) 在查重前补全字段，返回 None 跳过该行；progress(stats) 每提交一块调用一次
+    # rows 迭代中抛错（如映射失败）时删除本次已提交的块并回滚余额，再原样抛出
+    # 返回 stats：read、imported、duplicates、duplicate_rows（重复行，供导出）、elapsed_ms
+    from utils import tx_signature
+    s = state if state is not None else load_state()
+    stats = {"read": 0, "imported": 0, "duplicates": 0, "duplicate_rows": []}
+    t0 = time.perf_counter()
+    ids = []
+    mem_seen = None
+    chunk = []
+
+    def commit_chunk():
+        nonlocal mem_seen
+        if _uses_sqlite():
+            seen = _import_seen_db(chunk)
+        else:
+            if mem_seen is None:
+                mem_seen = set()
+                for t in _tx_list(s):
+                    try:
+                        mem_seen.add(tx_signature(t))
+                    except Exception:
+                        pass
+            seen = mem_seen
+        fresh = []
+        for r in chunk:
+            sig = tx_signature(r)
+            if sig in seen:
+                stats["duplicates"] += 1
+                stats["duplicate_rows"].append(r)
+                continue
+            seen.add(sig)
+            fresh.append(r)
+        if fresh:
+            with get_ledger_store().batch(s) as b:
+                for r in fresh:
+                    b.add(r)
+            ids.extend(r.get("id") for r in fresh)
+            stats["imported"] += len(fresh)
+        chunk.clear()
+        stats["elapsed_ms"] = (time.perf_counter() - t0) * 1000.0
+        if progress is not None:
+            progress(stats)
+
+    try:
+        for r in rows:
+            stats["read"] += 1
+            if prepare is not None:
+                r = prepare(r)
+                if r is None:
+                    continue
+            chunk.append(r)
+            if len(chunk) >= chunk_size:
+                commit_chunk()
+        if chunk:
+            commit_chunk()
+    except BaseException:
+        if ids:
+            with get_ledger_store().batch(s) as b:
+                for tx_id in ids:
+                    b.delete(tx_id)
+        raise
+    stats["elapsed_ms"] = (time.perf_counter() - t0) * 1000.0
+    return stats
+
+def get_prefs_path() -> str:
+    # 每个账本目录（默认 data/，多用户时 data/users/<uid>/）一份 prefs.json
+    return os.path.join(os.path.dirname(os.path.abspath(get_current_ledger_path())), "prefs.json")
+
+def _merge_defaults(data: Dict, defaults: Dict):
+    for k, v in defaults.items():
+        if k not in data:
+            data[k] = copy.deepcopy(v)
+        elif isinstance(v, dict) and isinstance(data[k], dict):
+            _merge_defaults(data[k], v)
+
+class PrefsStore:
+    # 界面偏好的内存副本：读写不碰账本；拖动列宽等高频写入合并，停顿 DEBOUNCE_S 秒后原子写一次 prefs.json
+    DEBOUNCE_S = 0.5
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._path = None
+        self._data = None
+        self._timer = None
+        self._dirty = False
+        self._loading = None
+
+    def _ensure(self) -> Dict:
+        path = get_prefs_path()
+        if self._data is not None and self._path == path:
+            return self._data
+        if self._loading is not None:
+            # 迁移时读取账本会接入数据库并回头读取性能档位：返回正在组装的空副本，不重入迁移（档位随即回退到账本 prefs）
+            return self._loading
+        self.flush()
+        data = None
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = None
+        if not isinstance(data, dict):
+            self._loading = {}
+            try:
+                data = self._migrate(path)
+            finally:
+                self._loading = None
+        _merge_defaults(data, default_ui_prefs())
+        self._path = path
+        self._data = data
+        return data
+
+    def _migrate(self, path: str) -> Dict:
+        # 旧版界面偏好保存在 ledger.json 的 prefs 中：首次使用时搬到 prefs.json，并从账本中移除
+        data = {}
+        try:
+            s = load_state()
+            prefs = s.get("prefs") or {}
+            moved = [k for k in UI_PREF_KEYS if k in prefs]
+            for k in moved:
+                data[k] = prefs.pop(k)
+            ensure_dirs()
+            _write_json_atomic(path, data, indent=2)
+            if moved:
+                save_state(s)
+        except Exception:
+            pass
+        return data
+
+    def get(self, key: str, default=None):
+        # key 支持点号路径，如 "bill_list.column_widths"；返回副本，修改后需 set 回来
+        with self._lock:
+            cur = self._ensure()
+            for part in key.split("."):
+                if not isinstance(cur, dict) or part not in cur:
+                    return default
+                cur = cur[part]
+            return copy.deepcopy(cur)
+
+    def set(self, key: str, value, delay: float = None):
+        # delay 为 0 时立即写盘，否则在最后一次修改后 delay（默认 DEBOUNCE_S）秒写盘
+        with self._lock:
+            cur = self._ensure()
+            parts = key.split(".")
+            for part in parts[:-1]:
+                nxt = cur.get(part)
+                if not isinstance(nxt, dict):
+                    nxt = {}
+                    cur[part] = nxt
+                cur = nxt
+            cur[parts[-1]] = copy.deepcopy(value)
+            self._dirty = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if delay == 0:
+                self.flush()
+                return
+            self._timer = threading.Timer(self.DEBOUNCE_S if delay is None else delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty or self._data is None:
+                return
+            try:
+                ensure_dirs()
+                _write_json_atomic(self._path, self._data, indent=2)
+                self._dirty = False
+            except OSError:
+                pass
+
+_prefs_store = PrefsStore()
+atexit.register(_prefs_store.flush)
+
+def get_pref(key: str, default=None):
+    return _prefs_store.get(key, default)
+
+def set_pref(key: str, value, delay: float = None):
+    _prefs_store.set(key, value, delay)
+
+def flush_prefs():
+    _prefs_store.flush()
+
+def get_ledger_store() -> LedgerStore:
+    return _ledger_store
+
+def load_state() -> Dict:
+    return _ledger_store.get()
+
 def _default_invest_state() -> Dict:
     return {
         "accounts": [],
@@ -186,6 +1850,8 @@ def get_current_invest_ledger_path() -> str:
 def load_invest_state() -> Dict:
     ensure_dirs()
     path = get_current_invest_ledger_path()
+    # 投资账本每次从文件读取，先等本文件排队中的写入落盘
+    _writer.wait(path)
     if not os.path.isfile(path):
         with open(path, "w", encoding="utf-8") as f:
             json.dump(_default_invest_state(), f, ensure_ascii=False, indent=2)
@@ -199,17 +1865,17 @@ def load_invest_state() -> Dict:
 def save_invest_state(state: Dict):
     ensure_dirs()
     path = get_current_invest_ledger_path()
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+    t0 = time.perf_counter()
+    snap = copy.deepcopy(state)
+    errors = _writer.take_errors(path)
+    _writer.submit(path, lambda f: json.dump(snap, f, ensure_ascii=False, indent=2), (time.perf_counter() - t0) * 1000.0)
+    _raise_save_errors(errors, retried=True)
 
 def get_invest_account_names(state: Dict) -> List[str]:
     return [a.get("name") for a in state.get("accounts", [])]
 
 def find_invest_account(state: Dict, name: str) -> Dict:
-    for a in state.get("accounts", []):
-        if (a.get("name") or "") == name:
-            return a
-    return None
+    return _account_list(state).lookup(name)
 
 def add_invest_account(state: Dict, account: Dict):
     if find_invest_account(state, account.get("name")):
@@ -219,36 +1885,244 @@ def add_invest_account(state: Dict, account: Dict):
         "note": account.get("note", ""),
     })
 
-def remove_invest_account(state: Dict, name: str):
-    state["accounts"] = [a for a in state.get("accounts", []) if (a.get("name") or "") != name]
-    # 同时清理对应估值
-    vals = state.setdefault("valuations", {})
-    if name in vals:
-        try:
-            vals.pop(name)
-        except Exception:
-            pass
+def remove_invest_account(state: Dict, name: str):
+    state["accounts"] = [a for a in state.get("accounts", []) if (a.get("name") or "") != name]
+    # 同时清理对应估值
+    vals = state.setdefault("valuations", {})
+    if name in vals:
+        try:
+            vals.pop(name)
+        except Exception:
+            pass
+
+def set_account_valuation(state: Dict, name: str, value: float, date: str):
+    state.setdefault("valuations", {})[name] = {"value": float(value), "date": date}
+
+def get_account_valuation(state: Dict, name: str) -> Dict:
+    return (state.get("valuations") or {}).get(name) or {}
+
+_TX_UPSERT_SQL = _TX_INSERT_SQL.replace("INSERT OR IGNORE", "INSERT") + " ON CONFLICT(id) DO UPDATE SET " + ",".join(f"{c}=excluded.{c}" for c in _TX_COLUMNS if c != "id")
+
+def _flush_transactions(state: Dict):
+    txs = state.get("transactions")
+    if txs is None:
+        return
+    db_path = get_current_db_path()
+    if isinstance(txs, TxList) and txs.db_path == db_path:
+        ups, dels = txs.take_pending()
+        if not ups and not dels:
+            return
+        with db_transaction() as conn:
+            if dels:
+                conn.executemany("DELETE FROM transactions WHERE id=?", [(i,) for i in dels])
+            if ups:
+                conn.executemany(_TX_UPSERT_SQL, [_tx_row(t) for t in ups])
+        return
+    # 列表被整体替换（如清空重导）或换了账本路径：按内容重建
+    with db_transaction() as conn:
+        conn.execute("DELETE FROM transactions")
+        conn.executemany(_TX_INSERT_SQL, [_tx_row(t) for t in txs])
+    state["transactions"] = TxList(txs, db_path)
+
+class LedgerSaveError(OSError):
+    pass
+
+class BackgroundWriter:
+    # 后台写盘线程：调用方只在本线程取快照并排队，立即返回；同一文件排队中的旧快照被新快照替换，连续保存只写最新一份
+    # 每次写临时文件、fsync 后 os.replace，写到一半崩溃不会损坏原文件
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._busy = set()
+        self._thread = None
+        self._observer = None
+        # 各文件最近一次写盘失败的信息，之后写成功即清除；由 take_errors 取走交给调用方
+        self._errors = {}
+        self.stats = {"saves": 0, "writes": 0, "last_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0, "error": None}
+
+    def submit(self, path: str, write, snapshot_ms: float = 0.0):
+        # write(f) 向文本文件对象写出快照；耗时从同一轮合并中最早一次保存算起
+        with self._cond:
+            old = self._jobs.get(path)
+            if old is not None:
+                self._jobs[path] = (write, old[1], old[2] + snapshot_ms, old[3] + 1)
+            else:
+                self._jobs[path] = (write, time.perf_counter(), snapshot_ms, 1)
+            self.stats["saves"] += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def pending(self, path: str) -> bool:
+        with self._cond:
+            return path in self._jobs or path in self._busy
+
+    def wait(self, path: str, timeout: float = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: path not in self._jobs and path not in self._busy, timeout)
+
+    def flush(self, timeout: float = None) -> bool:
+        # 等待全部排队写入落盘（退出程序、复制或还原账本文件前调用）
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._jobs and not self._busy, timeout)
+
+    def take_errors(self, path: str = None) -> List[str]:
+        with self._cond:
+            if path is None:
+                errs = list(self._errors.values())
+                self._errors.clear()
+                return errs
+            err = self._errors.pop(path, None)
+            return [err] if err else []
 
-def set_account_valuation(state: Dict, name: str, value: float, date: str):
-    state.setdefault("valuations", {})[name] = {"value": float(value), "date": date}
+    def set_observer(self, fn):
+        # fn(path, 保存到落盘毫秒数, 合并的保存次数, 主线程取快照毫秒数, 错误信息或 None)，在写盘线程中调用
+        self._observer = fn
 
-def get_account_valuation(state: Dict, name: str) -> Dict:
-    return (state.get("valuations") or {}).get(name) or {}
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    self._cond.wait()
+                path = next(iter(self._jobs))
+                write, submitted, snapshot_ms, merged = self._jobs.pop(path)
+                self._busy.add(path)
+            error = None
+            try:
+                tmp = path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    write(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, path)
+            except Exception as e:
+                error = f"{os.path.basename(path)}: {e}"
+            # 锁外刷新缓存签名：LedgerStore.get 持有缓存锁时会查询 pending
+            _ledger_store.touch(path)
+            ms = (time.perf_counter() - submitted) * 1000.0
+            with self._cond:
+                self._busy.discard(path)
+                st = self.stats
+                st["writes"] += 1
+                st["last_ms"] = ms
+                st["max_ms"] = max(st["max_ms"], ms)
+                st["total_ms"] += ms
+                if error:
+                    st["error"] = error
+                    self._errors[path] = error
+                else:
+                    self._errors.pop(path, None)
+                self._cond.notify_all()
+            fn = self._observer
+            if fn is not None:
+                try:
+                    fn(path, ms, merged, snapshot_ms, error)
+                except Exception:
+                    pass
+
+_writer = BackgroundWriter()
+atexit.register(_writer.flush)
+
+def _raise_save_errors(errors: List[str], retried: bool = False):
+    if errors:
+        raise LedgerSaveError(("上次保存失败，已重新提交保存：" if retried else "保存失败：") + "；".join(errors))
+
+def flush_saves(timeout: float = None) -> bool:
+    # 等待排队写入落盘；期间有写盘失败时抛出 LedgerSaveError
+    done = _writer.flush(timeout)
+    _raise_save_errors(_writer.take_errors())
+    return done
+
+def get_save_stats() -> Dict:
+    with _writer._cond:
+        return dict(_writer.stats, pending=len(_writer._jobs) + len(_writer._busy))
+
+def set_save_observer(fn):
+    _writer.set_observer(fn)
+
+def _ledger_snapshot(state: Dict, with_transactions: bool = True) -> Tuple[Dict, Optional[bytes]]:
+    # 供后台写盘的快照：配置部分深拷贝（体积小），账单行只复制列表，未载入时沿用原文字节
+    # 账单行不得原地修改，需改字段时用 replace_transaction_fields / _replace_row 整行替换
+    snap = {k: copy.deepcopy(v) for k, v in dict.items(state) if k != "transactions"}
+    raw = None
+    if with_transactions:
+        if isinstance(state, LedgerState) and not state.tx_loaded():
+            raw = state.raw_transactions
+        else:
+            snap["transactions"] = list(state.get("transactions", []))
+    return snap, raw
 
 def save_state(state: Dict):
     ensure_dirs()
     path = get_current_ledger_path()
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+    backend = ((state.get("prefs", {}) or {}).get("storage_backend") or "sqlite")
+    if backend == "json":
+        # JSON 后端只向 ledger.journal 追加本次改动，无法增量时整份写紧凑快照；先等切换后端前排队的整份写入落盘
+        _writer.wait(path)
+        errors = _writer.take_errors(path)
+        if not _journal.append(state, path):
+            _journal.snapshot(state, path)
+        _ledger_store.put(state, path)
+        _raise_save_errors(errors, retried=True)
+        return
+    if _tx_loaded(state):
+        _flush_transactions(state)
+    t0 = time.perf_counter()
+    # sqlite_only 账单以数据库为准，JSON 只写配置
+    with_tx = backend != "sqlite_only"
+    snap, raw = _ledger_snapshot(state, with_tx)
+    # 后台写盘失败不会丢在线程里：先取走之前的失败，本次整份快照排队后抛给调用方；之后的失败由下次保存或 flush_saves 报告
+    errors = _writer.take_errors(path)
+    _writer.submit(path, lambda f: _dump_ledger(f, snap, indent=2, with_transactions=with_tx, raw=raw), (time.perf_counter() - t0) * 1000.0)
+    _journal.discard(path)
+    _ledger_store.put(state, path)
+    _raise_save_errors(errors, retried=True)
 
-def migrate_json_to_sqlite():
-    _init_db()
+def migrate_to_sqlite_only() -> int:
+    # 一次性迁移：账单全部写入 SQLite 后，ledger.json 只保留账户、类别、偏好等配置
     s = load_state()
-    conn = _db()
-    cur = conn.cursor()
-    for t in s.get("transactions", []):
-        cur.execute("INSERT OR IGNORE INTO transactions(id, time, amount, category, ttype, account, to_account, from_account, note, record_time, record_source) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
-                    (t.get("id"), t.get("time"), float(t.get("amount",0)), t.get("category"), t.get("ttype"), t.get("account"), t.get("to_account"), t.get("from_account"), t.get("note"), t.get("record_time"), t.get("record_source")))
+    prefs = s.setdefault("prefs", {})
+    if prefs.get("storage_backend") == "sqlite_only":
+        return 0
+    backup_state()
+    rows = list(s.get("transactions", []))
+    with db_transaction() as conn:
+        conn.execute("DELETE FROM transactions")
+        conn.executemany(_TX_INSERT_SQL, [_tx_row(t) for t in rows])
+    s["transactions"] = TxList(rows, get_current_db_path())
+    prefs["storage_backend"] = "sqlite_only"
+    save_state(s)
+    return len(rows)
+
+def export_ledger_json(path: str = None) -> str:
+    # 导出包含全部账单的完整 JSON（与旧版 ledger.json 格式一致），账单逐条流式写出
+    ensure_dirs()
+    if not path:
+        path = os.path.join(get_export_dir(), f"ledger_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    s = load_state()
+    conf = {k: v for k, v in s.items() if k != "transactions"}
+    prefs = dict(conf.get("prefs", {}) or {})
+    if prefs.get("storage_backend") == "sqlite_only":
+        prefs["storage_backend"] = "sqlite"
+    conf["prefs"] = prefs
+    if _get_backend() == "sqlite_only":
+        rows = iter_transactions(as_dict=True)
+    else:
+        rows = iter(s.get("transactions", []))
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("{" + json.dumps("_layout") + ": " + json.dumps(_LAYOUT_MARK) + ",\n")
+        for k, v in conf.items():
+            f.write(json.dumps(k, ensure_ascii=False) + ": " + json.dumps(v, ensure_ascii=False) + ",\n")
+        f.write('"transactions": [')
+        for i, t in enumerate(rows):
+            f.write((",\n" if i else "\n") + json.dumps(t, ensure_ascii=False))
+        f.write("\n]}\n")
+    os.replace(tmp, path)
+    return path
+
+def _write_config_tables(cur, s: Dict):
     for a in s.get("accounts", []):
         cur.execute("INSERT OR REPLACE INTO accounts(name, balance, type, note, bank, last4, credit_limit, status, bill_day, repay_day, repay_offset) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
                     (a.get("name"), float(a.get("balance",0)), a.get("type"), a.get("note"), a.get("bank"), a.get("last4"), float(a.get("limit",0)), a.get("status"), int(a.get("bill_day",0) or 0), int(a.get("repay_day",0) or 0), int(a.get("repay_offset",0) or 0)))
@@ -262,33 +2136,352 @@ def migrate_json_to_sqlite():
             cur.execute("INSERT OR IGNORE INTO category_rules(scene, keyword, category) VALUES(?,?,?)", (scene, it.get("keyword"), it.get("category")))
     for name in s.get("record_sources", []) or []:
         cur.execute("INSERT OR IGNORE INTO record_sources(name) VALUES(?)", (name,))
-    conn.commit()
-    conn.close()
+
+def migrate_json_to_sqlite():
+    s = load_state()
+    with db_transaction() as conn:
+        cur = conn.cursor()
+        cur.executemany(_TX_INSERT_SQL, [_tx_row(t) for t in s.get("transactions", [])])
+        _write_config_tables(cur, s)
     s.setdefault("prefs", {})["storage_backend"] = "sqlite"
     save_state(s)
 
-def backup_state():
-    ensure_dirs()
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    # 备份文件名包含用户ID（若由用户路径推断得到）
-    cur = get_current_ledger_path()
+# 备份：内容寻址、压缩的增量备份
+# objects/<前两位>/<sha256> 存 zlib 压缩的分块，内容相同的分块只存一份；manifests/ 下每次备份写一份小清单
+# 分块为账本配置（transactions 之外的各键）与按交易月份划分的账单；未改动的月份沿用已有分块，目录只随改动增长
+BACKUP_OBJECT_DIR = os.path.join(BACKUP_DIR, "objects")
+BACKUP_MANIFEST_DIR = os.path.join(BACKUP_DIR, "manifests")
+# 保留策略：最近 last 份，另保留最近 daily 个有备份日子、weekly 个有备份周各自的最后一份
+BACKUP_RETENTION_DEFAULT = {"last": 10, "daily": 7, "weekly": 4}
+_backup_lock = threading.Lock()
+
+def _backup_tag(path: str) -> str:
+    # 清单文件名包含用户ID（若由用户路径推断得到）
     try:
-        uid = None
-        if cur.startswith(USER_DIR):
-            parts = os.path.normpath(cur).split(os.sep)
+        if path.startswith(USER_DIR):
+            parts = os.path.normpath(path).split(os.sep)
             # .../data/users/<uid>/ledger.json
             for i, p in enumerate(parts):
                 if p == "users" and i + 1 < len(parts):
-                    uid = parts[i + 1]
-                    break
-        suffix = (f"_{uid}" if uid else "")
+                    return f"ledger_{parts[i + 1]}"
     except Exception:
-        suffix = ""
-    path = os.path.join(BACKUP_DIR, f"ledger{suffix}_{ts}.json")
-    with open(cur, "r", encoding="utf-8") as src:
-        with open(path, "w", encoding="utf-8") as dst:
-            dst.write(src.read())
-    return path
+        pass
+    return "ledger"
+
+def _object_path(h: str) -> str:
+    return os.path.join(BACKUP_OBJECT_DIR, h[:2], h)
+
+def _put_object(data: bytes) -> Tuple[str, int]:
+    # 返回 (摘要, 新写入的压缩字节数)；已存在的分块不再写
+    h = hashlib.sha256(data).hexdigest()
+    path = _object_path(h)
+    if os.path.isfile(path):
+        return h, 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    packed = zlib.compress(data, 6)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(packed)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return h, len(packed)
+
+def _get_object(h: str) -> bytes:
+    with open(_object_path(h), "rb") as f:
+        data = zlib.decompress(f.read())
+    if hashlib.sha256(data).hexdigest() != h:
+        raise ValueError(f"备份分块已损坏: {h}")
+    return data
+
+def _month_chunk(rows: List) -> bytes:
+    # 月内按 (时间, id) 排序后整体序列化，内容不变则摘要不变
+    # 数据库来源的行为按 _TX_FIELDS 排列的元组（清单 columns 记列名），JSON 来源的行为字典
+    if rows and isinstance(rows[0], dict):
+        rows = sorted(rows, key=lambda t: (str(t.get("time") or ""), str(t.get("id") or "")))
+    else:
+        rows = sorted(rows, key=lambda r: (r[1] or "", r[0] or ""))
+    return json.dumps(rows, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+def _backup_db_months(base_token, put_month, months: Dict) -> Tuple[str, bool]:
+    # 从数据库读取账单月份分块；库内令牌与上份清单一致时只重读 backup_dirty 记下的月份，否则整库重读
+    # 读取、清空脏表与换新令牌在同一写事务内完成，期间的其它写入要等备份读完
+    token = gen_id()
+    cols = ",".join(_TX_FIELDS)
+    with db_transaction() as conn:
+        cur = conn.cursor()
+        cur.row_factory = None
+        # 先执行一条写语句开启事务，之后的读取都落在同一快照上
+        cur.execute("INSERT OR IGNORE INTO backup_meta(k, v) VALUES('token', '')")
+        full = not base_token or cur.execute("SELECT v FROM backup_meta WHERE k='token'").fetchone()[0] != base_token
+        if full:
+            months.clear()
+            cur.execute(f"SELECT {cols}, coalesce(ym, 0) FROM transactions ORDER BY ym")
+            ym = None
+            rows = []
+            for r in cur:
+                if r[-1] != ym:
+                    if rows:
+                        put_month(ym, rows)
+                    ym, rows = r[-1], []
+                rows.append(r[:-1])
+            if rows:
+                put_month(ym, rows)
+        else:
+            for (ym,) in cur.execute("SELECT ym FROM backup_dirty").fetchall():
+                if ym:
+                    res = cur.execute(f"SELECT {cols} FROM transactions WHERE ym=?", (ym,)).fetchall()
+                else:
+                    res = cur.execute(f"SELECT {cols} FROM transactions WHERE ym IS NULL").fetchall()
+                put_month(ym, res)
+        cur.execute("DELETE FROM backup_dirty")
+        cur.execute("UPDATE backup_meta SET v=? WHERE k='token'", (token,))
+    return token, full
+
+def _read_manifest(path: str) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def list_backups(ledger_path: str = None) -> List[Dict]:
+    # 指定（默认当前）账本的备份清单，新的在前；每项附带清单文件路径 path
+    ledger = os.path.abspath(ledger_path or get_current_ledger_path())
+    res = []
+    try:
+        names = os.listdir(BACKUP_MANIFEST_DIR)
+    except OSError:
+        return res
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(BACKUP_MANIFEST_DIR, name)
+        try:
+            m = _read_manifest(path)
+        except Exception:
+            continue
+        if m.get("ledger") != ledger:
+            continue
+        m["path"] = path
+        res.append(m)
+    res.sort(key=lambda m: (m.get("created") or "", m["path"]), reverse=True)
+    return res
+
+def _backup_retention(s: Dict) -> Dict:
+    pol = dict(BACKUP_RETENTION_DEFAULT)
+    conf = (s.get("prefs", {}) or {}).get("backup_retention") or {}
+    for k in pol:
+        try:
+            pol[k] = max(0, int(conf.get(k, pol[k])))
+        except (TypeError, ValueError):
+            pass
+    # 最新一份是下次增量的基准，始终保留
+    pol["last"] = max(1, pol["last"])
+    return pol
+
+def get_backup_retention() -> Dict:
+    return _backup_retention(load_state())
+
+def set_backup_retention(last: int = None, daily: int = None, weekly: int = None) -> Dict:
+    s = load_state()
+    pol = _backup_retention(s)
+    for k, v in (("last", last), ("daily", daily), ("weekly", weekly)):
+        if v is not None:
+            pol[k] = max(1 if k == "last" else 0, int(v))
+    s.setdefault("prefs", {})["backup_retention"] = pol
+    save_state(s)
+    with _backup_lock:
+        _prune_backups(os.path.abspath(get_current_ledger_path()), pol)
+    return pol
+
+def _prune_backups(ledger: str, pol: Dict) -> int:
+    items = list_backups(ledger)
+    keep = set()
+    days = set()
+    weeks = set()
+    for i, m in enumerate(items):
+        try:
+            dt = datetime.fromisoformat(m.get("created") or "")
+        except ValueError:
+            keep.add(m["path"])
+            continue
+        if i < pol["last"]:
+            keep.add(m["path"])
+        d = dt.date()
+        if d not in days and len(days) < pol["daily"]:
+            days.add(d)
+            keep.add(m["path"])
+        w = tuple(dt.isocalendar())[:2]
+        if w not in weeks and len(weeks) < pol["weekly"]:
+            weeks.add(w)
+            keep.add(m["path"])
+    removed = 0
+    for m in items:
+        if m["path"] in keep:
+            continue
+        try:
+            os.remove(m["path"])
+            removed += 1
+        except OSError:
+            pass
+    if removed:
+        _gc_backup_objects()
+    return removed
+
+def _gc_backup_objects() -> int:
+    # 删除不再被任何清单引用的分块；有清单读不出时不做清理，宁可多留
+    refs = set()
+    try:
+        names = os.listdir(BACKUP_MANIFEST_DIR)
+    except OSError:
+        return 0
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            m = _read_manifest(os.path.join(BACKUP_MANIFEST_DIR, name))
+        except Exception:
+            return 0
+        refs.add(m.get("config"))
+        refs.update(h for _, h, _ in m.get("months", []))
+    removed = 0
+    for sub in os.listdir(BACKUP_OBJECT_DIR):
+        d = os.path.join(BACKUP_OBJECT_DIR, sub)
+        if not os.path.isdir(d):
+            continue
+        for h in os.listdir(d):
+            if h in refs:
+                continue
+            try:
+                os.remove(os.path.join(d, h))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+def backup_state() -> str:
+    # 创建一份备份并按保留策略清理旧备份，返回清单路径
+    ensure_dirs()
+    with _backup_lock:
+        t0 = time.perf_counter()
+        path = get_current_ledger_path()
+        ledger = os.path.abspath(path)
+        s = load_state()
+        backend = _get_backend()
+        items = list_backups(ledger)
+        prev = items[0] if items else None
+        written = [0]
+        def put(data: bytes) -> str:
+            h, n = _put_object(data)
+            written[0] += n
+            return h
+        conf = {k: v for k, v in s.items() if k != "transactions" and not k.startswith("_")}
+        conf_hash = put(json.dumps(conf, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        months = {}
+        def put_month(ym, rows):
+            if rows:
+                months[ym] = (put(_month_chunk(rows)), len(rows))
+            else:
+                months.pop(ym, None)
+        token = None
+        if backend in ("sqlite", "sqlite_only"):
+            # 账单以数据库为准（sqlite 模式下 JSON 为镜像）
+            source = "db"
+            base = prev if prev and prev.get("source") == "db" else None
+            if base:
+                months.update((ym, (h, n)) for ym, h, n in base.get("months", []))
+            token, full = _backup_db_months(base.get("db_token") if base else None, put_month, months)
+        else:
+            source = "json"
+            full = True
+            groups = {}
+            for t in s.get("transactions", []):
+                groups.setdefault(_time_keys(t.get("time"))[2] or 0, []).append(t)
+            for ym, rows in groups.items():
+                put_month(ym, rows)
+        created = datetime.now()
+        name = f"{_backup_tag(path)}_{created.strftime('%Y%m%d_%H%M%S')}"
+        os.makedirs(BACKUP_MANIFEST_DIR, exist_ok=True)
+        mpath = os.path.join(BACKUP_MANIFEST_DIR, name + ".json")
+        n = 1
+        while os.path.exists(mpath):
+            mpath = os.path.join(BACKUP_MANIFEST_DIR, f"{name}_{n}.json")
+            n += 1
+        manifest = {
+            "version": 1,
+            "ledger": ledger,
+            "created": created.isoformat(),
+            "backend": backend,
+            "source": source,
+            "columns": list(_TX_FIELDS) if source == "db" else None,
+            "db_token": token,
+            "full": full,
+            "config": conf_hash,
+            "months": [[ym, h, c] for ym, (h, c) in sorted(months.items())],
+            "rows": sum(c for _, c in months.values()),
+            "new_bytes": written[0],
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 1),
+        }
+        _write_json_atomic(mpath, manifest, indent=1)
+        try:
+            _prune_backups(ledger, _backup_retention(s))
+        except Exception:
+            pass
+        return mpath
+
+def _restore_db(conf: Dict, rows: List[Dict]):
+    # 在临时库中建表并写入还原数据，再用 SQLite 在线备份 API 整体拷入在用库：
+    # 其它连接无需关闭，拷贝失败时在用库保持原样
+    live = _db()
+    if live.in_transaction:
+        live.commit()
+    tmp_path = get_current_db_path() + ".restore"
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        try:
+            os.remove(tmp_path + suffix)
+        except OSError:
+            pass
+    tmp = sqlite3.connect(tmp_path)
+    try:
+        # 先灌入账单再建索引、汇总表与全文索引，比逐行经触发器维护快得多
+        with tmp:
+            tmp.execute(_TX_TABLE_SQL)
+            tmp.executemany(_TX_INSERT_SQL, (_tx_row(t) for t in rows))
+        _create_schema(tmp)
+        with tmp:
+            _write_config_tables(tmp.cursor(), conf)
+        tmp.backup(live)
+    finally:
+        tmp.close()
+        for suffix in ("", "-journal"):
+            try:
+                os.remove(tmp_path + suffix)
+            except OSError:
+                pass
+
+def restore_backup(manifest_path: str) -> int:
+    # 按清单还原当前账本，返回账单条数；先读出并校验全部分块，再为现状做一次备份，之后才改写账本与数据库
+    m = _read_manifest(manifest_path)
+    conf = json.loads(_get_object(m["config"]).decode("utf-8"))
+    cols = m.get("columns")
+    rows = []
+    for _, h, _ in m.get("months", []):
+        data = json.loads(_get_object(h).decode("utf-8"))
+        rows.extend((dict(zip(cols, r)) for r in data) if cols else data)
+    backup_state()
+    path = get_current_ledger_path()
+    # 排队中的旧保存不能在还原之后落盘
+    _writer.flush()
+    backend = ((conf.get("prefs", {}) or {}).get("storage_backend") or "sqlite")
+    if backend in ("sqlite", "sqlite_only"):
+        _restore_db(conf, rows)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        _dump_ledger(f, dict(conf, transactions=rows), indent=2, with_transactions=(backend != "sqlite_only"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _journal.discard(path)
+    _ledger_store.invalidate()
+    return len(rows)
 
 # 用户索引管理（本地）
 def load_user_index() -> Dict:
@@ -345,10 +2538,9 @@ def get_account_names(state: Dict) -> List[str]:
     return [a["name"] for a in state.get("accounts", [])]
 
 def find_account(state: Dict, name: str) -> Dict:
-    for a in state.get("accounts", []):
-        if a["name"] == name:
-            return a
-    return None
+    if not name:
+        return None
+    return _account_list(state).lookup(name)
 
 def get_account_types(state: Dict) -> List[str]:
     types = set(DEFAULT_ACCOUNT_TYPES)
@@ -370,102 +2562,93 @@ def list_accounts_by_type(state: Dict) -> Dict[str, List[str]]:
 def add_account(state: Dict, account: Account):
     if find_account(state, account.name):
         return
-    state["accounts"].append(account.to_dict())
-    if _get_backend() == "sqlite":
-        _init_db()
-        conn = _db()
-        cur = conn.cursor()
-        a = account.to_dict()
-        cur.execute("INSERT OR REPLACE INTO accounts(name, balance, type, note, bank, last4, credit_limit, status, bill_day, repay_day, repay_offset) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
-                    (a.get("name"), float(a.get("balance",0)), a.get("type"), a.get("note"), a.get("bank"), a.get("last4"), float(a.get("limit",0)), a.get("status"), int(a.get("bill_day",0) or 0), int(a.get("repay_day",0) or 0), int(a.get("repay_offset",0) or 0)))
-        conn.commit()
-        conn.close()
+    a = account.to_dict()
+    if a.get("opening_balance") is None:
+        a["opening_balance"] = float(a.get("balance", 0) or 0)
+    state["accounts"].append(a)
+    if _uses_sqlite():
+        with db_transaction() as conn:
+            cur = conn.cursor()
+            cur.execute("INSERT OR REPLACE INTO accounts(name, balance, type, note, bank, last4, credit_limit, status, bill_day, repay_day, repay_offset) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
+                        (a.get("name"), float(a.get("balance",0)), a.get("type"), a.get("note"), a.get("bank"), a.get("last4"), float(a.get("limit",0)), a.get("status"), int(a.get("bill_day",0) or 0), int(a.get("repay_day",0) or 0), int(a.get("repay_offset",0) or 0)))
 
 def remove_account(state: Dict, name: str):
-    state["accounts"] = [a for a in state.get("accounts", []) if a["name"] != name]
-    if _get_backend() == "sqlite":
-        _init_db()
-        conn = _db()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM accounts WHERE name=?", (name,))
-        conn.commit()
-        conn.close()
+    accs = _account_list(state)
+    accs[:] = [a for a in accs if a["name"] != name]
+    if _uses_sqlite():
+        with db_transaction() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM accounts WHERE name=?", (name,))
 
 def rename_account(state: Dict, old: str, new: str):
-    for a in state.get("accounts", []):
+    accs = _account_list(state)
+    for a in accs:
         if a["name"] == old:
             a["name"] = new
-    for t in state.get("transactions", []):
-        if t.get("account") == old:
-            t["account"] = new
-        if t.get("to_account") == old:
-            t["to_account"] = new
-        if t.get("from_account") == old:
-            t["from_account"] = new
-    if _get_backend() == "sqlite":
-        _init_db()
-        conn = _db()
-        cur = conn.cursor()
-        cur.execute("UPDATE accounts SET name=? WHERE name=?", (new, old))
-        cur.execute("UPDATE transactions SET account=? WHERE account=?", (new, old))
-        cur.execute("UPDATE transactions SET to_account=? WHERE to_account=?", (new, old))
-        cur.execute("UPDATE transactions SET from_account=? WHERE from_account=?", (new, old))
-        conn.commit()
-        conn.close()
+    accs.invalidate()
+    changed = []
+    for t in list(state.get("transactions", [])):
+        ch = {k: new for k in ("account", "to_account", "from_account") if t.get(k) == old}
+        if ch:
+            changed.append(_replace_row(state, t, ch))
+    if not _uses_sqlite():
+        for t in changed:
+            mark_transaction_dirty(state, t)
+    else:
+        with db_transaction() as conn:
+            cur = conn.cursor()
+            cur.execute("UPDATE accounts SET name=? WHERE name=?", (new, old))
+            cur.execute("UPDATE transactions SET account=? WHERE account=?", (new, old))
+            cur.execute("UPDATE transactions SET to_account=? WHERE to_account=?", (new, old))
+            cur.execute("UPDATE transactions SET from_account=? WHERE from_account=?", (new, old))
 
 def add_transaction(state: Dict, tx: Transaction):
-    state["transactions"].append(tx.to_dict())
-    if _get_backend() == "sqlite":
-        _init_db()
-        conn = _db()
-        cur = conn.cursor()
-        t = tx.to_dict()
-        cur.execute("INSERT OR IGNORE INTO transactions(id, time, amount, category, ttype, account, to_account, from_account, note, record_time, record_source) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
-                    (t.get("id"), t.get("time"), float(t.get("amount",0)), t.get("category"), t.get("ttype"), t.get("account"), t.get("to_account"), t.get("from_account"), t.get("note"), t.get("record_time"), t.get("record_source")))
-        conn.commit()
-        conn.close()
+    d = tx.to_dict()
+    state["transactions"].append(d)
+    if _uses_sqlite():
+        with db_transaction() as conn:
+            cur = conn.cursor()
+            cur.execute(_TX_INSERT_SQL, _tx_row(d))
+        _mark_synced(state, [d.get("id")])
 
 def remove_transaction(state: Dict, tx_id: str):
-    state["transactions"] = [t for t in state.get("transactions", []) if t.get("id") != tx_id]
-    if _get_backend() == "sqlite":
-        _init_db()
-        conn = _db()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM transactions WHERE id=?", (tx_id,))
-        conn.commit()
-        conn.close()
+    txs = _tx_list(state)
+    i = txs.position(tx_id)
+    if i is not None:
+        del txs[i]
+    if _uses_sqlite():
+        with db_transaction() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM transactions WHERE id=?", (tx_id,))
+        _mark_synced(state, [tx_id])
 
 def get_transaction(state: Dict, tx_id: str):
-    for t in state.get("transactions", []):
-        if t.get("id") == tx_id:
-            return t
-    return None
+    txs = _tx_list(state)
+    i = txs.position(tx_id)
+    return txs[i] if i is not None else None
     
 def get_transaction_db(tx_id: str):
-    _init_db()
     conn = _db()
     cur = conn.cursor()
     cur.execute("SELECT * FROM transactions WHERE id=?", (tx_id,))
     r = cur.fetchone()
-    conn.close()
     if not r:
         return None
     return dict(r)
 
 def update_transaction(state: Dict, tx_id: str, new_tx: Transaction):
-    for i, t in enumerate(state.get("transactions", [])):
-        if t.get("id") == tx_id:
-            state["transactions"][i] = new_tx.to_dict()
-            return
-    if _get_backend() == "sqlite":
-        _init_db()
-        conn = _db()
-        cur = conn.cursor()
-        t = new_tx.to_dict()
-        cur.execute("UPDATE transactions SET time=?, amount=?, category=?, ttype=?, account=?, to_account=?, from_account=?, note=?, record_time=?, record_source=? WHERE id=?",
-                    (t.get("time"), float(t.get("amount",0)), t.get("category"), t.get("ttype"), t.get("account"), t.get("to_account"), t.get("from_account"), t.get("note"), t.get("record_time"), t.get("record_source"), tx_id))
-        conn.commit()
-        conn.close()
+    d = new_tx.to_dict()
+    txs = _tx_list(state)
+    i = txs.position(tx_id)
+    if i is not None:
+        txs[i] = d
+    # 无论内存中是否找到，数据库都要同步更新
+    if _uses_sqlite():
+        with db_transaction() as conn:
+            cur = conn.cursor()
+            row = _tx_row(d)
+            cur.execute(_TX_UPDATE_SQL, row[1:] + (tx_id,))
+        _mark_synced(state, [tx_id, d.get("id")])
 
 def apply_transaction_delta(state: Dict, t: Dict, sign: int):
     if (state.get("prefs", {}) or {}).get("freeze_assets"):
@@ -495,6 +2678,220 @@ def apply_transaction_delta(state: Dict, t: Dict, sign: int):
         if fa:
             fa["balance"] = float(fa.get("balance", 0)) - amt
 
+_INCOME_TYPES = ("收入", "报销类收入")
+_EXPENSE_TYPES = ("支出", "报销类支出")
+
+def _balance_legs_sql(cond: str) -> str:
+    # 与 apply_transaction_delta 相同的记账规则，拆成 (ym, acc, v) 明细：收支读按月汇总表，转账/还款的两条腿读明细
+    sign = "CASE WHEN ttype IN ('收入','报销类收入') THEN {0} ELSE -{0} END"
+    io = "ttype IN ('收入','报销类收入','支出','报销类支出')"
+    return (f"SELECT ym, account AS acc, {sign.format('sum')} AS v FROM agg_monthly WHERE {io} AND {cond} "
+            f"UNION ALL SELECT ym, from_account, -amount FROM transactions WHERE ttype IN ('转账','还款') AND {cond} "
+            f"UNION ALL SELECT ym, to_account, amount FROM transactions WHERE ttype='转账' AND {cond} "
+            f"UNION ALL SELECT ym, coalesce(nullif(to_account,''), account), amount FROM transactions WHERE ttype='还款' AND {cond}")
+
+# 时间无法解析的行不进汇总表，收支部分补扫明细
+_BALANCE_SQL = ("SELECT acc, SUM(v) FROM (" + _balance_legs_sql("1") +
+                " UNION ALL SELECT ym, account, CASE WHEN ttype IN ('收入','报销类收入') THEN amount ELSE -amount END FROM transactions"
+                " WHERE ym IS NULL AND ttype IN ('收入','报销类收入','支出','报销类支出')"
+                ") WHERE acc IS NOT NULL AND acc<>'' GROUP BY acc")
+
+def _balance_legs(t: Dict):
+    amt = float(t.get("amount", 0) or 0)
+    typ = t.get("ttype")
+    if typ in _INCOME_TYPES:
+        yield t.get("account"), amt
+    elif typ in _EXPENSE_TYPES:
+        yield t.get("account"), -amt
+    elif typ == "转账":
+        yield t.get("from_account"), -amt
+        yield t.get("to_account"), amt
+    elif typ == "还款":
+        yield t.get("to_account") or t.get("account"), amt
+        yield t.get("from_account"), -amt
+
+def _balance_sums_py(txs) -> Dict[str, float]:
+    sums: Dict[str, float] = {}
+    for t in txs:
+        for name, v in _balance_legs(t):
+            if name:
+                sums[name] = sums.get(name, 0.0) + v
+    return sums
+
+def account_openings(state: Dict, sums: Dict[str, float] = None) -> Dict[str, float]:
+    # 各账户期初余额；没有记录 opening_balance 的旧账户按 现有余额 - 账单累计变动 倒推一次并记入账户（随下次保存落盘），
+    # 之后都以记下的值为准，手改余额或切换后端造成的偏差才能被重算发现
+    out = {}
+    for a in state.get("accounts", []):
+        name = a.get("name")
+        ob = a.get("opening_balance")
+        if ob is None:
+            if sums is None:
+                backend = ((state.get("prefs", {}) or {}).get("storage_backend") or "sqlite")
+                if backend in ("sqlite", "sqlite_only"):
+                    sums = {r[0]: float(r[1] or 0) for r in _db().execute(_BALANCE_SQL)}
+                else:
+                    sums = _balance_sums_py(_tx_list(state))
+            ob = round(float(a.get("balance", 0) or 0) - sums.get(name, 0.0), 2)
+            a["opening_balance"] = ob
+        out[name] = float(ob)
+    return out
+
+def _migrate_openings(state: Dict):
+    # 载入时为旧账户补记期初余额；都已记录时不展开账单、不查库
+    if all(a.get("opening_balance") is not None for a in state.get("accounts", [])):
+        return
+    try:
+        account_openings(state)
+    except Exception:
+        pass
+
+def set_account_balance(state: Dict, name: str, balance: float):
+    # 手动修改余额视为校正期初值：opening_balance 同步平移，之后重算余额不会把手改的数改回去
+    a = find_account(state, name)
+    if not a:
+        return
+    balance = float(balance)
+    if a.get("opening_balance") is not None:
+        a["opening_balance"] = round(float(a["opening_balance"]) + balance - float(a.get("balance", 0) or 0), 2)
+    a["balance"] = balance
+
+def recompute_balances(state_or_db=None, apply: bool = True, opening: Dict[str, float] = None, tolerance: float = 0.005) -> Dict:
+    # 按 期初余额 + 全部账单 一次性重算账户余额；opening 为 None 时取各账户记录的期初值（见 account_openings），
+    # 传入字典时按其取值、缺省为 0（覆盖导入从零重算即传 {}）
+    # state_or_db 可为 state、sqlite3.Connection 或 None；SQLite 后端用一条分组查询，JSON 后端在内存单趟累加
+    # 冻结资产时只报告差异不写回；返回 {"balances", "diff", "frozen", "applied"}
+    conn = state_or_db if isinstance(state_or_db, sqlite3.Connection) else None
+    state = state_or_db if isinstance(state_or_db, dict) else load_state()
+    backend = ((state.get("prefs", {}) or {}).get("storage_backend") or "sqlite")
+    if conn is None and backend in ("sqlite", "sqlite_only"):
+        conn = _db()
+    if conn is not None:
+        sums = {r[0]: float(r[1] or 0) for r in conn.execute(_BALANCE_SQL)}
+    else:
+        sums = _balance_sums_py(state.get("transactions", []))
+    if opening is None:
+        opening = account_openings(state, sums)
+    balances = {}
+    diff = {}
+    for a in state.get("accounts", []):
+        name = a.get("name")
+        new = round(float(opening.get(name, 0.0)) + sums.get(name, 0.0), 2)
+        old = float(a.get("balance", 0) or 0)
+        balances[name] = new
+        if abs(new - old) > tolerance:
+            diff[name] = (old, new, round(new - old, 2))
+    frozen = bool((state.get("prefs", {}) or {}).get("freeze_assets"))
+    applied = False
+    if apply and not frozen and diff:
+        for a in state.get("accounts", []):
+            if a.get("name") in diff:
+                a["balance"] = balances[a.get("name")]
+        if _uses_sqlite():
+            with db_transaction() as c:
+                c.executemany("UPDATE accounts SET balance=? WHERE name=?", [(balances[n], n) for n in diff])
+        save_state(state)
+        applied = True
+    return {"balances": balances, "diff": diff, "frozen": frozen, "applied": applied}
+
+def _ym_start_ts(ym: int) -> int:
+    return calendar.timegm((ym // 100, ym % 100, 1, 0, 0, 0))
+
+def _next_ym(ym: int) -> int:
+    return ym + 89 if ym % 100 == 12 else ym + 1
+
+def _balance_checkpoints() -> List[Tuple[int, Dict[str, float]]]:
+    # 先从最近的有效检查点向后补算失效月份，再按月返回 [(ym, {账户: 截至月末的累计变动})]
+    with db_transaction() as conn:
+        last = conn.execute("SELECT max(ym) FROM balance_checkpoints").fetchone()[0]
+        cum: Dict[str, float] = {}
+        if last is not None:
+            cum = {r[0]: float(r[1]) for r in conn.execute("SELECT account, cum FROM balance_checkpoints WHERE ym=?", (last,))}
+        sql = f"SELECT ym, acc, SUM(v) FROM ({_balance_legs_sql('ym>?')}) WHERE acc IS NOT NULL AND acc<>'' GROUP BY ym, acc ORDER BY ym"
+        rows = conn.execute(sql, (last or 0,) * 4).fetchall()
+        fresh = []
+        i = 0
+        while i < len(rows):
+            ym = rows[i][0]
+            while i < len(rows) and rows[i][0] == ym:
+                cum[rows[i][1]] = cum.get(rows[i][1], 0.0) + float(rows[i][2] or 0)
+                i += 1
+            fresh.extend((ym, name, v) for name, v in cum.items())
+        if fresh:
+            conn.executemany("INSERT OR REPLACE INTO balance_checkpoints(ym, account, cum) VALUES(?,?,?)", fresh)
+        series: List[Tuple[int, Dict[str, float]]] = []
+        for ym, name, v in conn.execute("SELECT ym, account, cum FROM balance_checkpoints ORDER BY ym"):
+            if not series or series[-1][0] != ym:
+                series.append((ym, {}))
+            series[-1][1][name] = float(v)
+    return series
+
+def _balance_series_py(txs) -> List[Tuple[int, Dict[str, float]]]:
+    # JSON 后端没有检查点表，单趟按月汇总后累加
+    monthly: Dict[int, Dict[str, float]] = {}
+    for t in txs:
+        ym = _time_keys(t.get("time"))[2]
+        if ym is None:
+            continue
+        m = monthly.setdefault(ym, {})
+        for name, v in _balance_legs(t):
+            if name:
+                m[name] = m.get(name, 0.0) + v
+    series = []
+    cum: Dict[str, float] = {}
+    for ym in sorted(monthly):
+        for name, v in monthly[ym].items():
+            cum[name] = cum.get(name, 0.0) + v
+        series.append((ym, dict(cum)))
+    return series
+
+def _cum_before(series, ym: int) -> Dict[str, float]:
+    # 严格早于 ym 的最近检查点
+    keys = [k for k, _ in series]
+    i = bisect_left(keys, ym)
+    return series[i - 1][1] if i > 0 else {}
+
+def account_balances_at(when, state: Dict = None) -> Dict[str, float]:
+    # 各账户在 when 时刻之前（不含 when）的余额 = 当前余额 - when 及以后账单的影响
+    # SQLite 后端：最近的月末检查点 + 当月 [月初, when) 的少量明细；when 可为 datetime 或 ISO 字符串
+    if state is None:
+        state = load_state()
+    current = {a.get("name"): float(a.get("balance", 0) or 0) for a in state.get("accounts", [])}
+    ts, _, ym, _ = _time_keys(when.isoformat() if hasattr(when, "isoformat") else when)
+    if ts is None:
+        return current
+    if _uses_sqlite():
+        series = _balance_checkpoints()
+        total = series[-1][1] if series else {}
+        base = _cum_before(series, ym)
+        cur = _db().execute("SELECT ttype, amount, account, to_account, from_account FROM transactions WHERE ts>=? AND ts<?", (_ym_start_ts(ym), ts))
+        cols = [d[0] for d in cur.description]
+        partial = _balance_sums_py(dict(zip(cols, r)) for r in cur)
+        after = {n: total.get(n, 0.0) - base.get(n, 0.0) - partial.get(n, 0.0) for n in current}
+    else:
+        after = _balance_sums_py(t for t in state.get("transactions", []) if (_time_keys(t.get("time"))[0] or -1) >= ts)
+    return {n: round(b - after.get(n, 0.0), 2) for n, b in current.items()}
+
+def balance_history(start_ym: int = None, end_ym: int = None, state: Dict = None) -> List[Tuple[int, Dict[str, float]]]:
+    # 逐月月末余额 [(ym, {账户: 余额})]，ym 形如 202406；缺省范围为最早有账单的月份到当前月
+    if state is None:
+        state = load_state()
+    current = {a.get("name"): float(a.get("balance", 0) or 0) for a in state.get("accounts", [])}
+    series = _balance_checkpoints() if _uses_sqlite() else _balance_series_py(state.get("transactions", []))
+    total = series[-1][1] if series else {}
+    now = datetime.now()
+    if start_ym is None:
+        start_ym = series[0][0] if series else now.year * 100 + now.month
+    if end_ym is None:
+        end_ym = max(now.year * 100 + now.month, start_ym)
+    out = []
+    ym = start_ym
+    while ym <= end_ym:
+        cum = _cum_before(series, _next_ym(ym))
+        out.append((ym, {n: round(b - total.get(n, 0.0) + cum.get(n, 0.0), 2) for n, b in current.items()}))
+        ym = _next_ym(ym)
+    return out
+
 def get_categories(state: Dict, scene: str):
     cats = state.get("categories", {})
     return list(cats.get(scene, []))
@@ -518,9 +2915,14 @@ def rename_category(state: Dict, scene: str, old: str, new: str, update_history:
             lst[i] = new
             break
     if update_history:
-        for t in state.get("transactions", []):
+        for t in list(state.get("transactions", [])):
             if t.get("category") == old:
-                t["category"] = new
+                t = _replace_row(state, t, {"category": new})
+                if not _uses_sqlite():
+                    mark_transaction_dirty(state, t)
+        if _uses_sqlite():
+            with db_transaction() as conn:
+                conn.execute("UPDATE transactions SET category=? WHERE category=?", (new, old))
 
 def get_category_rules(state: Dict, scene: str):
     rules = state.get("category_rules", {})
@@ -563,23 +2965,17 @@ def add_record_source(state: Dict, name: str):
     lst = state.setdefault("record_sources", [])
     if name not in lst:
         lst.append(name)
-    if _get_backend() == "sqlite":
-        _init_db()
-        conn = _db()
-        cur = conn.cursor()
-        cur.execute("INSERT OR IGNORE INTO record_sources(name) VALUES(?)", (name,))
-        conn.commit()
-        conn.close()
+    if _uses_sqlite():
+        with db_transaction() as conn:
+            cur = conn.cursor()
+            cur.execute("INSERT OR IGNORE INTO record_sources(name) VALUES(?)", (name,))
 
 # 导出目录
 def get_export_dir() -> str:
     ensure_dirs()
     return EXPORT_DIR
 
-def query_transactions(filters: Dict, limit: int = None, offset: int = None) -> List[Dict]:
-    _init_db()
-    conn = _db()
-    cur = conn.cursor()
+def _filter_where(filters: Dict) -> Tuple[List[str], List]:
     where = []
     args = []
     year = (filters.get("year") or "").strip()
@@ -589,12 +2985,7 @@ def query_transactions(filters: Dict, limit: int = None, offset: int = None) ->
     term = (filters.get("term") or "").strip().lower()
     amt_op = (filters.get("amt_op") or "").strip()
     amt_val = (filters.get("amt_val") or "").strip()
-    if year:
-        where.append("substr(time,1,4)=?")
-        args.append(year)
-    if month:
-        where.append("substr(time,1,7)=?")
-        args.append(month)
+    _period_where(year, month, where, args)
     if ttype:
         where.append("ttype=?")
         args.append(ttype)
@@ -616,15 +3007,103 @@ def query_transactions(filters: Dict, limit: int = None, offset: int = None) ->
             where.append("abs(amount-?)<1e-9")
             args.append(v)
     if term:
-        like = f"%{term}%"
-        where.append("(lower(time) LIKE ? OR lower(category) LIKE ? OR lower(ttype) LIKE ? OR lower(account) LIKE ? OR lower(to_account) LIKE ? OR lower(from_account) LIKE ? OR lower(note) LIKE ? OR lower(record_source) LIKE ? OR lower(id) LIKE ?)")
-        args.extend([like, like, like, like, like, like, like, like, like])
-    sql = "SELECT id,time,amount,category,ttype,account,to_account,from_account,note,record_time,record_source FROM transactions"
+        _term_where(term, where, args)
+    # start/end 为交易时间的半开区间 [start, end)，接受 datetime 或 ISO 字符串
+    for k, op in (("start", ">="), ("end", "<")):
+        v = filters.get(k)
+        if v is None or v == "":
+            continue
+        ts = _time_keys(v.isoformat() if hasattr(v, "isoformat") else v)[0]
+        if ts is not None:
+            where.append(f"ts{op}?")
+            args.append(ts)
+    return where, args
+
+def _tx_filter(filters: Dict):
+    # 与 _filter_where 同义的内存筛选，供 json 后端（账单不入库）使用；关键词按各字段子串匹配
+    year = (filters.get("year") or "").strip()
+    month = (filters.get("month") or "").strip()
+    ttype = (filters.get("ttype") or "").strip()
+    category = (filters.get("category") or "").strip()
+    term = (filters.get("term") or "").strip().lower()
+    amt_op = (filters.get("amt_op") or "").strip()
+    amt_val = (filters.get("amt_val") or "").strip()
+    rng = _period_range(year, month)
+    bounds = []
+    for k in ("start", "end"):
+        v = filters.get(k)
+        bounds.append(None if v is None or v == "" else _time_keys(v.isoformat() if hasattr(v, "isoformat") else v)[0])
+    amt = float(int(amt_val)) if amt_op in (">", "<", "=") and amt_val.isdigit() else None
+
+    def match(t: Dict) -> bool:
+        tm = str(t.get("time") or "")
+        ts, y = _time_keys(tm)[:2]
+        if rng:
+            if ts is None or not (rng[0] <= ts < rng[1]):
+                return False
+            if year and month and month[:4] != year[:4] and str(y) != year[:4]:
+                return False
+        else:
+            if year and tm[:4] != year:
+                return False
+            if month and tm[:7] != month:
+                return False
+        if ttype and t.get("ttype") != ttype:
+            return False
+        if category:
+            c = t.get("category")
+            if category == "未分类":
+                if c is not None and str(c).strip():
+                    return False
+            elif c != category:
+                return False
+        if amt is not None:
+            a = float(t.get("amount", 0) or 0)
+            if (amt_op == ">" and not a > amt) or (amt_op == "<" and not a < amt) or (amt_op == "=" and abs(a - amt) >= 1e-9):
+                return False
+        if term and not any(term in str(t.get(k) or "").lower() for k in ("time", "category", "ttype", "account", "to_account", "from_account", "note", "record_source", "id")):
+            return False
+        if bounds[0] is not None and (ts is None or ts < bounds[0]):
+            return False
+        if bounds[1] is not None and (ts is None or ts >= bounds[1]):
+            return False
+        return True
+    return match
+
+def _tx_sort_key(order_col: str):
+    # 与 _ORDER_KEYS 的 coalesce 排序键一致，id 作次序
+    if order_col == "time":
+        def key(t):
+            ts = _time_keys(t.get("time"))[0]
+            return (ts if ts is not None else -1, t.get("id") or "")
+        return key
+    if order_col == "amount":
+        return lambda t: (float(t.get("amount", 0) or 0), t.get("id") or "")
+    return lambda t: (str(t.get(order_col) or ""), t.get("id") or "")
+
+def _json_transactions(filters: Dict) -> List[Dict]:
+    match = _tx_filter(filters)
+    rows = [t for t in _tx_list(load_state()) if match(t)]
+    order_col = filters.get("order_col")
+    if order_col in _ORDER_KEYS:
+        rows.sort(key=_tx_sort_key(order_col), reverse=bool(filters.get("order_desc")))
+    return rows
+
+_TX_SELECT = "SELECT id,time,amount,category,ttype,account,to_account,from_account,note,record_time,record_source FROM transactions"
+
+def query_transactions(filters: Dict, limit: int = None, offset: int = None) -> List[Dict]:
+    conn = _db()
+    cur = conn.cursor()
+    where, args = _filter_where(filters)
+    sql = _TX_SELECT
     if where:
         sql += " WHERE " + " AND ".join(where)
     order_col = (filters.get("order_col") or "time")
     order_desc = bool(filters.get("order_desc", False))
-    if order_col in ("time","record_time","amount","category","ttype","account"):
+    if order_col == "time":
+        # ts 与 time 同序，按 ts 排序可与区间筛选共用 idx_tx_ts
+        sql += f" ORDER BY ts {'DESC' if order_desc else 'ASC'}"
+    elif order_col in ("record_time","amount","category","ttype","account"):
         sql += f" ORDER BY {order_col} {'DESC' if order_desc else 'ASC'}"
     if isinstance(limit, int) and limit > 0:
         sql += " LIMIT ?"
@@ -634,88 +3113,328 @@ def query_transactions(filters: Dict, limit: int = None, offset: int = None) ->
             args.append(offset)
     cur.execute(sql, args)
     rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
     return rows
 
-def aggregate_sums(filters: Dict) -> Dict[str, float]:
-    _init_db()
-    conn = _db()
-    cur = conn.cursor()
-    where = []
-    args = []
+def _encode_cursor(order_col: str, desc: bool, key, tx_id: str) -> str:
+    raw = json.dumps([order_col, 1 if desc else 0, key, tx_id], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(token: str, order_col: str, desc: bool):
+    # 游标与当前排序不一致时视为无效，从首页开始
+    try:
+        col, d, key, tx_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+    except Exception:
+        return None
+    if col != order_col or bool(d) != bool(desc) or not isinstance(tx_id, str):
+        return None
+    return key, tx_id
+
+APPROX_COUNT_CAP = 10000
+
+def count_transactions(filters: Dict, cap: int = APPROX_COUNT_CAP) -> Tuple[int, bool]:
+    # 返回 (条数, 是否精确)；仅按年月/类型/类别筛选时直接读聚合表
     year = (filters.get("year") or "").strip()
     month = (filters.get("month") or "").strip()
-    if year:
-        where.append("substr(time,1,4)=?")
-        args.append(year)
-    if month:
-        where.append("substr(time,1,7)=?")
-        args.append(month)
-    sql = "SELECT ttype, SUM(amount) AS s FROM transactions"
+    ttype = (filters.get("ttype") or "").strip()
+    category = (filters.get("category") or "").strip()
+    simple = not any((filters.get(k) or "").strip() for k in ("term", "amt_op", "amt_val")) and category != "未分类"
+    conn = _db()
+    if simple and (not (year or month) or _period_range(year, month)):
+        if year and month and month[:4] != year[:4]:
+            return 0, True
+        lo = hi = None
+        if month:
+            y, m = int(month[:4]), int(month[5:7])
+            lo, hi = y * 100 + m, (y + (m == 12)) * 100 + (m % 12) + 1
+        elif year:
+            lo, hi = int(year[:4]) * 100 + 1, (int(year[:4]) + 1) * 100 + 1
+        where = []
+        args = []
+        if lo is not None:
+            where.append("ym>=? AND ym<?")
+            args.extend([lo, hi])
+        if ttype:
+            where.append("ttype=?")
+            args.append(ttype)
+        if category:
+            where.append("category=?")
+            args.append(category)
+        sql = "SELECT coalesce(SUM(count),0) FROM agg_monthly"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return int(conn.execute(sql, args).fetchone()[0]), True
+    where, args = _filter_where(filters)
+    sql = "SELECT 1 FROM transactions"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if cap and cap > 0:
+        n = int(conn.execute(f"SELECT COUNT(*) FROM ({sql} LIMIT ?)", args + [cap + 1]).fetchone()[0])
+        if n > cap:
+            return cap, False
+        return n, True
+    return int(conn.execute(f"SELECT COUNT(*) FROM ({sql})", args).fetchone()[0]), True
+
+def query_transactions_page(filters: Dict, page_size: int = 200, cursor: Optional[str] = None,
+                            direction: str = "next", with_total: bool = False) -> Dict:
+    # 键集分页：按 (排序键, id) 定位，深页与首页代价相同，数据变动时不会错位
+    order_col = filters.get("order_col") or "time"
+    if order_col not in _ORDER_KEYS:
+        order_col = "time"
+    desc = bool(filters.get("order_desc", False))
+    expr = _ORDER_KEYS[order_col]
+    page_size = max(1, int(page_size or 200))
+    where, args = _filter_where(filters)
+    pos = _decode_cursor(cursor, order_col, desc) if cursor else None
+    backward = bool(pos) and direction == "prev"
+    # 向前翻页时反转比较与排序方向，取回后再倒序
+    asc = (not desc) != backward
+    if order_col == "time":
+        # 区间条件同时写在排序键上，让规划器选 idx_tx_k_time 而不是先取区间再排序
+        rng = _period_range((filters.get("year") or "").strip(), (filters.get("month") or "").strip())
+        if rng:
+            where.append(f"{expr}>=? AND {expr}<?")
+            args.extend(rng)
+    if pos:
+        # 行值比较本身不会被用作索引区间，先给排序键加一个闭区间下/上界
+        where.append(f"{expr} {'>=' if asc else '<='} ? AND ({expr}, id) {'>' if asc else '<'} (?, ?)")
+        args.extend([pos[0], pos[0], pos[1]])
+    sql = f"SELECT {expr} AS _k, id,time,amount,category,ttype,account,to_account,from_account,note,record_time,record_source FROM transactions"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    d = "ASC" if asc else "DESC"
+    sql += f" ORDER BY {expr} {d}, id {d} LIMIT ?"
+    args.append(page_size + 1)
+    fetched = _db().execute(sql, args).fetchall()
+    more = len(fetched) > page_size
+    fetched = fetched[:page_size]
+    if backward:
+        fetched.reverse()
+    rows = []
+    for r in fetched:
+        d = dict(r)
+        d.pop("_k", None)
+        rows.append(d)
+    nxt = prv = None
+    if fetched:
+        first, last = fetched[0], fetched[-1]
+        if more or backward:
+            nxt = _encode_cursor(order_col, desc, last["_k"], last["id"])
+        if pos and (more or not backward):
+            prv = _encode_cursor(order_col, desc, first["_k"], first["id"])
+    res = {"rows": rows, "next": nxt, "prev": prv, "total": None, "total_exact": False}
+    if with_total:
+        res["total"], res["total_exact"] = count_transactions(filters)
+    return res
+
+_TX_FIELDS = ["id", "time", "amount", "category", "ttype", "account", "to_account", "from_account", "note", "record_time", "record_source"]
+TxRow = namedtuple("TxRow", _TX_FIELDS)
+
+def iter_transactions(filters: Optional[Dict] = None, batch_size: int = 1000, columns=None, as_dict: bool = False):
+    # 按 fetchmany 分批流式返回，内存占用与结果集大小无关；默认产出 TxRow 命名元组
+    # 迭代期间勿在同一线程改写 transactions，需要删改时先收集 id
+    filters = filters or {}
+    cols = list(columns) if columns else list(_TX_FIELDS)
+    for c in cols:
+        if c not in _TX_FIELDS:
+            raise ValueError(f"未知字段: {c}")
+    row_type = TxRow if cols == _TX_FIELDS else namedtuple("TxRow", cols)
+    if not _uses_sqlite():
+        # json 后端账单只在内存列表中：先筛出再逐条产出，同样不受迭代中改写列表的影响
+        for t in _json_transactions(filters):
+            vals = [float(t.get(c, 0) or 0) if c == "amount" else t.get(c) for c in cols]
+            yield dict(zip(cols, vals)) if as_dict else row_type._make(vals)
+        return
+    where, args = _filter_where(filters)
+    sql = f"SELECT {','.join(cols)} FROM transactions"
     if where:
         sql += " WHERE " + " AND ".join(where)
-    sql += " GROUP BY ttype"
+    order_col = filters.get("order_col")
+    if order_col in _ORDER_KEYS:
+        d = "DESC" if filters.get("order_desc") else "ASC"
+        sql += f" ORDER BY {_ORDER_KEYS[order_col]} {d}, id {d}"
+    cur = _db().cursor()
+    # 直接取元组，不逐行构造 sqlite3.Row
+    cur.row_factory = None
     cur.execute(sql, args)
+    n = max(1, int(batch_size or 1000))
+    try:
+        while True:
+            batch = cur.fetchmany(n)
+            if not batch:
+                break
+            for r in batch:
+                yield dict(zip(cols, r)) if as_dict else row_type._make(r)
+    finally:
+        cur.close()
+
+def aggregate_sums(filters: Dict) -> Dict[str, float]:
+    year = (filters.get("year") or "").strip()
+    month = (filters.get("month") or "").strip()
     res = {"收入":0.0, "支出":0.0, "转账":0.0, "报销类收入":0.0, "报销类支出":0.0}
-    for r in cur.fetchall():
-        k = r["ttype"]
-        v = float(r["s"] or 0)
-        res[k] = v
-    conn.close()
+    if (year or month) and not _period_range(year, month):
+        # 无法解析的年月按原方式在明细表上筛选
+        where = []
+        args = []
+        _period_where(year, month, where, args)
+        for r in _db().execute("SELECT ttype, SUM(amount) AS s FROM transactions WHERE " + " AND ".join(where) + " GROUP BY ttype", args).fetchall():
+            res[r["ttype"]] = float(r["s"] or 0)
+        return res
+    if year and month and month[:4] != year[:4]:
+        return res
+    start = end = None
+    if month:
+        y, m = int(month[:4]), int(month[5:7])
+        start = f"{y:04d}-{m:02d}"
+        end = f"{y + (m == 12):04d}-{(m % 12) + 1:02d}"
+    elif year:
+        start = f"{int(year[:4]):04d}"
+        end = f"{int(year[:4]) + 1:04d}"
+    res.update(get_period_totals(start, end, "ttype"))
+    return res
+
+def _ymd_key(v) -> Optional[int]:
+    # 接受 datetime/date 或 "YYYY" / "YYYY-MM" / "YYYY-MM-DD" 字符串，返回该时间段起点的 ymd 整数
+    if v is None or v == "":
+        return None
+    if hasattr(v, "year") and hasattr(v, "month") and hasattr(v, "day"):
+        return v.year * 10000 + v.month * 100 + v.day
+    s = str(v).strip()
+    try:
+        y = int(s[:4])
+        m = int(s[5:7]) if len(s) >= 7 else 1
+        d = int(s[8:10]) if len(s) >= 10 else 1
+    except ValueError:
+        return None
+    return y * 10000 + m * 100 + d
+
+def _agg_group_cols(group_by):
+    cols = [group_by] if isinstance(group_by, str) else list(group_by or [])
+    for c in cols:
+        if c not in _AGG_KEYS:
+            raise ValueError(f"不支持的汇总维度: {c}")
+    return cols
+
+def _agg_source(lo: Optional[int], hi: Optional[int]):
+    # 起止都落在月初时读按月汇总表，否则读按日汇总表
+    if (lo is None or lo % 100 == 1) and (hi is None or hi % 100 == 1):
+        return "agg_monthly", "ym", (lo // 100 if lo is not None else None), (hi // 100 if hi is not None else None)
+    return "agg_daily", "ymd", lo, hi
+
+def get_period_totals(start=None, end=None, group_by="ttype", ttype: str = "") -> Dict:
+    # 区间为 [start, end)；group_by 可为单个维度或维度元组（ttype/category/account）
+    cols = _agg_group_cols(group_by)
+    table, pcol, lo, hi = _agg_source(_ymd_key(start), _ymd_key(end))
+    where = []
+    args = []
+    if lo is not None:
+        where.append(f"{pcol}>=?")
+        args.append(lo)
+    if hi is not None:
+        where.append(f"{pcol}<?")
+        args.append(hi)
+    if ttype:
+        where.append("ttype=?")
+        args.append(ttype)
+    sel = ", ".join(cols) if cols else "''"
+    sql = f"SELECT {sel}, SUM(sum) AS s FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if cols:
+        sql += " GROUP BY " + ", ".join(cols)
+    res = {}
+    for r in _db().execute(sql, args).fetchall():
+        key = r[0] if len(cols) <= 1 else tuple(r[i] for i in range(len(cols)))
+        res[key] = float(r["s"] or 0)
+    return res
+
+def get_bucket_series(start=None, end=None, bucket: str = "day", ttypes: List[str] = None) -> Dict[str, Dict[str, float]]:
+    # 返回 {桶: {ttype: 金额}}，桶键为 "YYYY-MM-DD" / "YYYY-MM" / "YYYY"
+    lo = _ymd_key(start)
+    hi = _ymd_key(end)
+    if bucket == "day":
+        table, pcol = "agg_daily", "ymd"
+        expr = "ymd"
+    else:
+        table, pcol, lo, hi = _agg_source(lo, hi)
+        div = (1 if pcol == "ym" else 100) * (1 if bucket == "month" else 100)
+        expr = pcol if div == 1 else f"{pcol} / {div}"
+    where = []
+    args = []
+    if lo is not None:
+        where.append(f"{pcol}>=?")
+        args.append(lo)
+    if hi is not None:
+        where.append(f"{pcol}<?")
+        args.append(hi)
+    if ttypes:
+        where.append("ttype IN (" + ",".join("?" * len(ttypes)) + ")")
+        args.extend(ttypes)
+    sql = f"SELECT {expr} AS b, ttype, SUM(sum) AS s FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " GROUP BY 1, 2 ORDER BY 1"
+    res: Dict[str, Dict[str, float]] = {}
+    for r in _db().execute(sql, args).fetchall():
+        b = int(r["b"])
+        if bucket == "day":
+            key = f"{b // 10000:04d}-{b // 100 % 100:02d}-{b % 100:02d}"
+        elif bucket == "month":
+            key = f"{b // 100:04d}-{b % 100:02d}"
+        else:
+            key = f"{b:04d}"
+        res.setdefault(key, {})[r["ttype"]] = float(r["s"] or 0)
     return res
 
+def _json_periods() -> set:
+    out = set()
+    for t in _tx_list(load_state()):
+        y, ym = _time_keys(t.get("time"))[1:3]
+        if y is not None:
+            out.add((y, ym))
+    return out
+
 def list_years() -> List[str]:
-    _init_db()
+    if not _uses_sqlite():
+        return [f"{y:04d}" for y in sorted({y for y, _ in _json_periods()})]
     conn = _db()
     cur = conn.cursor()
-    cur.execute("SELECT DISTINCT substr(time,1,4) AS y FROM transactions ORDER BY y")
-    ys = [r["y"] for r in cur.fetchall()]
-    conn.close()
+    cur.execute("SELECT DISTINCT year AS y FROM transactions WHERE year IS NOT NULL ORDER BY y")
+    ys = [f"{int(r['y']):04d}" for r in cur.fetchall()]
     return ys
 
 def list_months(year: str) -> List[str]:
-    _init_db()
+    if not _uses_sqlite():
+        y = int(year[:4]) if year and year[:4].isdigit() else None
+        ms = sorted({ym for yy, ym in _json_periods() if y is None or yy == y})
+        return [f"{m // 100:04d}-{m % 100:02d}" for m in ms]
     conn = _db()
     cur = conn.cursor()
-    if year:
-        cur.execute("SELECT DISTINCT substr(time,1,7) AS m FROM transactions WHERE substr(time,1,4)=? ORDER BY m", (year,))
+    if year and year[:4].isdigit():
+        cur.execute("SELECT DISTINCT ym AS m FROM transactions WHERE year=? ORDER BY m", (int(year[:4]),))
     else:
-        cur.execute("SELECT DISTINCT substr(time,1,7) AS m FROM transactions ORDER BY m")
-    ms = [r["m"] for r in cur.fetchall()]
-    conn.close()
+        cur.execute("SELECT DISTINCT ym AS m FROM transactions WHERE ym IS NOT NULL ORDER BY m")
+    ms = [f"{int(r['m']) // 100:04d}-{int(r['m']) % 100:02d}" for r in cur.fetchall()]
     return ms
 
 def sync_batch_to_db(rows: List[Dict]):
-    if _get_backend() != "sqlite":
+    if not _uses_sqlite():
         return
-    _init_db()
     conn = _db()
     cur = conn.cursor()
     try:
-        data = []
-        for t in rows:
-            data.append((
-                t.get("id"), t.get("time"), float(t.get("amount",0)), t.get("category"), 
-                t.get("ttype"), t.get("account"), t.get("to_account"), t.get("from_account"), 
-                t.get("note"), t.get("record_time"), t.get("record_source")
-            ))
-        cur.executemany("INSERT OR IGNORE INTO transactions(id, time, amount, category, ttype, account, to_account, from_account, note, record_time, record_source) VALUES(?,?,?,?,?,?,?,?,?,?,?)", data)
+        data = [_tx_row(t) for t in rows]
+        cur.executemany(_TX_INSERT_SQL, data)
         conn.commit()
     except Exception:
-        pass
-    finally:
-        conn.close()
+        conn.rollback()
 
 def clear_all_transactions_db():
-    if _get_backend() != "sqlite":
+    if not _uses_sqlite():
         return
-    _init_db()
     conn = _db()
     cur = conn.cursor()
     try:
         cur.execute("DELETE FROM transactions")
         conn.commit()
     except Exception:
-        pass
-    finally:
-        conn.close()
+        conn.rollback()
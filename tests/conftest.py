@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+from models import Account
+from utils import gen_id
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    # 每个用例一份独立账本：DATA_DIR 及由它导出的全部路径（备份对象/清单、用户目录、投资账本等）都改到临时目录，
+    # 结束时等后台写盘完成并切回默认账本
+    data_dir = storage.DATA_DIR
+    for name, value in list(vars(storage).items()):
+        if name.isupper() and isinstance(value, str) and (value == data_dir or value.startswith(data_dir + os.sep)):
+            monkeypatch.setattr(storage, name, str(tmp_path / "data") + value[len(data_dir):])
+
+    def make(backend="sqlite", name="ledger"):
+        os.makedirs(str(tmp_path / name), exist_ok=True)
+        storage.set_ledger_path(str(tmp_path / name / "ledger.json"))
+        s = storage.load_state()
+        s["prefs"]["storage_backend"] = backend
+        storage.save_state(s)
+        return s
+
+    yield make
+    storage.flush_saves()
+    storage.set_ledger_path(None)
+
+
+@pytest.fixture
+def tx():
+    def make(time, amount, account="现金", ttype="支出", category="三餐", note=""):
+        return {"id": gen_id(), "time": time, "amount": amount, "category": category, "ttype": ttype,
+                "account": account, "to_account": None, "from_account": None, "note": note,
+                "record_time": "2024-06-01T00:00:00", "record_source": "手动输入"}
+    return make
+
+
+@pytest.fixture
+def sample_rows(tx):
+    # 跨年、同一时刻、未分类与不同账户各有一条，覆盖筛选与排序的边界
+    return [
+        tx("2023-12-31T23:59:00", 30.0, note="跨年"),
+        tx("2024-01-05T08:00:00", 12.5, category="交通"),
+        tx("2024-01-05T08:00:00", 12.5, account="银行卡", note="同一时刻"),
+        tx("2024-02-10T12:00:00", 88.0, ttype="收入", category="工资", account="银行卡"),
+        tx("2024-02-11T12:00:00", 7.0, category="", note="午饭"),
+        tx("2024-03-01T00:00:00", 120.0, category="交通", note="火车票"),
+    ]
+
+
+def _seed(s, rows):
+    storage.add_account(s, Account(name="现金", balance=0.0))
+    storage.add_account(s, Account(name="银行卡", balance=0.0))
+    with storage.get_ledger_store().batch(s) as b:
+        for r in rows:
+            b.add(dict(r))
+
+
+@pytest.fixture
+def seeded(ledger):
+    def make(rows, backend="sqlite", name="ledger"):
+        s = ledger(backend, name)
+        _seed(s, rows)
+        return s
+    return make
+
+
+@pytest.fixture
+def reload():
+    # 等后台写盘完成后丢弃缓存，从磁盘重新读取账本（模拟重新启动）
+    def run():
+        storage.flush_saves()
+        storage.get_ledger_store().invalidate()
+        return storage.load_state()
+    return run
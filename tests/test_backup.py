@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+
+import storage
+from models import Account
+
+BACKENDS = ["sqlite", "json"]
+
+
+def _ids(s):
+    return sorted(t.id for t in storage.iter_transactions())
+
+
+def _manifest(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_restore_brings_back_backed_up_ledger(tmp_path, ledger, tx, backend):
+    s = ledger(backend)
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    keep = [tx("2024-01-01T10:00:00", 30.0), tx("2024-02-01T10:00:00", 5.0)]
+    with storage.get_ledger_store().batch(s) as b:
+        for t in keep:
+            b.add(t)
+    mpath = storage.backup_state()
+    # 备份写在临时数据目录下，不碰仓库里的 data/
+    assert mpath.startswith(str(tmp_path))
+
+    with storage.get_ledger_store().batch(s) as b:
+        b.delete(keep[0]["id"])
+        b.add(tx("2024-03-01T10:00:00", 1.0))
+    storage.find_account(s, "现金")["note"] = "改过"
+    storage.save_state(s)
+
+    assert storage.restore_backup(mpath) == 2
+    s = storage.load_state()
+    assert _ids(s) == sorted(t["id"] for t in keep)
+    a = storage.find_account(s, "现金")
+    assert a["balance"] == 65.0
+    assert a["note"] == ""
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_unchanged_months_are_not_stored_again(ledger, tx, backend):
+    s = ledger(backend)
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    with storage.get_ledger_store().batch(s) as b:
+        b.add(tx("2024-01-01T10:00:00", 30.0))
+        b.add(tx("2024-02-01T10:00:00", 5.0))
+    first = _manifest(storage.backup_state())
+    assert first["new_bytes"] > 0
+    with storage.get_ledger_store().batch(s) as b:
+        b.add(tx("2024-02-02T10:00:00", 1.0))
+    second = _manifest(storage.backup_state())
+    months1 = {ym: h for ym, h, _ in first["months"]}
+    months2 = {ym: h for ym, h, _ in second["months"]}
+    # 一月未改动，沿用同一分块；二月有新账单，写了新分块
+    assert months2[202401] == months1[202401]
+    assert months2[202402] != months1[202402]
+    assert second["rows"] == 3
+
+
+def test_retention_prunes_old_manifests_and_objects(ledger, tx):
+    s = ledger("json")
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    for i in range(4):
+        with storage.get_ledger_store().batch(s) as b:
+            b.add(tx(f"2024-0{i + 1}-01T10:00:00", 1.0))
+        storage.backup_state()
+    assert len(storage.list_backups()) == 4
+    storage.set_backup_retention(last=2, daily=0, weekly=0)
+    items = storage.list_backups()
+    assert len(items) == 2
+    # 剩下的清单引用的分块都还在
+    for m in items:
+        man = _manifest(m["path"])
+        for _, h, _ in man["months"]:
+            assert os.path.isfile(os.path.join(storage.BACKUP_OBJECT_DIR, h[:2], h))
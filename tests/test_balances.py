@@ -0,0 +1,99 @@
+import pytest
+
+import storage
+from models import Account
+
+BACKENDS = ["sqlite", "json"]
+
+
+def _balance(s, name):
+    return storage.find_account(s, name)["balance"]
+
+
+def _opening(s, name):
+    return storage.find_account(s, name)["opening_balance"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_recompute_balances_keeps_opening_balances(ledger, tx, backend):
+    s = ledger(backend)
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    storage.add_account(s, Account(name="银行卡", balance=2500.0))
+    with storage.get_ledger_store().batch(s) as b:
+        b.add(tx("2024-01-01T10:00:00", 30.0))
+        b.add(tx("2024-01-02T10:00:00", 500.0, ttype="收入", category="工资", account="银行卡"))
+    assert _balance(s, "现金") == 70.0
+    assert _balance(s, "银行卡") == 3000.0
+
+    res = storage.recompute_balances(s)
+    assert res["diff"] == {}
+    assert res["balances"] == {"现金": 70.0, "银行卡": 3000.0}
+
+    # 手改余额视为校正期初值，重算后保留
+    storage.set_account_balance(s, "现金", 80.0)
+    res = storage.recompute_balances(s)
+    assert res["diff"] == {}
+    assert _balance(s, "现金") == 80.0
+
+    # 余额被改乱后按期初值 + 账单恢复
+    storage.find_account(s, "银行卡")["balance"] = 0.0
+    res = storage.recompute_balances(s)
+    assert res["applied"]
+    assert _balance(s, "银行卡") == 3000.0
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_undo_override_import_restores_opening_balances(ledger, tx, backend):
+    s = ledger(backend)
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    with storage.get_ledger_store().batch(s, label="记账") as b:
+        b.add(tx("2024-01-01T10:00:00", 30.0))
+    with storage.get_ledger_store().batch(s, label="覆盖导入") as b:
+        b.clear()
+        b.add(tx("2024-02-01T10:00:00", 20.0), apply_delta=False)
+        b.rebalance()
+    assert _balance(s, "现金") == -20.0
+    assert _opening(s, "现金") == 0.0
+
+    storage.undo_last()
+    s = storage.load_state()
+    assert _balance(s, "现金") == 70.0
+    assert _opening(s, "现金") == 100.0
+    assert storage.recompute_balances(s, apply=False)["diff"] == {}
+
+    storage.redo()
+    s = storage.load_state()
+    assert _balance(s, "现金") == -20.0
+    assert _opening(s, "现金") == 0.0
+    assert storage.recompute_balances(s, apply=False)["diff"] == {}
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_legacy_opening_is_derived_once_and_kept(tmp_path, ledger, tx, backend):
+    import json
+    ledger(backend)
+    # 旧账本：账户没有 opening_balance，余额已含账单变动
+    legacy = storage.default_state()
+    legacy["prefs"]["storage_backend"] = backend
+    legacy["accounts"] = [{"name": "现金", "balance": 70.0, "type": "现金", "note": ""}]
+    legacy["transactions"] = [tx("2024-01-01T10:00:00", 30.0)]
+    path = tmp_path / "legacy" / "ledger.json"
+    path.parent.mkdir()
+    path.write_text(json.dumps(legacy, ensure_ascii=False), encoding="utf-8")
+    storage.set_ledger_path(str(path))
+
+    s = storage.load_state()
+    assert _opening(s, "现金") == 100.0
+    assert storage.recompute_balances(s)["diff"] == {}
+
+    # 之后余额被改乱并保存；重新载入时不再倒推，重算以记下的期初值为准
+    storage.find_account(s, "现金")["balance"] = 12345.0
+    storage.save_state(s)
+    storage.flush_saves()
+    storage.set_ledger_path(None)
+    storage.set_ledger_path(str(path))
+    s = storage.load_state()
+    assert _opening(s, "现金") == 100.0
+    res = storage.recompute_balances(s)
+    assert res["diff"] == {"现金": (12345.0, 70.0, -12275.0)}
+    assert _balance(s, "现金") == 70.0
@@ -0,0 +1,65 @@
+import codecs
+
+import pytest
+
+import importers
+
+
+@pytest.mark.parametrize("text, enc, expected", [
+    ("交易时间,金额\n", "utf-8", "utf-8"),
+    ("交易时间,金额\n", "gbk", "gbk"),
+    ("交易时间,金额,㐀\n", "gb18030", "gb18030"),
+])
+def test_detect_encoding(text, enc, expected):
+    assert importers.detect_encoding(text.encode(enc), final=True) == expected
+
+
+def test_detect_encoding_prefers_bom():
+    assert importers.detect_encoding(codecs.BOM_UTF8 + "金额".encode("utf-8")) == "utf-8-sig"
+
+
+def test_truncated_multibyte_char_at_probe_end_is_not_an_error():
+    head = ("金额" * 10).encode("utf-8")[:-1]
+    assert importers.detect_encoding(head) == "utf-8"
+
+
+@pytest.fixture
+def small_probe(monkeypatch):
+    monkeypatch.setattr(importers, "ENCODING_PROBE_BYTES", 64)
+    monkeypatch.setattr(importers, "ENCODING_PROBE_MAX", 128)
+
+
+def test_csv_falls_back_to_gbk_after_ascii_probe(tmp_path, small_probe):
+    # 开头全是 ASCII、识别按 UTF-8，中文出现在识别范围之后
+    p = tmp_path / "bill.csv"
+    lines = ["time,amount,note"] + [f"2024-01-01 10:00:{i:02d},1.00,abc" for i in range(40)] + ["2024-01-02 10:00:00,2.00,午餐"]
+    p.write_bytes(("\n".join(lines) + "\n").encode("gbk"))
+    stats = {}
+    rows = list(importers.iter_csv_rows(str(p), stats))
+    assert len(rows) == 42
+    assert rows[-1] == ["2024-01-02 10:00:00", "2.00", "午餐"]
+    assert stats["encodings"] == ["gbk"]
+    assert stats["bytes_read"] == stats["bytes_total"] == p.stat().st_size
+
+
+def test_csv_falls_back_from_gbk_to_gb18030(tmp_path, small_probe):
+    p = tmp_path / "bill.csv"
+    p.write_bytes(("备注\n" + "午餐\n" * 40 + "生僻字㐀\n").encode("gb18030"))
+    stats = {}
+    rows = list(importers.iter_csv_rows(str(p), stats))
+    assert rows[-1] == ["生僻字㐀"]
+    assert rows[1:-1] == [["午餐"]] * 40
+    assert stats["encodings"] == ["gb18030"]
+
+
+def test_csv_decode_error_after_non_ascii_rows_is_raised(tmp_path, small_probe):
+    p = tmp_path / "mixed.csv"
+    p.write_bytes("备注\n".encode("utf-8") + b"x\n" * 200 + "午餐\n".encode("gbk"))
+    with pytest.raises(UnicodeDecodeError):
+        list(importers.iter_csv_rows(str(p)))
+
+
+def test_txt_import_reads_with_fallback(tmp_path, small_probe):
+    p = tmp_path / "bill.txt"
+    p.write_bytes(b"a\tb\n" * 100 + "午餐\n".encode("gbk"))
+    assert importers._read_text(str(p)).endswith("午餐\n")
@@ -0,0 +1,75 @@
+import pytest
+
+import storage
+from models import Account
+
+BACKENDS = ["sqlite", "json"]
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _ids():
+    return [t.id for t in storage.iter_transactions()]
+
+
+def _balance(s, name):
+    return storage.find_account(s, name)["balance"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_import_rolls_back_committed_chunks_on_error(ledger, tx, backend):
+    s = ledger(backend)
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    storage.save_state(s)
+
+    def rows():
+        for i in range(5):
+            yield tx(f"2024-01-0{i + 1}T10:00:00", 10.0, note=f"r{i}")
+        raise ValueError("第6行 金额格式错误")
+
+    with pytest.raises(ValueError):
+        storage.import_transactions(rows(), s, chunk_size=2)
+    assert _ids() == []
+    assert _balance(s, "现金") == 100.0
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_import_rolls_back_committed_chunks_on_cancel(ledger, tx, backend):
+    s = ledger(backend)
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    storage.save_state(s)
+    rows = [tx(f"2024-01-0{i + 1}T10:00:00", 10.0, note=f"r{i}") for i in range(6)]
+
+    def progress(st):
+        if st["imported"] >= 4:
+            raise _Cancelled()
+
+    with pytest.raises(_Cancelled):
+        storage.import_transactions(iter(rows), s, chunk_size=2, progress=progress)
+    assert _ids() == []
+    assert _balance(s, "现金") == 100.0
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_import_dedupes_within_and_across_chunks(ledger, tx, backend):
+    s = ledger(backend)
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    with storage.get_ledger_store().batch(s) as b:
+        b.add(tx("2024-01-01T10:00:00", 5.0, note="已有"))
+    rows = [
+        tx("2024-01-01T10:00:00", 5.0, note="已有"),
+        tx("2024-01-02T10:00:00", 1.0, note="a"),
+        tx("2024-01-02T10:00:00", 1.0, note="a"),
+        tx("2024-01-03T10:00:00", 2.0, note="b"),
+        tx("2024-01-04T10:00:00", 3.0, note="c"),
+        tx("2024-01-02T10:00:00", 1.0, note="a"),
+        tx("2024-01-03T10:00:00", 2.0, note="b"),
+    ]
+    stats = storage.import_transactions(iter(rows), s, chunk_size=3)
+    assert stats["read"] == 7
+    assert stats["imported"] == 3
+    assert stats["duplicates"] == 4
+    assert len(_ids()) == 4
+    assert _balance(s, "现金") == 89.0
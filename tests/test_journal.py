@@ -0,0 +1,69 @@
+import json
+import os
+
+import storage
+from models import Account
+
+
+def _journal(path):
+    return os.path.splitext(path)[0] + ".journal"
+
+
+def _snapshot_ids(path):
+    with open(path, encoding="utf-8") as f:
+        return [t["id"] for t in json.load(f).get("transactions", [])]
+
+
+def test_json_saves_append_to_journal_and_replay_on_load(ledger, tx, reload):
+    s = ledger("json")
+    path = storage.get_current_ledger_path()
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    a, b = tx("2024-01-01T10:00:00", 30.0), tx("2024-01-02T10:00:00", 5.0)
+    with storage.get_ledger_store().batch(s) as bt:
+        bt.add(a)
+        bt.add(b)
+    with storage.get_ledger_store().batch(s) as bt:
+        bt.delete(a["id"])
+    storage.flush_saves()
+    # 快照不再整份重写，改动都在日志里
+    assert os.path.isfile(_journal(path))
+    assert a["id"] not in _snapshot_ids(path) and b["id"] not in _snapshot_ids(path)
+
+    s = reload()
+    assert [t["id"] for t in s["transactions"]] == [b["id"]]
+    assert storage.find_account(s, "现金")["balance"] == 95.0
+
+
+def test_torn_journal_tail_is_dropped(ledger, tx, reload):
+    s = ledger("json")
+    path = storage.get_current_ledger_path()
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    t = tx("2024-01-01T10:00:00", 30.0)
+    with storage.get_ledger_store().batch(s) as bt:
+        bt.add(t)
+    storage.flush_saves()
+    size = os.path.getsize(_journal(path))
+    # 写到一半时崩溃：末行不完整
+    with open(_journal(path), "ab") as f:
+        f.write(b'{"seq":999,"op":"set","key":"accounts","value":[')
+
+    s = reload()
+    assert [x["id"] for x in s["transactions"]] == [t["id"]]
+    assert storage.find_account(s, "现金")["balance"] == 70.0
+    assert os.path.getsize(_journal(path)) == size
+
+
+def test_compact_folds_journal_into_snapshot(ledger, tx, reload):
+    s = ledger("json")
+    path = storage.get_current_ledger_path()
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    t = tx("2024-01-01T10:00:00", 30.0)
+    with storage.get_ledger_store().batch(s) as bt:
+        bt.add(t)
+    assert storage.compact_journal()
+    assert not os.path.isfile(_journal(path))
+    assert _snapshot_ids(path) == [t["id"]]
+
+    s = reload()
+    assert [x["id"] for x in s["transactions"]] == [t["id"]]
+    assert storage.find_account(s, "现金")["balance"] == 70.0
@@ -0,0 +1,41 @@
+import pytest
+
+import storage
+
+ORDERS = [
+    {"order_col": "time"},
+    {"order_col": "time", "order_desc": True},
+    {"order_col": "amount"},
+    {"order_col": "amount", "order_desc": True},
+    {"order_col": "category"},
+    {"year": "2024", "order_col": "time"},
+    {"year": "2024", "month": "2024-01", "order_col": "time", "order_desc": True},
+]
+
+
+def _walk(filters, direction="next"):
+    ids = []
+    cursor = None
+    while True:
+        page = storage.query_transactions_page(dict(filters), page_size=2, cursor=cursor)
+        ids.extend(r["id"] for r in page["rows"])
+        cursor = page["next"]
+        if not cursor:
+            return ids
+
+
+@pytest.mark.parametrize("filters", ORDERS)
+def test_keyset_pages_cover_result_in_order(seeded, sample_rows, filters):
+    seeded(sample_rows)
+    expected = [t.id for t in storage.iter_transactions(dict(filters))]
+    assert _walk(filters) == expected
+
+
+def test_keyset_prev_returns_previous_page(seeded, sample_rows):
+    seeded(sample_rows)
+    f = {"order_col": "time"}
+    first = storage.query_transactions_page(dict(f), page_size=2)
+    second = storage.query_transactions_page(dict(f), page_size=2, cursor=first["next"])
+    back = storage.query_transactions_page(dict(f), page_size=2, cursor=second["prev"], direction="prev")
+    assert [r["id"] for r in back["rows"]] == [r["id"] for r in first["rows"]]
+    assert first["prev"] is None
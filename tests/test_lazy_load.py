@@ -0,0 +1,46 @@
+import pytest
+
+import storage
+from models import Account
+
+
+@pytest.fixture
+def saved_ledger(ledger, tx):
+    s = ledger("json")
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    rows = [tx(f"2024-01-0{i + 1}T10:00:00", 10.0, note=f"r{i}") for i in range(3)]
+    with storage.get_ledger_store().batch(s) as b:
+        for r in rows:
+            b.add(r)
+    storage.compact_journal()
+    return rows
+
+
+def test_transactions_are_parsed_on_first_access(saved_ledger, reload):
+    s = reload()
+    assert not s.tx_loaded()
+    assert storage.find_account(s, "现金")["balance"] == 70.0
+    assert "transactions" in s
+    assert [t["id"] for t in s["transactions"]] == [r["id"] for r in saved_ledger]
+    assert s.tx_loaded()
+
+
+def test_unloaded_transactions_survive_a_save(saved_ledger, reload):
+    s = reload()
+    s["categories"]["支出"].append("宠物")
+    storage.save_state(s)
+    storage.compact_journal()
+    assert not s.tx_loaded()
+    s = reload()
+    assert "宠物" in s["categories"]["支出"]
+    assert [t["id"] for t in s["transactions"]] == [r["id"] for r in saved_ledger]
+
+
+def test_journal_tx_records_replay_after_lazy_load(saved_ledger, tx, reload):
+    s = reload()
+    extra = tx("2024-02-01T10:00:00", 1.0)
+    with storage.get_ledger_store().batch(s) as b:
+        b.add(extra)
+    s = reload()
+    assert not s.tx_loaded()
+    assert [t["id"] for t in s["transactions"]] == [r["id"] for r in saved_ledger] + [extra["id"]]
@@ -0,0 +1,60 @@
+import os
+import time
+
+import pytest
+
+import importers
+
+
+def _slow_name(path):
+    # 排在前面的文件解析得更慢，完成顺序与提交顺序相反
+    n = int(os.path.basename(path).split(".")[0])
+    time.sleep(0.05 * (4 - n))
+    return os.path.basename(path)
+
+
+def _fail_on_two(path):
+    if os.path.basename(path).startswith("2"):
+        raise ValueError(f"无法识别文件：{path}")
+    return os.path.basename(path)
+
+
+def _paths(tmp_path, n=5):
+    out = []
+    for i in range(n):
+        p = tmp_path / f"{i}.csv"
+        p.write_text("a\n", encoding="utf-8")
+        out.append(str(p))
+    return out
+
+
+def _standard_csv(path, start, n):
+    lines = [",".join(importers.STANDARD_TEMPLATE_COLUMNS)]
+    for i in range(start, start + n):
+        lines.append(f"2024-01-01 10:{i // 60:02d}:{i % 60:02d},{i}.00,三餐,支出,现金,,,第{i}条")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_map_files_yields_in_submission_order(tmp_path):
+    paths = _paths(tmp_path)
+    assert list(importers.map_files(_slow_name, paths, workers=2)) == [os.path.basename(p) for p in paths]
+
+
+def test_map_files_raises_when_one_file_fails(tmp_path):
+    paths = _paths(tmp_path)
+    got = []
+    with pytest.raises(ValueError):
+        for name in importers.map_files(_fail_on_two, paths, workers=2):
+            got.append(name)
+    assert got == ["0.csv", "1.csv"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_iter_import_files_merges_in_file_order(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(importers, "IMPORT_WORKERS", workers)
+    paths = [_standard_csv(tmp_path / f"{k}.csv", k * 10, 10) for k in range(3)]
+    stats = {}
+    rows = list(importers.iter_import_files(paths, ["现金"], "standard", stats))
+    assert [r["note"] for r in rows] == [f"第{i}条" for i in range(30)]
+    assert stats["bytes_read"] == stats["bytes_total"] == sum(os.path.getsize(p) for p in paths)
@@ -0,0 +1,68 @@
+import pytest
+
+import storage
+from models import Account
+
+BACKENDS = ["sqlite", "json"]
+
+
+def _rows():
+    return {t.id: (t.amount, t.note) for t in storage.iter_transactions()}
+
+
+def _balance(name):
+    return storage.find_account(storage.load_state(), name)["balance"]
+
+
+@pytest.fixture
+def edited(ledger, tx):
+    # 一批记账之后，再有一批同时新增、修改、删除的操作
+    def make(backend):
+        s = ledger(backend)
+        storage.add_account(s, Account(name="现金", balance=100.0))
+        a, b = tx("2024-01-01T10:00:00", 30.0, note="a"), tx("2024-01-02T10:00:00", 5.0, note="b")
+        with storage.get_ledger_store().batch(s, label="记账") as bt:
+            bt.add(a)
+            bt.add(b)
+        before = _rows()
+        c = tx("2024-01-03T10:00:00", 7.0, note="c")
+        with storage.get_ledger_store().batch(s, label="批量修改") as bt:
+            bt.update(a["id"], dict(a, amount=40.0, note="a2"))
+            bt.delete(b["id"])
+            bt.add(c)
+        return before, _rows()
+    return make
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_undo_and_redo_round_trip(edited, backend):
+    before, after = edited(backend)
+    assert _balance("现金") == 53.0
+    assert [op["label"] for op in storage.list_operations()] == ["批量修改", "记账"]
+
+    assert storage.undo_last()["label"] == "批量修改"
+    assert _rows() == before
+    assert _balance("现金") == 65.0
+    assert storage.list_operations()[0]["undone"]
+
+    assert storage.redo()["label"] == "批量修改"
+    assert _rows() == after
+    assert _balance("现金") == 53.0
+    assert storage.redo() is None
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_failed_undo_leaves_ledger_unchanged(edited, backend, monkeypatch):
+    _, after = edited(backend)
+    apply = storage._op_log_apply
+
+    def broken(s, payload, undo):
+        apply(s, payload, undo)
+        raise OSError("磁盘已满")
+
+    monkeypatch.setattr(storage, "_op_log_apply", broken)
+    with pytest.raises(OSError):
+        storage.undo_last()
+    assert _rows() == after
+    assert _balance("现金") == 53.0
+    assert not storage.list_operations()[0]["undone"]
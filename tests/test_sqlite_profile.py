@@ -0,0 +1,46 @@
+import json
+import os
+
+import storage
+
+
+def test_profile_is_written_to_prefs_not_ledger(ledger):
+    ledger("sqlite")
+    storage.flush_saves()
+    path = storage.get_current_ledger_path()
+    before = os.stat(path).st_mtime_ns, os.path.getsize(path)
+    storage.set_sqlite_profile("performance")
+    storage.flush_saves()
+    assert (os.stat(path).st_mtime_ns, os.path.getsize(path)) == before
+    with open(storage.get_prefs_path(), encoding="utf-8") as f:
+        assert json.load(f)["sqlite_profile"] == "performance"
+    assert storage.get_sqlite_profile_name() == "performance"
+    assert storage.get_sqlite_profile() == storage.SQLITE_PROFILES["performance"]
+
+
+def test_unknown_profile_falls_back_to_default(ledger):
+    ledger("sqlite")
+    storage.set_sqlite_profile("turbo")
+    assert storage.get_sqlite_profile_name() == storage.DEFAULT_SQLITE_PROFILE
+
+
+def test_legacy_ledger_profile_is_still_honoured(ledger):
+    s = ledger("json")
+    storage.get_pref("theme")
+    s["prefs"]["sqlite_profile"] = "default"
+    storage.save_state(s)
+    assert storage.get_pref("sqlite_profile") is None
+    assert storage.get_sqlite_profile_name() == "default"
+    storage.set_sqlite_profile("performance")
+    assert storage.get_sqlite_profile_name() == "performance"
+
+
+def test_first_run_moves_profile_out_of_ledger(ledger, reload):
+    s = ledger("sqlite")
+    s["prefs"]["sqlite_profile"] = "performance"
+    storage.save_state(s)
+    if os.path.exists(storage.get_prefs_path()):
+        os.remove(storage.get_prefs_path())
+    storage._prefs_store._data = None
+    assert storage.get_sqlite_profile_name() == "performance"
+    assert "sqlite_profile" not in reload()["prefs"]
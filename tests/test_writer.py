@@ -0,0 +1,44 @@
+import json
+import os
+
+import pytest
+
+import storage
+from models import Account
+
+
+def test_background_write_errors_reach_the_caller(ledger):
+    s = ledger("sqlite")
+    path = storage.get_current_ledger_path()
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    storage.save_state(s)
+    storage.flush_saves()
+    # 临时文件位置被目录占住，后台写盘必然失败
+    os.mkdir(path + ".tmp")
+    storage.save_state(s)
+    with pytest.raises(storage.LedgerSaveError):
+        storage.flush_saves()
+
+    storage.save_state(s)
+    # 只等写盘结束，不取走错误
+    storage._writer.flush()
+    os.rmdir(path + ".tmp")
+    # 上次失败由下一次保存报告，本次已把整份快照重新排队
+    with pytest.raises(storage.LedgerSaveError):
+        storage.save_state(s)
+    assert storage.flush_saves()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["accounts"][0]["name"] == "现金"
+
+
+def test_queued_snapshot_keeps_values_after_rename(ledger, tx):
+    s = ledger("sqlite")
+    storage.add_account(s, Account(name="现金", balance=100.0))
+    with storage.get_ledger_store().batch(s) as b:
+        b.add(tx("2024-01-01T10:00:00", 30.0, category="三餐"))
+    snap, _ = storage._ledger_snapshot(s)
+    storage.rename_account(s, "现金", "钱包")
+    storage.rename_category(s, "支出", "三餐", "餐饮", update_history=True)
+    assert (snap["transactions"][0]["account"], snap["transactions"][0]["category"]) == ("现金", "三餐")
+    assert (s["transactions"][0]["account"], s["transactions"][0]["category"]) == ("钱包", "餐饮")
+    assert [(t.account, t.category) for t in storage.iter_transactions()] == [("钱包", "餐饮")]
@@ -0,0 +1,56 @@
+import zipfile
+
+import pytest
+
+import xlsx_reader
+
+NS = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+REL_NS = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+
+
+def _sheet(rows):
+    return f'<worksheet {NS}><sheetData>{"".join(rows)}</sheetData></worksheet>'
+
+
+def _workbook(tmp_path, sheets, shared=None):
+    # 最小工作簿：sheets 为 [(名称, 工作表 XML)]，shared 为共享字符串 <si> 片段
+    path = tmp_path / "book.xlsx"
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("xl/workbook.xml", f'<workbook {NS} {REL_NS}><sheets>' + "".join(
+            f'<sheet name="{name}" sheetId="{i + 1}" r:id="rId{i + 1}"/>' for i, (name, _) in enumerate(sheets)) + "</sheets></workbook>")
+        z.writestr("xl/_rels/workbook.xml.rels", '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">' + "".join(
+            f'<Relationship Id="rId{i + 1}" Target="worksheets/s{i + 1}.xml"/>' for i in range(len(sheets))) + "</Relationships>")
+        for i, (_, xml) in enumerate(sheets):
+            z.writestr(f"xl/worksheets/s{i + 1}.xml", xml)
+        if shared is not None:
+            z.writestr("xl/sharedStrings.xml", f'<sst {NS}>{"".join(shared)}</sst>')
+    return str(path)
+
+
+def test_rows_with_shared_inline_and_sparse_cells(tmp_path):
+    shared = ["<si><t>交易时间</t></si>", "<si><t>金额</t></si>", "<si><r><t>午</t></r><r><t>餐</t></r></si>"]
+    rows = [
+        '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c><c r="C1" t="inlineStr"><is><t>备注</t></is></c></row>',
+        '<row r="2"><c r="A2" t="str"><v>2024-01-01 10:00:00</v></c><c r="B2"><v>12.5</v></c><c r="C2" t="s"><v>2</v></c></row>',
+        '<row r="3"><c r="A3" t="str"><v>2024-01-02 10:00:00</v></c><c r="C3" t="inlineStr"><is><r><t>晚</t></r><r><t>饭</t></r></is></c></row>',
+    ]
+    path = _workbook(tmp_path, [("账单", _sheet(rows))], shared)
+    assert xlsx_reader.read_xlsx_rows(path) == [
+        ["交易时间", "金额", "备注"],
+        ["2024-01-01 10:00:00", "12.5", "午餐"],
+        ["2024-01-02 10:00:00", "", "晚饭"],
+    ]
+    recs = xlsx_reader.read_xlsx(path)
+    assert [(r["交易时间"], r["备注"]) for r in recs] == [("2024-01-01 10:00:00", "午餐"), ("2024-01-02 10:00:00", "晚饭")]
+
+
+def test_sheet_selection_by_name_and_index(tmp_path):
+    first = _sheet(['<row r="1"><c r="A1" t="inlineStr"><is><t>一</t></is></c></row>'])
+    second = _sheet(['<row r="1"><c r="B1" t="inlineStr"><is><t>二</t></is></c></row>'])
+    path = _workbook(tmp_path, [("说明", first), ("明细", second)])
+    assert xlsx_reader.list_sheets(path) == ["说明", "明细"]
+    assert xlsx_reader.read_xlsx_rows(path) == [["一"]]
+    assert xlsx_reader.read_xlsx_rows(path, sheet="明细") == [["", "二"]]
+    assert xlsx_reader.read_xlsx_rows(path, sheet=1) == [["", "二"]]
+    with pytest.raises(ValueError):
+        xlsx_reader.read_xlsx_rows(path, sheet="不存在")
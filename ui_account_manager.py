@@ -2,7 +2,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import os
 from datetime import datetime
-from storage import load_state, save_state, add_account, remove_account, rename_account, find_account, get_account_types, get_account_names, apply_transaction_delta, add_category
+from storage import load_state, save_state, add_account, remove_account, rename_account, find_account, get_account_types, get_account_names, apply_transaction_delta, add_category, recompute_balances, balance_history, set_account_balance
 from models import Account
 from utils import format_amount, gen_id, normalize_ttype
 from ui_add_dialog import AddTransactionDialog
@@ -27,6 +27,8 @@ class AccountManagerPage(ttk.Frame):
         self.btn_edit.pack(side=tk.RIGHT, padx=4)
         self.btn_freeze = ttk.Button(top, text="冻结资产", command=self.toggle_freeze_assets)
         self.btn_freeze.pack(side=tk.RIGHT, padx=4)
+        ttk.Button(top, text="重算余额", command=self.recompute_balances).pack(side=tk.RIGHT, padx=4)
+        ttk.Button(top, text="资产走势", command=self.show_balance_trend).pack(side=tk.RIGHT, padx=4)
         ttk.Button(top, text="下载账户模板", command=self.download_account_template).pack(side=tk.RIGHT, padx=4)
         ttk.Button(top, text="导出账户", command=self.export_accounts).pack(side=tk.RIGHT, padx=4)
         ttk.Button(top, text="导入账户", command=self.import_accounts).pack(side=tk.RIGHT, padx=4)
@@ -98,6 +100,38 @@ class AccountManagerPage(ttk.Frame):
         save_state(s)
         self.refresh()
 
+    def recompute_balances(self):
+        # 按期初余额加全部账单重算余额，先列出差异再确认写回
+        try:
+            s = load_state()
+            res = recompute_balances(s, apply=False)
+            diff = res.get("diff", {})
+            if not diff:
+                messagebox.showinfo("重算余额", "账户余额与账单一致，无需调整")
+                return
+            lines = [f"{n}：{format_amount(o)} → {format_amount(v)}（{'+' if d >= 0 else ''}{format_amount(d)}）" for n, (o, v, d) in list(diff.items())[:30]]
+            if len(diff) > 30:
+                lines.append(f"... 共 {len(diff)} 个账户")
+            if res.get("frozen"):
+                messagebox.showinfo("重算余额", "资产已冻结，以下差异仅供参考：\n" + "\n".join(lines))
+                return
+            if not messagebox.askyesno("重算余额", "按账单重算后以下账户余额将变化：\n" + "\n".join(lines) + "\n\n是否写回？"):
+                return
+            recompute_balances(s)
+            self.refresh()
+        except Exception as e:
+            messagebox.showerror("重算失败", str(e))
+
+    def show_balance_trend(self):
+        # 选中账户时显示该账户的月末余额，否则显示净资产
+        name = self.selected_account_name()
+        if name and not find_account(self.state, name):
+            name = None
+        try:
+            BalanceTrendDialog(self, name)
+        except Exception as e:
+            messagebox.showerror("资产走势", str(e))
+
     def on_double_click(self, event):
         if not self.edit_mode:
             iid = self.tree.identify_row(event.y)
@@ -200,9 +234,8 @@ class AccountManagerPage(ttk.Frame):
                 except Exception:
                     return
                 name = vals[0]
-                a = find_account(self.state, name)
-                if a:
-                    a["balance"] = bal
+                if find_account(self.state, name):
+                    set_account_balance(self.state, name, bal)
                     save_state(self.state)
                 self.refresh()
                 e.destroy()
@@ -347,7 +380,8 @@ class AccountManagerPage(ttk.Frame):
                         errors += 1
                         continue
                     a["type"] = it.get("type", a.get("type",""))
-                    a["balance"] = float(it.get("balance", a.get("balance",0)))
+                    # 与手动修改余额一致：导入的余额视为校正期初值，重算余额不会改回
+                    set_account_balance(s, name, float(it.get("balance", a.get("balance",0))))
                     a["note"] = it.get("note", a.get("note",""))
                     updated += 1
                 else:
@@ -470,13 +504,16 @@ class AccountManagerPage(ttk.Frame):
         dlg = AccountDialog(self, a)
         self.wait_window(dlg)
         if dlg.result:
-            new = dlg.result
+            new = dict(dlg.result)
+            bal = new.pop("balance", None)
             if new["name"] != name:
                 rename_account(self.state, name, new["name"])
                 a = find_account(self.state, new["name"]) or {}
                 a.update(new)
             else:
                 a.update(new)
+            if bal is not None:
+                set_account_balance(self.state, new["name"], bal)
             save_state(self.state)
             self.refresh()
 
@@ -552,3 +589,63 @@ class AccountDialog(tk.Toplevel):
             self.destroy()
         except Exception as e:
             messagebox.showerror("错误", str(e))
+
+class BalanceTrendDialog(tk.Toplevel):
+    def __init__(self, master, account=None):
+        super().__init__(master)
+        self.account = account
+        self.title(f"资产走势 - {account}" if account else "资产走势 - 净资产")
+        self.geometry("760x360")
+        bar = ttk.Frame(self)
+        bar.pack(fill=tk.X, padx=8, pady=6)
+        ttk.Label(bar, text="范围").pack(side=tk.LEFT)
+        self.span = tk.StringVar(value="近24个月")
+        cb = ttk.Combobox(bar, textvariable=self.span, values=["近12个月", "近24个月", "近60个月", "全部"], state="readonly", width=10)
+        cb.pack(side=tk.LEFT, padx=6)
+        cb.bind("<<ComboboxSelected>>", lambda e: self.render())
+        self.lbl = ttk.Label(bar, text="")
+        self.lbl.pack(side=tk.RIGHT)
+        self.canvas = tk.Canvas(self, bg="#ffffff", highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        self.canvas.bind("<Configure>", lambda e: self.render())
+
+    def render(self):
+        c = self.canvas
+        c.delete("all")
+        now = datetime.now()
+        months = {"近12个月": 12, "近24个月": 24, "近60个月": 60}.get(self.span.get())
+        start = None
+        if months:
+            n = now.year * 12 + now.month - months
+            start = (n // 12) * 100 + n % 12 + 1
+        hist = balance_history(start, None, load_state())
+        points = [(ym, (bals.get(self.account, 0.0) if self.account else sum(bals.values()))) for ym, bals in hist]
+        w = int(c.winfo_width() or 740)
+        h = int(c.winfo_height() or 300)
+        if not points:
+            c.create_text(w // 2, h // 2, text="暂无数据")
+            return
+        lo = min(v for _, v in points)
+        hi = max(v for _, v in points)
+        if hi - lo < 1e-9:
+            hi = lo + 1.0
+        left, right, top, bottom = 70, 20, 16, 28
+        step = (w - left - right) / max(1, len(points) - 1)
+        def y_of(v):
+            return top + (hi - v) / (hi - lo) * (h - top - bottom)
+        for v in (lo, (lo + hi) / 2, hi):
+            y = y_of(v)
+            c.create_line(left, y, w - right, y, fill="#eeeeee")
+            c.create_text(left - 6, y, text=format_amount(v), anchor="e", font=("Segoe UI", 8))
+        xy = []
+        label_every = max(1, len(points) // 8)
+        for i, (ym, v) in enumerate(points):
+            x = left + i * step
+            xy.extend([x, y_of(v)])
+            if i % label_every == 0 or i == len(points) - 1:
+                c.create_text(x, h - bottom + 12, text=f"{ym // 100}-{ym % 100:02d}", font=("Segoe UI", 8))
+        if len(xy) >= 4:
+            c.create_line(*xy, fill="#007aff", width=2)
+        for i in range(0, len(xy), 2):
+            c.create_oval(xy[i] - 2, xy[i + 1] - 2, xy[i] + 2, xy[i + 1] + 2, fill="#007aff", outline="")
+        self.lbl.configure(text=f"期末：{format_amount(points[-1][1])}")
@@ -6,11 +6,10 @@ import time
 import threading
 import subprocess
 from datetime import datetime, timedelta
-from storage import load_state, save_state, apply_transaction_delta, get_account_names, get_transaction, remove_transaction, update_transaction, add_category, get_categories, get_category_rules, BASE_DIR, query_transactions, aggregate_sums, list_years, list_months
+from storage import load_state, save_state, apply_transaction_delta, get_account_names, get_transaction, remove_transaction, update_transaction, add_category, get_categories, get_category_rules, BASE_DIR, query_transactions, query_transactions_page, iter_transactions, aggregate_sums, list_years, list_months, get_ledger_store, get_pref, set_pref
 from utils import month_key, format_amount, gen_id, parse_datetime, normalize_ttype
 from models import TRANSACTION_TYPES
 from ui_add_dialog import AddTransactionDialog
-from importers import import_standard_xlsx, try_import
 import zipfile
 
 class BillListPage(ttk.Frame):
@@ -74,6 +73,7 @@ class BillListPage(ttk.Frame):
         ttk.Button(f, text="查重", command=self.run_dedupe).pack(side=tk.LEFT, padx=4)
         ttk.Button(f, text="删除选中", command=self.delete_selected).pack(side=tk.LEFT, padx=4)
         ttk.Button(f, text="导入并覆盖原有账单", command=self.import_override).pack(side=tk.LEFT, padx=4)
+        ttk.Button(f, text="操作历史", command=self.open_operation_history).pack(side=tk.LEFT, padx=4)
         if self.controller:
             ttk.Button(f, text="导入账单", command=self.open_import_dialog).pack(side=tk.RIGHT, padx=4)
         ttk.Button(f, text="导出筛选CSV", command=self.export_filtered_csv).pack(side=tk.RIGHT, padx=2)
@@ -101,8 +101,7 @@ class BillListPage(ttk.Frame):
             "交易时间","金额","疑似重复","消费类别","所属类别","账户","转入账户","转出账户","备注","记账时间","记账来源","id"
         ]
         try:
-            prefs = (self.state.get("prefs", {}) or {}).get("bill_list", {})
-            saved = prefs.get("visible_columns")
+            saved = get_pref("bill_list.visible_columns")
             if isinstance(saved, list) and saved:
                 self.visible_columns = [c for c in self.all_columns if c in saved]
                 if "疑似重复" not in self.visible_columns:
@@ -119,12 +118,12 @@ class BillListPage(ttk.Frame):
         self.sort_states["交易时间"] = 'desc'
         self.current_sort_col = "交易时间"
         self.current_sort_desc = True
+        saved_widths = get_pref("bill_list.column_widths", {}) or {}
         for c in self.all_columns:
             self.tree.heading(c, text=f"{c} ▾", command=lambda col=c: self.on_heading_click(col))
             w_default = (200 if c == "备注" else 140)
             try:
-                prefs = (self.state.get("prefs", {}) or {}).get("bill_list", {})
-                cw = (prefs.get("column_widths", {}) or {}).get(c)
+                cw = saved_widths.get(c)
                 w_default = int(cw) if cw else w_default
             except Exception:
                 pass
@@ -174,19 +173,27 @@ class BillListPage(ttk.Frame):
         self.tree.bind("<Delete>", lambda e: self.delete_selected())
         self.tree.bind("<Shift-MouseWheel>", lambda e: self.tree.xview_scroll(-1 * (e.delta//120), "units"))
         self.tree.bind("<<TreeviewSelect>>", lambda e: self.update_selection_summary())
+        # 松开鼠标时比对列宽，真正拖动过才写偏好
+        self._saved_widths = {c: int(self.tree.column(c, 'width')) for c in self.all_columns}
         self.tree.bind("<ButtonRelease-1>", self._maybe_save_column_widths)
         self.column_filters = {}
         try:
-            s = load_state()
-            self.use_pagination = bool((s.get("prefs", {}) or {}).get("use_pagination", False))
+            self.use_pagination = bool(get_pref("use_pagination", False))
         except Exception:
             self.use_pagination = False
         self.page_size = 200
         self.current_page = 0
+        # 每页起始游标；筛选或排序变化时重置
+        self._page_cursors = [None]
+        self._page_key = None
+        self._page_has_next = False
         self.page_bar = ttk.Frame(status)
         self.page_bar.pack(side=tk.RIGHT)
+        self.lbl_page = ttk.Label(self.page_bar, text="")
         ttk.Button(self.page_bar, text="上一页", command=lambda: self._goto_page(max(self.current_page-1,0))).pack(side=tk.RIGHT, padx=4)
         ttk.Button(self.page_bar, text="下一页", command=lambda: self._goto_page(self.current_page+1)).pack(side=tk.RIGHT, padx=4)
+        if self.use_pagination:
+            self.lbl_page.pack(side=tk.RIGHT, padx=4)
         self.menu = tk.Menu(self, tearoff=0)
         self.menu.add_command(label="编辑", command=self.on_edit)
         self.menu.add_command(label="删除", command=self.on_delete)
@@ -333,10 +340,9 @@ class BillListPage(ttk.Frame):
             widths = {}
             for c in self.all_columns:
                 widths[c] = int(self.tree.column(c, 'width'))
-            s = load_state()
-            bl = s.setdefault("prefs", {}).setdefault("bill_list", {})
-            bl["column_widths"] = widths
-            save_state(s)
+            if widths != self._saved_widths:
+                self._saved_widths = widths
+                set_pref("bill_list.column_widths", widths)
         except Exception:
             pass
 
@@ -386,7 +392,7 @@ class BillListPage(ttk.Frame):
         self.suspected_map = self._compute_suspicions(self._get_dup_threshold_secs())
         rows = []
         try:
-            fmt_pref = ((self.state.get("prefs", {}) or {}).get("bill_list", {}) or {}).get("time_format", "date")
+            fmt_pref = get_pref("bill_list.time_format", "date")
         except Exception:
             fmt_pref = "date"
         tx_fmt = "%Y-%m-%d %H:%M:%S" if fmt_pref == "full" else "%Y-%m-%d"
@@ -400,9 +406,11 @@ class BillListPage(ttk.Frame):
             map_col = {'交易时间':'time','记账时间':'record_time','金额':'amount','所属类别':'ttype','消费类别':'category','账户':'account'}
             oc = map_col.get(order_col, 'time')
             od = bool(getattr(self, 'current_sort_desc', False))
-            lim = (self.page_size if self.use_pagination else None)
-            off = (self.current_page * self.page_size if self.use_pagination else None)
-            rows = query_transactions({"year": year, "month": month, "ttype": ttype, "category": category, "term": term, "amt_op": amt_op, "amt_val": amt_val, "order_col": oc, "order_desc": od}, lim, off)
+            q = {"year": year, "month": month, "ttype": ttype, "category": category, "term": term, "amt_op": amt_op, "amt_val": amt_val, "order_col": oc, "order_desc": od}
+            if self.use_pagination:
+                rows = self._query_page(q)
+            else:
+                rows = query_transactions(q)
             sums = aggregate_sums({"year": year, "month": month})
             inc_sum = float(sums.get("收入",0)) + float(sums.get("报销类收入",0))
             exp_sum = float(sums.get("支出",0)) + float(sums.get("报销类支出",0))
@@ -512,12 +520,44 @@ class BillListPage(ttk.Frame):
         # 插入前已按排序列排序，无需再次移动节点
         self.update_selection_summary()
 
+    def _query_page(self, q):
+        key = tuple(sorted(q.items()))
+        if key != self._page_key:
+            self._page_key = key
+            self._page_cursors = [None]
+            self.current_page = 0
+        if self.current_page >= len(self._page_cursors):
+            self.current_page = len(self._page_cursors) - 1
+        page = query_transactions_page(q, self.page_size, self._page_cursors[self.current_page], with_total=True)
+        if not page["rows"] and self.current_page > 0:
+            # 当前页已被删空时退回上一页
+            del self._page_cursors[self.current_page:]
+            self.current_page -= 1
+            page = query_transactions_page(q, self.page_size, self._page_cursors[self.current_page], with_total=True)
+        del self._page_cursors[self.current_page + 1:]
+        if page["next"]:
+            self._page_cursors.append(page["next"])
+        self._page_has_next = bool(page["next"])
+        total = page.get("total")
+        if total is None:
+            txt = f"第{self.current_page + 1}页"
+        else:
+            pages = max(1, (total + self.page_size - 1) // self.page_size)
+            txt = f"第{self.current_page + 1}/{pages}{'' if page.get('total_exact') else '+'}页 共{total}{'' if page.get('total_exact') else '+'}条"
+        try:
+            self.lbl_page.configure(text=txt)
+        except Exception:
+            pass
+        return page["rows"]
+
     def _goto_page(self, p):
         if not getattr(self, 'use_pagination', False):
             return
         if p < 0:
             p = 0
-        self.current_page = p
+        if p > self.current_page and not self._page_has_next:
+            return
+        self.current_page = min(p, len(self._page_cursors) - 1)
         self.apply_filter()
 
     def _fmt_footer_amount(self, v):
@@ -644,10 +684,7 @@ class BillListPage(ttk.Frame):
             self.visible_columns = [c for c in self.visible_columns if c != col]
             self.tree["displaycolumns"] = tuple(self.visible_columns)
             try:
-                s = load_state()
-                prefs = s.setdefault("prefs", {}).setdefault("bill_list", {})
-                prefs["visible_columns"] = list(self.visible_columns)
-                save_state(s)
+                set_pref("bill_list.visible_columns", list(self.visible_columns))
             except Exception:
                 pass
 
@@ -658,10 +695,7 @@ class BillListPage(ttk.Frame):
         self.visible_columns = keep
         self.tree["displaycolumns"] = tuple(self.visible_columns)
         try:
-            s = load_state()
-            prefs = s.setdefault("prefs", {}).setdefault("bill_list", {})
-            prefs["visible_columns"] = list(self.visible_columns)
-            save_state(s)
+            set_pref("bill_list.visible_columns", list(self.visible_columns))
         except Exception:
             pass
 
@@ -840,12 +874,9 @@ class BillListPage(ttk.Frame):
             return
         if not messagebox.askyesno("确认", f"确定删除选中的 {len(ids)} 条记录并同步账户变化？"):
             return
-        for tx_id in ids:
-            t = get_transaction(self.state, tx_id)
-            if t:
-                apply_transaction_delta(self.state, t, -1)
-                remove_transaction(self.state, tx_id)
-        save_state(self.state)
+        with get_ledger_store().batch(self.state, label="删除账单") as b:
+            for tx_id in ids:
+                b.delete(tx_id)
         self.reapply_last_filters()
 
     def open_import_dialog(self):
@@ -878,6 +909,17 @@ class BillListPage(ttk.Frame):
         except Exception:
             pass
 
+    def open_operation_history(self):
+        OperationHistoryDialog(self, on_change=self._after_history_change)
+
+    def _after_history_change(self):
+        self.refresh()
+        if self.controller:
+            try:
+                self.controller.refresh_all()
+            except Exception:
+                pass
+
     def open_excel_batch_entry(self):
         try:
             temp_dir = os.path.join(BASE_DIR, "temp")
@@ -934,6 +976,7 @@ class BillListPage(ttk.Frame):
                 time.sleep(1)
             s = load_state()
             account_names = get_account_names(s)
+            from importers import import_standard_xlsx
             rows = import_standard_xlsx(path, account_names)
             now_iso = datetime.now().isoformat()
             for r in rows:
@@ -1017,21 +1060,30 @@ class BillListPage(ttk.Frame):
             return
         if not messagebox.askyesno("确认", "将覆盖现有账单并按新导入重算账户余额，是否继续？"):
             return
-        try:
-            from storage import backup_state, sync_batch_to_db, clear_all_transactions_db
-            backup_state()
+        use_ai = messagebox.askyesno("预填消费类别", "是否让系统进行预填消费类别？")
+        from ui_tasks import run_task
+
+        def work(task):
+            from importers import try_import, map_files
             s = load_state()
             account_names = get_account_names(s)
             rows = []
             stats_total = {"skipped_no_io": 0}
-            for p in paths:
-                res = try_import(p, account_names)
+            # 多个文件在进程池中并行解析，结果按文件顺序合并
+            task.report("解析文件", 0, len(paths), f"共 {len(paths)} 个文件")
+            for i, res in enumerate(map_files(try_import, paths, account_names), start=1):
                 rows.extend(res.get("rows", []))
                 stats_total["skipped_no_io"] += int(res.get("stats", {}).get("skipped_no_io", 0))
-            use_ai = messagebox.askyesno("预填消费类别", "是否让系统进行预填消费类别？")
+                task.report("解析文件", i, len(paths), f"已解析 {i} / {len(paths)} 个文件，{len(rows)} 条")
+                task.check()
             now_iso = datetime.now().isoformat()
             ai_prefill = 0
-            for r in rows:
+            # 新类别先记在本地，导入完成后在界面线程写入账本；取消或出错时类别表不变
+            new_cats = {}
+            for i, r in enumerate(rows):
+                if i % 1000 == 0:
+                    task.report("整理类别", i, len(rows), f"{i} / {len(rows)} 条")
+                    task.check()
                 r["record_time"] = now_iso
                 plat = (r.get("platform") or "").strip()
                 if plat == "alipay":
@@ -1048,7 +1100,7 @@ class BillListPage(ttk.Frame):
                 typ_sync = normalize_ttype(r.get("ttype"))
                 if cat_sync and typ_sync in ["收入","报销类收入","支出","报销类支出"]:
                     sc_sync = "收入" if typ_sync in ["收入","报销类收入"] else "支出"
-                    add_category(s, sc_sync, cat_sync)
+                    new_cats[(sc_sync, cat_sync)] = None
                 if use_ai:
                     cat = (r.get("category") or "").strip()
                     typ = normalize_ttype(r.get("ttype"))
@@ -1061,54 +1113,66 @@ class BillListPage(ttk.Frame):
                             pred = None
                         if pred:
                             r["category"] = pred
-                            add_category(s, sc, pred)
+                            new_cats[(sc, pred)] = None
                             ai_prefill += 1
             if any((not r.get("account")) for r in rows):
-                acc = self.ask_default_account(account_names)
+                acc = task.call_ui(self.ask_default_account, account_names)
                 if not acc:
                     raise ValueError("未选择默认账户，无法完成导入")
                 for r in rows:
                     if not r.get("account"):
                         r["account"] = acc
-            s["transactions"] = []
-            clear_all_transactions_db()
-            freeze = bool((s.get("prefs", {}) or {}).get("freeze_assets"))
-            if not freeze:
-                for a in s.get("accounts", []):
-                    try:
-                        a["balance"] = 0.0
-                    except Exception:
-                        pass
             from utils import tx_signature
             existing = set()
             dup_rows = []
             success = 0
             dup = 0
-            added_rows = []
-            for r in rows:
-                sig = tx_signature(r)
-                if sig in existing:
-                    dup += 1
-                    dup_rows.append([
-                        r.get("time", "")[:19].replace("T"," "),
-                        str(r.get("amount", "")),
-                        r.get("category",""),
-                        r.get("ttype",""),
-                        r.get("account",""),
-                        r.get("to_account","") or "",
-                        r.get("from_account","") or "",
-                        r.get("note",""),
-                    ])
-                    continue
-                existing.add(sig)
-                s["transactions"].append(r)
-                apply_transaction_delta(s, r, 1)
-                added_rows.append(r)
-                success += 1
+            # 清空、写入与余额重算同批提交并记入操作日志，可在“操作历史”中整体撤销；提交前取消则整批放弃，原账单不受影响
+            with get_ledger_store().batch(s, label="覆盖导入") as b:
+                b.clear()
+                for i, r in enumerate(rows):
+                    if i % 1000 == 0:
+                        task.report("查重并写入", i, len(rows), f"{i} / {len(rows)} 条")
+                        task.check()
+                    sig = tx_signature(r)
+                    if sig in existing:
+                        dup += 1
+                        dup_rows.append([
+                            r.get("time", "")[:19].replace("T"," "),
+                            str(r.get("amount", "")),
+                            r.get("category",""),
+                            r.get("ttype",""),
+                            r.get("account",""),
+                            r.get("to_account","") or "",
+                            r.get("from_account","") or "",
+                            r.get("note",""),
+                        ])
+                        continue
+                    existing.add(sig)
+                    b.add(r, apply_delta=False)
+                    success += 1
+                # 余额从零按新账单整体重算一次（冻结资产时不改余额）
+                b.rebalance()
+                task.check()
+                task.report("保存", len(rows), len(rows), f"写入 {success} 条")
+            out_path = None
+            # 导出重复条目
+            if dup_rows:
+                try:
+                    cols = ["交易时间","金额","消费类别","所属类别","账户","转入账户","转出账户","备注"]
+                    ts = datetime.now().strftime("%Y%m%d_%H%M")
+                    out_path = os.path.join(BASE_DIR, f"duplicates_{ts}.xlsx")
+                    self._write_xlsx(out_path, cols, dup_rows)
+                except Exception:
+                    out_path = None
+            return s, new_cats, len(rows), success, dup, stats_total, ai_prefill, out_path
+
+        def done(res):
+            s, new_cats, total, success, dup, stats_total, ai_prefill, out_path = res
+            for sc, name in new_cats:
+                add_category(s, sc, name)
             save_state(s)
-            sync_batch_to_db(added_rows)
             self.state = s
-            total = len(rows)
             skipped = total - success
             msg = f"覆盖导入完成\n总计: {total} 条\n成功: {success} 条"
             if dup:
@@ -1120,44 +1184,32 @@ class BillListPage(ttk.Frame):
                 msg += f"\n其他未导入: {skipped - dup} 条"
             if use_ai:
                 msg += f"\nAI预填类别: {ai_prefill} 条"
-            # 导出重复条目
-            if dup_rows:
-                try:
-                    cols = ["交易时间","金额","消费类别","所属类别","账户","转入账户","转出账户","备注"]
-                    ts = datetime.now().strftime("%Y%m%d_%H%M")
-                    out_path = os.path.join(BASE_DIR, f"duplicates_{ts}.xlsx")
-                    self._write_xlsx(out_path, cols, dup_rows)
-                    msg += f"\n重复条目已导出: {out_path}"
-                except Exception:
-                    pass
+            if out_path:
+                msg += f"\n重复条目已导出: {out_path}"
             messagebox.showinfo("导入结果", msg)
             self.apply_filter()
-        except Exception as e:
-            self._show_error_dialog(str(e))
+
+        run_task(self, "覆盖导入", work, on_done=done, on_error=lambda e: self._show_error_dialog(str(e)),
+                 on_cancel=lambda: messagebox.showinfo("导入结果", "已取消覆盖导入，原有账单未改动"))
 
     def bulk_change_to_transfer(self):
         ids = self.selected_tx_ids()
         if not ids:
             return
         count = 0
-        for tx_id in ids:
-            old = get_transaction(self.state, tx_id)
-            if not old:
-                continue
-            try:
-                apply_transaction_delta(self.state, old, -1)
+        with get_ledger_store().batch(self.state, label="批量改为转账") as b:
+            for tx_id in ids:
+                old = b.get(tx_id)
+                if not old:
+                    continue
                 new = dict(old)
                 new["ttype"] = "转账"
                 new["category"] = "转账"
                 new["account"] = ""
                 new["to_account"] = None
                 new["from_account"] = None
-                update_transaction(self.state, tx_id, DummyTx(new))
-                apply_transaction_delta(self.state, new, 1)
-                count += 1
-            except Exception:
-                pass
-        save_state(self.state)
+                if b.update(tx_id, new):
+                    count += 1
         messagebox.showinfo("批量修改完成", f"已修改为转账: {count} 条")
         self.apply_filter()
 
@@ -1226,33 +1278,28 @@ class BillListPage(ttk.Frame):
         if acc_sel is None and fa is None and ta is None:
             return
         count = 0
-        for tx_id in ids:
-            old = get_transaction(self.state, tx_id)
-            if not old:
-                continue
-            new = dict(old)
-            if result["only_empty"]:
-                if acc_sel is not None and not new.get("account"):
-                    new["account"] = acc_sel
-                if fa is not None and not new.get("from_account"):
-                    new["from_account"] = fa
-                if ta is not None and not new.get("to_account"):
-                    new["to_account"] = ta
-            else:
-                if acc_sel is not None:
-                    new["account"] = acc_sel
-                if fa is not None:
-                    new["from_account"] = fa
-                if ta is not None:
-                    new["to_account"] = ta
-            try:
-                apply_transaction_delta(self.state, old, -1)
-                update_transaction(self.state, tx_id, DummyTx(new))
-                apply_transaction_delta(self.state, new, 1)
-                count += 1
-            except Exception:
-                pass
-        save_state(self.state)
+        with get_ledger_store().batch(self.state, label="批量修改账户") as b:
+            for tx_id in ids:
+                old = b.get(tx_id)
+                if not old:
+                    continue
+                new = dict(old)
+                if result["only_empty"]:
+                    if acc_sel is not None and not new.get("account"):
+                        new["account"] = acc_sel
+                    if fa is not None and not new.get("from_account"):
+                        new["from_account"] = fa
+                    if ta is not None and not new.get("to_account"):
+                        new["to_account"] = ta
+                else:
+                    if acc_sel is not None:
+                        new["account"] = acc_sel
+                    if fa is not None:
+                        new["from_account"] = fa
+                    if ta is not None:
+                        new["to_account"] = ta
+                if b.update(tx_id, new):
+                    count += 1
         messagebox.showinfo("批量修改完成", f"已更新账户信息: {count} 条")
         self.apply_filter()
 
@@ -1304,25 +1351,20 @@ class BillListPage(ttk.Frame):
             return
         add_category(self.state, sc, cat_final)
         count = 0
-        for tx_id in ids:
-            old = get_transaction(self.state, tx_id)
-            if not old:
-                continue
-            typ = (old.get("ttype") or "").strip()
-            if sc == "收入" and typ not in ["收入","报销类收入"]:
-                continue
-            if sc == "支出" and typ not in ["支出","报销类支出"]:
-                continue
-            new = dict(old)
-            new["category"] = cat_final
-            try:
-                apply_transaction_delta(self.state, old, -1)
-                update_transaction(self.state, tx_id, DummyTx(new))
-                apply_transaction_delta(self.state, new, 1)
-                count += 1
-            except Exception:
-                pass
-        save_state(self.state)
+        with get_ledger_store().batch(self.state, label="批量修改类别") as b:
+            for tx_id in ids:
+                old = b.get(tx_id)
+                if not old:
+                    continue
+                typ = (old.get("ttype") or "").strip()
+                if sc == "收入" and typ not in ["收入","报销类收入"]:
+                    continue
+                if sc == "支出" and typ not in ["支出","报销类支出"]:
+                    continue
+                new = dict(old)
+                new["category"] = cat_final
+                if b.update(tx_id, new):
+                    count += 1
         messagebox.showinfo("批量修改完成", f"已更新消费类别: {count} 条")
         self.apply_filter()
 
@@ -1331,20 +1373,15 @@ class BillListPage(ttk.Frame):
         if not ids:
             return
         count = 0
-        for tx_id in ids:
-            old = get_transaction(self.state, tx_id)
-            if not old:
-                continue
-            new = dict(old)
-            new["ttype"] = "收入"
-            try:
-                apply_transaction_delta(self.state, old, -1)
-                update_transaction(self.state, tx_id, DummyTx(new))
-                apply_transaction_delta(self.state, new, 1)
-                count += 1
-            except Exception:
-                pass
-        save_state(self.state)
+        with get_ledger_store().batch(self.state, label="批量改为收入") as b:
+            for tx_id in ids:
+                old = b.get(tx_id)
+                if not old:
+                    continue
+                new = dict(old)
+                new["ttype"] = "收入"
+                if b.update(tx_id, new):
+                    count += 1
         messagebox.showinfo("批量修改完成", f"已改为收入: {count} 条")
         self.apply_filter()
 
@@ -1353,20 +1390,15 @@ class BillListPage(ttk.Frame):
         if not ids:
             return
         count = 0
-        for tx_id in ids:
-            old = get_transaction(self.state, tx_id)
-            if not old:
-                continue
-            new = dict(old)
-            new["ttype"] = "支出"
-            try:
-                apply_transaction_delta(self.state, old, -1)
-                update_transaction(self.state, tx_id, DummyTx(new))
-                apply_transaction_delta(self.state, new, 1)
-                count += 1
-            except Exception:
-                pass
-        save_state(self.state)
+        with get_ledger_store().batch(self.state, label="批量改为支出") as b:
+            for tx_id in ids:
+                old = b.get(tx_id)
+                if not old:
+                    continue
+                new = dict(old)
+                new["ttype"] = "支出"
+                if b.update(tx_id, new):
+                    count += 1
         messagebox.showinfo("批量修改完成", f"已改为支出: {count} 条")
         self.apply_filter()
 
@@ -1416,26 +1448,21 @@ class BillListPage(ttk.Frame):
         except Exception:
             pass
         count = 0
-        for tx_id in ids:
-            old = get_transaction(self.state, tx_id)
-            if not old:
-                continue
-            new = dict(old)
-            if res.get("only_empty"):
-                if not (new.get("record_source") or "").strip():
-                    new["record_source"] = src
-                else:
+        with get_ledger_store().batch(self.state, label="批量修改记账来源") as b:
+            for tx_id in ids:
+                old = b.get(tx_id)
+                if not old:
                     continue
-            else:
-                new["record_source"] = src
-            try:
-                apply_transaction_delta(self.state, old, -1)
-                update_transaction(self.state, tx_id, DummyTx(new))
-                apply_transaction_delta(self.state, new, 1)
-                count += 1
-            except Exception:
-                pass
-        save_state(self.state)
+                new = dict(old)
+                if res.get("only_empty"):
+                    if not (new.get("record_source") or "").strip():
+                        new["record_source"] = src
+                    else:
+                        continue
+                else:
+                    new["record_source"] = src
+                if b.update(tx_id, new):
+                    count += 1
         messagebox.showinfo("批量修改完成", f"已更新记账来源: {count} 条")
         self.apply_filter()
 
@@ -1446,35 +1473,35 @@ class BillListPage(ttk.Frame):
         s = load_state()
         filled = 0
         skipped = 0
-        for tx_id in ids:
-            t = get_transaction(s, tx_id)
-            if not t:
-                skipped += 1
-                continue
-            typ = normalize_ttype(t.get("ttype"))
-            if typ not in ["收入","报销类收入","支出","报销类支出"]:
-                skipped += 1
-                continue
-            cat = (t.get("category") or "").strip()
-            if cat:
-                skipped += 1
-                continue
-            text = " ".join([
-                str(t.get("note","")),
-                str(t.get("record_source","")),
-                str(t.get("account","")),
-            ]).lower()
-            scene = "收入" if typ in ["收入","报销类收入"] else "支出"
-            pred = self._predict_category_for_billlist(text, scene, s)
-            if not pred:
-                skipped += 1
-                continue
-            new = dict(t)
-            new["category"] = pred
-            add_category(s, scene, pred)
-            update_transaction(s, tx_id, DummyTx(new))
-            filled += 1
-        save_state(s)
+        with get_ledger_store().batch(s, label="预填消费类别") as b:
+            for tx_id in ids:
+                t = b.get(tx_id)
+                if not t:
+                    skipped += 1
+                    continue
+                typ = normalize_ttype(t.get("ttype"))
+                if typ not in ["收入","报销类收入","支出","报销类支出"]:
+                    skipped += 1
+                    continue
+                cat = (t.get("category") or "").strip()
+                if cat:
+                    skipped += 1
+                    continue
+                text = " ".join([
+                    str(t.get("note","")),
+                    str(t.get("record_source","")),
+                    str(t.get("account","")),
+                ]).lower()
+                scene = "收入" if typ in ["收入","报销类收入"] else "支出"
+                pred = self._predict_category_for_billlist(text, scene, s)
+                if not pred:
+                    skipped += 1
+                    continue
+                new = dict(t)
+                new["category"] = pred
+                add_category(s, scene, pred)
+                b.update(tx_id, new, apply_delta=False)
+                filled += 1
         self.state = s
         messagebox.showinfo("AI预填完成", f"已预填: {filled} 条\n跳过: {skipped} 条")
         self.refresh()
@@ -1724,27 +1751,29 @@ class BillListPage(ttk.Frame):
         if not path:
             return
         header = ["交易时间","金额","消费类别","所属类别","账户","转入账户","转出账户","备注"]
-        s = load_state()
-        rows = []
-        for t in s.get("transactions", []):
-            try:
-                dt = datetime.fromisoformat(t.get("time"))
-                tstr = dt.strftime("%Y-%m-%d")
-            except Exception:
-                tstr = str(t.get("time",""))[:19].replace("T"," ")
-            rows.append([
-                tstr,
-                format_amount(float(t.get("amount",0))),
-                t.get("category",""),
-                t.get("ttype",""),
-                t.get("account",""),
-                t.get("to_account",""),
-                t.get("from_account",""),
-                t.get("note",""),
-            ])
+        count = 0
+        def export_rows():
+            nonlocal count
+            for t in iter_transactions():
+                try:
+                    dt = datetime.fromisoformat(t.time)
+                    tstr = dt.strftime("%Y-%m-%d")
+                except Exception:
+                    tstr = str(t.time or "")[:19].replace("T"," ")
+                count += 1
+                yield [
+                    tstr,
+                    format_amount(float(t.amount or 0)),
+                    t.category or "",
+                    t.ttype or "",
+                    t.account or "",
+                    t.to_account or "",
+                    t.from_account or "",
+                    t.note or "",
+                ]
         try:
-            self._write_xlsx(path, header, rows)
-            messagebox.showinfo("导出成功", f"已导出 {len(rows)} 条记录")
+            self._write_xlsx(path, header, export_rows())
+            messagebox.showinfo("导出成功", f"已导出 {count} 条记录")
         except Exception as e:
             messagebox.showerror("导出失败", str(e))
 
@@ -1784,97 +1813,89 @@ class BillListPage(ttk.Frame):
             messagebox.showerror("导出失败", str(e))
 
     def dedupe_delete_keep_first(self):
-        try:
-            from storage import backup_state
-            backup_state()
-        except Exception:
-            pass
         threshold = self._get_dup_threshold_secs()
         groups = {}
-        for t in self.state.get("transactions", []):
+        # 分组只需 id/时间/金额，流式读取轻量元组，删除时再按 id 取完整记录
+        for tx_id, tm, amt in iter_transactions(columns=("id", "time", "amount")):
             try:
-                dt = parse_datetime(t.get("time"))
-                a = float(t.get("amount",0))
+                dt = parse_datetime(tm)
+                a = float(amt or 0)
                 k = format_amount(abs(a))
-                groups.setdefault(k, []).append((dt, t))
+                groups.setdefault(k, []).append((dt, tx_id))
             except Exception:
                 pass
         removed = 0
-        for _, lst in groups.items():
-            lst.sort(key=lambda x: x[0])
-            cur = []
-            def flush():
-                nonlocal removed
-                if len(cur) > 1:
-                    keep = cur[0][1]
-                    for _, t in cur[1:]:
-                        try:
-                            apply_transaction_delta(self.state, t, -1)
-                            remove_transaction(self.state, t.get("id"))
-                            removed += 1
-                        except Exception:
-                            pass
-                cur.clear()
-            for item in lst:
-                if not cur:
-                    cur.append(item)
-                else:
-                    if (item[0] - cur[0][0]).total_seconds() <= threshold:
+        with get_ledger_store().batch(self.state, label="删除疑似重复") as b:
+            for _, lst in groups.items():
+                lst.sort(key=lambda x: x[0])
+                cur = []
+                def flush():
+                    nonlocal removed
+                    if len(cur) > 1:
+                        for _, tx_id in cur[1:]:
+                            if b.delete(tx_id):
+                                removed += 1
+                    cur.clear()
+                for item in lst:
+                    if not cur:
                         cur.append(item)
                     else:
-                        flush()
-                        cur.append(item)
-            flush()
-        save_state(self.state)
+                        if (item[0] - cur[0][0]).total_seconds() <= threshold:
+                            cur.append(item)
+                        else:
+                            flush()
+                            cur.append(item)
+                flush()
         self.refresh()
-        messagebox.showinfo("删除完成", f"已删除疑似重复: {removed} 条")
+        messagebox.showinfo("删除完成", f"已删除疑似重复: {removed} 条\n可在“操作历史”中撤销")
 
     def import_standard_xlsx_file(self):
         path = filedialog.askopenfilename(title="导入账单", filetypes=[("所有文件","*.*"), ("Excel 文件","*.xlsx")])
         if not path:
             return
-        try:
+        from ui_tasks import run_task
+
+        def work(task):
+            from importers import iter_import
+            from storage import import_transactions
             s = load_state()
             account_names = get_account_names(s)
-            rows = import_standard_xlsx(path, account_names)
             now_iso = datetime.now().isoformat()
-            for r in rows:
+            src_stats = {}
+            chosen = {"account": None}
+            def prepare(r):
+                task.check()
                 r["record_time"] = now_iso
                 r["record_source"] = "模版导入"
-            if any((not r.get("account")) for r in rows):
-                acc = self.ask_default_account(account_names)
-                if not acc:
-                    raise ValueError("未选择默认账户，无法完成导入")
-                for r in rows:
-                    if not r.get("account"):
-                        r["account"] = acc
-            from utils import tx_signature
-            from storage import sync_batch_to_db
-            existing = {tx_signature(t) for t in s.get("transactions", [])}
-            success = 0
-            dup = 0
-            added_rows = []
-            for r in rows:
-                sig = tx_signature(r)
-                if sig in existing:
-                    dup += 1
-                    continue
-                existing.add(sig)
-                s["transactions"].append(r)
-                apply_transaction_delta(s, r, 1)
-                added_rows.append(r)
-                success += 1
-            save_state(s)
-            sync_batch_to_db(added_rows)
+                if not r.get("account"):
+                    if chosen["account"] is None:
+                        chosen["account"] = task.call_ui(self.ask_default_account, account_names)
+                        if not chosen["account"]:
+                            raise ValueError("未选择默认账户，无法完成导入")
+                    r["account"] = chosen["account"]
+                return r
+            def progress(st):
+                task.report("读取并导入", src_stats.get("bytes_read", 0), src_stats.get("bytes_total", 0),
+                            f"已读取 {st['read']} 条，已导入 {st['imported']} 条，重复 {st['duplicates']} 条")
+                task.check()
+            # 流式读取、分块查重提交；出错或取消时回滚已提交的块
+            stats = import_transactions(iter_import(path, account_names, "standard", src_stats), s, prepare=prepare, progress=progress)
+            return s, stats
+
+        def done(res):
+            s, stats = res
             self.state = s
-            total = len(rows)
-            msg = f"导入完成\n总计: {total} 条\n成功: {success} 条"
-            if dup:
-                msg += f"\n重复: {dup} 条"
+            msg = f"导入完成\n总计: {stats['read']} 条\n成功: {stats['imported']} 条"
+            if stats["duplicates"]:
+                msg += f"\n重复: {stats['duplicates']} 条"
             messagebox.showinfo("导入结果", msg)
             self.refresh()
-        except Exception as e:
-            self._show_error_dialog(str(e))
+
+        def cancelled():
+            messagebox.showinfo("导入结果", "已取消导入，本次已写入的账单与余额变动已全部撤回")
+            self.refresh()
+
+        run_task(self, "导入账单", work, on_done=done, on_error=lambda e: self._show_error_dialog(str(e)), on_cancel=cancelled)
 
     def ask_default_account(self, account_names):
         if not account_names:
@@ -1925,6 +1946,7 @@ class BillListPage(ttk.Frame):
 
     def _write_xlsx(self, path, header, rows):
         import io
+        # rows 可为任意可迭代对象：单元格用内联字符串逐行写入压缩流，内存占用不随行数增长
         def col_name(i):
             s = ""
             i += 1
@@ -1932,52 +1954,99 @@ class BillListPage(ttk.Frame):
                 i, r = divmod(i-1, 26)
                 s = chr(65+r) + s
             return s
-        strs = []
-        def add_str(s):
-            s = str(s)
-            if s in strs:
-                return strs.index(s)
-            strs.append(s)
-            return len(strs)-1
-        for h in header:
-            add_str(h)
-        for r in rows:
-            for v in r:
-                add_str(v)
-        shared_xml = io.StringIO()
-        shared_xml.write("<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?>")
-        shared_xml.write("<sst xmlns=\"http://schemas.openxmlformats.org/spreadsheetml/2006/main\" count=\"{}\" uniqueCount=\"{}\">".format(len(strs), len(strs)))
-        for sval in strs:
-            shared_xml.write("<si><t>{}</t></si>".format(str(sval).replace("&","&amp;").replace("<","&lt;")))
-        shared_xml.write("</sst>")
-        sheet_xml = io.StringIO()
-        sheet_xml.write("<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?>")
-        sheet_xml.write("<worksheet xmlns=\"http://schemas.openxmlformats.org/spreadsheetml/2006/main\"><sheetData>")
-        row_idx = 1
-        def write_row(vals):
-            nonlocal row_idx
-            sheet_xml.write(f"<row r=\"{row_idx}\">")
-            for i, v in enumerate(vals):
-                c = f"{col_name(i)}{row_idx}"
-                idx = add_str(v)
-                sheet_xml.write(f"<c r=\"{c}\" t=\"s\"><v>{idx}</v></c>")
-            sheet_xml.write("</row>")
-            row_idx += 1
-        write_row(header)
-        for r in rows:
-            write_row(r)
-        sheet_xml.write("</sheetData></worksheet>")
+        def esc(v):
+            return str(v).replace("&","&amp;").replace("<","&lt;").replace(">","&gt;")
         workbook_xml = "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?><workbook xmlns=\"http://schemas.openxmlformats.org/spreadsheetml/2006/main\" xmlns:r=\"http://schemas.openxmlformats.org/officeDocument/2006/relationships\"><sheets><sheet name=\"Sheet1\" sheetId=\"1\" r:id=\"rId1\"/></sheets></workbook>"
-        wb_rels = "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?><Relationships xmlns=\"http://schemas.openxmlformats.org/package/2006/relationships\"><Relationship Id=\"rId1\" Type=\"http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet\" Target=\"worksheets/sheet1.xml\"/><Relationship Id=\"rId2\" Type=\"http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings\" Target=\"sharedStrings.xml\"/></Relationships>"
+        wb_rels = "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?><Relationships xmlns=\"http://schemas.openxmlformats.org/package/2006/relationships\"><Relationship Id=\"rId1\" Type=\"http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet\" Target=\"worksheets/sheet1.xml\"/></Relationships>"
         rels_root = "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?><Relationships xmlns=\"http://schemas.openxmlformats.org/package/2006/relationships\"><Relationship Id=\"rId1\" Type=\"http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument\" Target=\"xl/workbook.xml\"/></Relationships>"
-        content_types = "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?><Types xmlns=\"http://schemas.openxmlformats.org/package/2006/content-types\"><Default Extension=\"rels\" ContentType=\"application/vnd.openxmlformats-package.relationships+xml\"/><Default Extension=\"xml\" ContentType=\"application/xml\"/><Override PartName=\"/xl/workbook.xml\" ContentType=\"application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml\"/><Override PartName=\"/xl/worksheets/sheet1.xml\" ContentType=\"application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml\"/><Override PartName=\"/xl/sharedStrings.xml\" ContentType=\"application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml\"/></Types>"
+        content_types = "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?><Types xmlns=\"http://schemas.openxmlformats.org/package/2006/content-types\"><Default Extension=\"rels\" ContentType=\"application/vnd.openxmlformats-package.relationships+xml\"/><Default Extension=\"xml\" ContentType=\"application/xml\"/><Override PartName=\"/xl/workbook.xml\" ContentType=\"application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml\"/><Override PartName=\"/xl/worksheets/sheet1.xml\" ContentType=\"application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml\"/></Types>"
         with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
             z.writestr("[Content_Types].xml", content_types)
             z.writestr("_rels/.rels", rels_root)
             z.writestr("xl/workbook.xml", workbook_xml)
             z.writestr("xl/_rels/workbook.xml.rels", wb_rels)
-            z.writestr("xl/sharedStrings.xml", shared_xml.getvalue())
-            z.writestr("xl/worksheets/sheet1.xml", sheet_xml.getvalue())
+            with z.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as raw:
+                sheet_xml = io.TextIOWrapper(raw, encoding="utf-8")
+                sheet_xml.write("<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?>")
+                sheet_xml.write("<worksheet xmlns=\"http://schemas.openxmlformats.org/spreadsheetml/2006/main\"><sheetData>")
+                row_idx = 1
+                def write_row(vals):
+                    nonlocal row_idx
+                    parts = [f"<row r=\"{row_idx}\">"]
+                    for i, v in enumerate(vals):
+                        parts.append(f"<c r=\"{col_name(i)}{row_idx}\" t=\"inlineStr\"><is><t>{esc(v)}</t></is></c>")
+                    parts.append("</row>")
+                    sheet_xml.write("".join(parts))
+                    row_idx += 1
+                write_row(header)
+                for r in rows:
+                    write_row(r)
+                sheet_xml.write("</sheetData></worksheet>")
+                sheet_xml.flush()
+                sheet_xml.detach()
+
+class OperationHistoryDialog(tk.Toplevel):
+    def __init__(self, master, on_change=None):
+        super().__init__(master)
+        self.on_change = on_change
+        self.title("操作历史")
+        self.geometry("620x380")
+        self.transient(master)
+        bar = ttk.Frame(self)
+        bar.pack(fill=tk.X, padx=8, pady=6)
+        ttk.Button(bar, text="撤销上一步", command=self.on_undo).pack(side=tk.LEFT, padx=4)
+        ttk.Button(bar, text="重做", command=self.on_redo).pack(side=tk.LEFT, padx=4)
+        ttk.Button(bar, text="关闭", command=self.destroy).pack(side=tk.RIGHT, padx=4)
+        table = ttk.Frame(self)
+        table.pack(fill=tk.BOTH, expand=True, padx=8, pady=(0, 8))
+        cols = ["时间", "操作", "条数", "状态"]
+        self.tree = ttk.Treeview(table, columns=cols, show="headings", selectmode="none")
+        widths = {"时间": 150, "操作": 240, "条数": 80, "状态": 80}
+        for c in cols:
+            self.tree.heading(c, text=c)
+            self.tree.column(c, width=widths[c], stretch=(c == "操作"))
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        vbar = ttk.Scrollbar(table, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vbar.set)
+        vbar.grid(row=0, column=1, sticky="ns")
+        table.rowconfigure(0, weight=1)
+        table.columnconfigure(0, weight=1)
+        self.lbl = ttk.Label(self, text="")
+        self.lbl.pack(fill=tk.X, padx=8, pady=(0, 6))
+        self.refresh()
+
+    def refresh(self):
+        from storage import list_operations, OP_LOG_KEEP
+        self.tree.delete(*self.tree.get_children())
+        try:
+            items = list_operations()
+        except Exception:
+            items = []
+        for op in items:
+            created = (op.get("created") or "")[:19].replace("T", " ")
+            self.tree.insert("", tk.END, values=[created, op.get("label", ""), op.get("rows", 0), ("已撤销" if op.get("undone") else "已执行")])
+        self.lbl.configure(text=f"保留最近 {OP_LOG_KEEP} 次批量操作；撤销后再做新的操作，已撤销的记录将无法重做")
+
+    def _step(self, undo):
+        try:
+            from storage import undo_last, redo
+            res = undo_last() if undo else redo()
+        except Exception as e:
+            messagebox.showerror("撤销失败" if undo else "重做失败", str(e), parent=self)
+            return
+        if res is None:
+            messagebox.showinfo("操作历史", "没有可撤销的操作" if undo else "没有可重做的操作", parent=self)
+            return
+        self.refresh()
+        if self.on_change:
+            self.on_change()
+        self.lbl.configure(text=f"已{'撤销' if undo else '重做'}：{res.get('label', '')}（{res.get('rows', 0)} 条）")
+
+    def on_undo(self):
+        self._step(True)
+
+    def on_redo(self):
+        self._step(False)
 
 class DummyTx:
     def __init__(self, d):
@@ -1,7 +1,7 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime, date, timedelta
-from storage import load_state, save_state, remove_account, find_account
+from storage import load_state, save_state, remove_account, find_account, get_pref, set_pref
 
 class CreditCardPage(ttk.Frame):
     def __init__(self, master):
@@ -30,8 +30,7 @@ class CreditCardPage(ttk.Frame):
         ttk.Button(top, text="列管理", command=self._manage_columns).pack(side=tk.RIGHT, padx=4)
         ttk.Button(top, text="删除选中", command=self._delete_selected).pack(side=tk.RIGHT, padx=4)
 
-        prefs = (self.state.get("prefs", {}) or {}).get("credit_cards", {})
-        self.visible_columns = list((prefs or {}).get("visible_columns", [])) or self._all_columns()
+        self.visible_columns = list(get_pref("credit_cards.visible_columns", []) or []) or self._all_columns()
         cols = list(self.visible_columns)
         self.tree = ttk.Treeview(self, columns=cols, show="headings", selectmode="extended")
         for c in cols:
@@ -162,10 +161,7 @@ class CreditCardPage(ttk.Frame):
         self.wait_window(dlg)
         if dlg.result:
             self.visible_columns = list(dlg.result)
-            s = load_state()
-            prefs = s.setdefault("prefs", {}).setdefault("credit_cards", {})
-            prefs["visible_columns"] = list(self.visible_columns)
-            save_state(s)
+            set_pref("credit_cards.visible_columns", list(self.visible_columns))
             try:
                 self.tree.destroy()
             except Exception:
@@ -3,14 +3,11 @@ from tkinter import ttk, messagebox
 from tkinter import font as tkfont
 from datetime import datetime, timedelta
 from collections import defaultdict
-from storage import load_state, save_state, apply_transaction_delta, get_account_names, get_transaction, remove_transaction, update_transaction, add_category, get_categories, get_category_rules, query_transactions
+from storage import load_state, save_state, apply_transaction_delta, get_account_names, get_transaction, remove_transaction, update_transaction, add_category, get_categories, get_category_rules, query_transactions, iter_transactions, list_years, list_months, get_ledger_store, account_balances_at, get_pref, set_pref
 import os
 import time
  
 from utils import parse_datetime, format_amount, normalize_ttype, gen_id
-from ui_bill_list import BillListDialog
-from ui_income_big import IncomePieBigDialog
-from ui_expense_big import ExpensePieBigDialog
 from ui_add_dialog import AddTransactionDialog
 import math
 import calendar
@@ -313,8 +310,7 @@ class DashboardPage(ttk.Frame):
     def refresh(self):
         self.fill_periods()
         try:
-            s = load_state()
-            last = (s.get("prefs", {}) or {}).get("dashboard", {})
+            last = get_pref("dashboard", {}) or {}
             lm = last.get("last_mode")
             lp = last.get("last_period")
             if lm in ("日度","月份","年份"):
@@ -335,37 +331,29 @@ class DashboardPage(ttk.Frame):
         self.fill_periods()
         self.current_period()
         self.update_controls_visibility()
+        self._save_period_pref()
+
+    def _save_period_pref(self):
         try:
-            s = load_state()
-            prefs = s.setdefault("prefs", {})
-            dash = prefs.setdefault("dashboard", {})
-            dash["last_mode"] = self.mode.get()
-            dash["last_period"] = self.period.get()
-            save_state(s)
+            set_pref("dashboard.last_mode", self.mode.get())
+            set_pref("dashboard.last_period", self.period.get())
         except Exception:
             pass
 
     def fill_periods(self):
-        s = load_state()
         vals = set()
+        # 可选期间直接取库内去重后的年/月，不再逐条解析交易时间
         if self.mode.get() == "日度":
-            for t in s.get("transactions", []):
-                dt = parse_datetime(t.get("time",""))
-                vals.add(dt.strftime("%Y-%m"))
+            vals = set(list_months(""))
             if not vals:
                 dt = datetime.now()
                 vals = {dt.strftime("%Y-%m")}
         elif self.mode.get() == "月份":
-            for t in s.get("transactions", []):
-                dt = parse_datetime(t.get("time",""))
-                vals.add(dt.strftime("%Y"))
+            vals = set(list_years())
             if not vals:
                 vals = {datetime.now().strftime("%Y")}
         else:
-            years = set()
-            for t in s.get("transactions", []):
-                dt = parse_datetime(t.get("time",""))
-                years.add(dt.strftime("%Y"))
+            years = set(list_years())
             if not years:
                 years = {datetime.now().strftime("%Y")}
             vals = years
@@ -410,11 +398,7 @@ class DashboardPage(ttk.Frame):
             end = datetime(dt.year+1, 1, 1)
             return start, end
         else:
-            s = load_state()
-            years = []
-            for t in s.get("transactions", []):
-                dt = parse_datetime(t.get("time",""))
-                years.append(dt.year)
+            years = [int(y) for y in list_years() if str(y).isdigit()]
             if not years:
                 y = int(datetime.now().strftime("%Y"))
                 return datetime(y,1,1), datetime(y+1,1,1)
@@ -439,15 +423,7 @@ class DashboardPage(ttk.Frame):
         else:
             return
         self.compute_and_render()
-        try:
-            s = load_state()
-            prefs = s.setdefault("prefs", {})
-            dash = prefs.setdefault("dashboard", {})
-            dash["last_period"] = self.period.get()
-            dash["last_mode"] = self.mode.get()
-            save_state(s)
-        except Exception:
-            pass
+        self._save_period_pref()
 
     def next_period(self):
         val = self.period.get()
@@ -466,15 +442,7 @@ class DashboardPage(ttk.Frame):
         else:
             return
         self.compute_and_render()
-        try:
-            s = load_state()
-            prefs = s.setdefault("prefs", {})
-            dash = prefs.setdefault("dashboard", {})
-            dash["last_period"] = self.period.get()
-            dash["last_mode"] = self.mode.get()
-            save_state(s)
-        except Exception:
-            pass
+        self._save_period_pref()
 
     def current_period(self):
         if self.mode.get() == "日度":
@@ -484,24 +452,12 @@ class DashboardPage(ttk.Frame):
         else:
             self.period.set(datetime.now().strftime("%Y"))
         self.compute_and_render()
-        try:
-            s = load_state()
-            prefs = s.setdefault("prefs", {})
-            dash = prefs.setdefault("dashboard", {})
-            dash["last_period"] = self.period.get()
-            dash["last_mode"] = self.mode.get()
-            save_state(s)
-        except Exception:
-            pass
+        self._save_period_pref()
 
     def compute_and_render(self):
         s = load_state()
         start, end = self.period_range()
-        txs = []
-        for t in s.get("transactions", []):
-            dt = parse_datetime(t.get("time",""))
-            if start <= dt < end:
-                txs.append(t)
+        txs = list(iter_transactions({"start": start, "end": end}, as_dict=True))
         self._current_txs = txs
         inc = 0.0
         exp = 0.0
@@ -513,8 +469,13 @@ class DashboardPage(ttk.Frame):
             elif typ in ["支出","报销类支出"]:
                 exp += amt
         net = inc - exp
-        assets = sum(float(a.get("balance",0)) for a in s.get("accounts", []))
-        change = net
+        # 期末总资产按余额历史回推到所选周期末，资产变动为期末减期初
+        try:
+            assets = sum(account_balances_at(end, s).values())
+            change = assets - sum(account_balances_at(start, s).values())
+        except Exception:
+            assets = sum(float(a.get("balance",0)) for a in s.get("accounts", []))
+            change = net
         self.k_income.configure(text=f"总收入: {format_amount(inc)}")
         self.k_expense.configure(text=f"总支出: {format_amount(exp)}")
         self.k_net.configure(text=f"净现金流: {format_amount(net)}")
@@ -656,6 +617,7 @@ class DashboardPage(ttk.Frame):
             c.create_text(x+10, y-10, text=t, anchor="w", fill="#000000", tags=("bars_tip",))
 
     def on_bars_click(self, e):
+        from ui_bill_list import BillListDialog
         x = self.canvas_bars.canvasx(e.x)
         y = self.canvas_bars.canvasy(e.y)
         hit = None
@@ -884,6 +846,7 @@ class DashboardPage(ttk.Frame):
             c.create_text(x+10, y-10, text=t, anchor="w", fill="#000000", tags=("trend_tip",))
 
     def on_trend_click(self, e):
+        from ui_bill_list import BillListDialog
         x = self.canvas_trend.canvasx(e.x)
         y = self.canvas_trend.canvasy(e.y)
         hit = None
@@ -1125,6 +1088,7 @@ class DashboardPage(ttk.Frame):
         self._on_pie_click(self.canvas_pie_expense, getattr(self, "_pie_expense_ids", {}), e.x, e.y)
 
     def _on_pie_click(self, canvas, id_map, x, y):
+        from ui_bill_list import BillListDialog
         near = canvas.find_closest(x, y)
         if not near:
             return
@@ -1148,10 +1112,12 @@ class DashboardPage(ttk.Frame):
             BillListDialog(self.view, initial_filters={"date_range": (s, e), "ttype": ttype, "category": name})
 
     def open_expense_pie_big(self):
+        from ui_expense_big import ExpensePieBigDialog
         txs = getattr(self, "_current_txs", [])
         ExpensePieBigDialog(self, txs)
 
     def open_income_pie_big(self):
+        from ui_income_big import IncomePieBigDialog
         txs = getattr(self, "_current_txs", [])
         IncomePieBigDialog(self, txs)
 
@@ -1278,8 +1244,7 @@ class DashboardPage(ttk.Frame):
 
     def _apply_saved_sash(self):
         try:
-            s = load_state()
-            pos = int(s.get("prefs", {}).get("dashboard", {}).get("sash_pos", 0))
+            pos = int(get_pref("dashboard.sash_pos", 0) or 0)
             if pos > 0:
                 self.paned.sashpos(0, pos)
         except Exception:
@@ -1291,11 +1256,7 @@ class DashboardPage(ttk.Frame):
             if getattr(self, "_last_sash_pos", None) == pos:
                 return
             self._last_sash_pos = pos
-            s = load_state()
-            prefs = s.setdefault("prefs", {})
-            dash = prefs.setdefault("dashboard", {})
-            dash["sash_pos"] = pos
-            save_state(s)
+            set_pref("dashboard.sash_pos", pos)
         except Exception:
             pass
 
@@ -1392,18 +1353,19 @@ class DailyModule(ttk.Frame):
         for i in range(7):
             grid.grid_columnconfigure(i, weight=1, uniform="day")
         first_weekday, days_in_month = calendar.monthrange(y, m)
+        # 一次遍历按日汇总，避免每个日期格子都重新扫描全部账单
+        daily = defaultdict(lambda: [0.0, 0.0])
+        for t in txs:
+            dt = parse_datetime(t.get("time",""))
+            if dt.year == y and dt.month == m:
+                typ = normalize_ttype(t.get("ttype"))
+                amt = float(t.get("amount",0))
+                if typ in ["收入","报销类收入"]:
+                    daily[dt.day][0] += amt
+                elif typ in ["支出","报销类支出"]:
+                    daily[dt.day][1] += amt
         def day_summary(d):
-            inc = 0.0
-            exp = 0.0
-            for t in txs:
-                dt = parse_datetime(t.get("time",""))
-                if dt.year == y and dt.month == m and dt.day == d:
-                    typ = normalize_ttype(t.get("ttype"))
-                    amt = float(t.get("amount",0))
-                    if typ in ["收入","报销类收入"]:
-                        inc += amt
-                    elif typ in ["支出","报销类支出"]:
-                        exp += amt
+            inc, exp = daily.get(d, (0.0, 0.0))
             return inc, exp
         row = 0
         col = (first_weekday + 6) % 7
@@ -1754,8 +1716,7 @@ class DashboardListView(ttk.Frame):
         ]
         self.visible_columns = list(self.all_columns)
         try:
-            s = load_state()
-            saved = (s.get("prefs", {}) or {}).get("dashboard_list", {}).get("visible_columns")
+            saved = get_pref("dashboard_list.visible_columns")
             if isinstance(saved, list) and saved:
                 self.visible_columns = [c for c in self.all_columns if c in saved]
         except Exception:
@@ -1863,18 +1824,14 @@ class DashboardListView(ttk.Frame):
         self.visible_columns = keep
         self.tree["displaycolumns"] = tuple(self.visible_columns)
         try:
-            s = load_state()
-            prefs = s.setdefault("prefs", {}).setdefault("dashboard_list", {})
-            prefs["visible_columns"] = list(self.visible_columns)
-            save_state(s)
+            set_pref("dashboard_list.visible_columns", list(self.visible_columns))
         except Exception:
             pass
         self._save_column_widths()
 
     def _apply_saved_widths(self):
         try:
-            s = load_state()
-            widths = (s.get("prefs", {}) or {}).get("dashboard_list", {}).get("column_widths", {})
+            widths = get_pref("dashboard_list.column_widths", {}) or {}
             for c in self.all_columns:
                 default = 200 if c == "备注" else 140
                 w = int(widths.get(c, default))
@@ -1884,16 +1841,14 @@ class DashboardListView(ttk.Frame):
 
     def _save_column_widths(self):
         try:
-            s = load_state()
-            prefs = s.setdefault("prefs", {}).setdefault("dashboard_list", {})
             widths = {}
             for c in self.all_columns:
                 try:
                     widths[c] = int(self.tree.column(c, 'width'))
                 except Exception:
                     pass
-            prefs["column_widths"] = widths
-            save_state(s)
+            if widths != get_pref("dashboard_list.column_widths"):
+                set_pref("dashboard_list.column_widths", widths)
         except Exception:
             pass
 
@@ -1991,13 +1946,9 @@ class DashboardListView(ttk.Frame):
         ids = self._selected_tx_ids()
         if not ids:
             return
-        state = load_state()
-        for tx_id in ids:
-            t = get_transaction(state, tx_id)
-            if t:
-                apply_transaction_delta(state, t, -1)
-                remove_transaction(state, tx_id)
-        save_state(state)
+        with get_ledger_store().batch(label="删除账单") as b:
+            for tx_id in ids:
+                b.delete(tx_id)
         for iid in list(self.tree.selection()) or []:
             try:
                 self.tree.delete(iid)
@@ -2021,20 +1972,15 @@ class DashboardListView(ttk.Frame):
             return
         s = load_state()
         count = 0
-        for tx_id in ids:
-            old = get_transaction(s, tx_id)
-            if not old:
-                continue
-            new = dict(old)
-            new["ttype"] = "收入"
-            try:
-                apply_transaction_delta(s, old, -1)
-                update_transaction(s, tx_id, type('DummyTx', (), {'to_dict': lambda self2: new})())
-                apply_transaction_delta(s, new, 1)
-                count += 1
-            except Exception:
-                pass
-        save_state(s)
+        with get_ledger_store().batch(s, label="批量改为收入") as b:
+            for tx_id in ids:
+                old = b.get(tx_id)
+                if not old:
+                    continue
+                new = dict(old)
+                new["ttype"] = "收入"
+                if b.update(tx_id, new):
+                    count += 1
         messagebox.showinfo("批量修改完成", f"已改为收入: {count} 条")
         self._refresh_selection_rows(s, ids)
 
@@ -2044,20 +1990,15 @@ class DashboardListView(ttk.Frame):
             return
         s = load_state()
         count = 0
-        for tx_id in ids:
-            old = get_transaction(s, tx_id)
-            if not old:
-                continue
-            new = dict(old)
-            new["ttype"] = "支出"
-            try:
-                apply_transaction_delta(s, old, -1)
-                update_transaction(s, tx_id, type('DummyTx', (), {'to_dict': lambda self2: new})())
-                apply_transaction_delta(s, new, 1)
-                count += 1
-            except Exception:
-                pass
-        save_state(s)
+        with get_ledger_store().batch(s, label="批量改为支出") as b:
+            for tx_id in ids:
+                old = b.get(tx_id)
+                if not old:
+                    continue
+                new = dict(old)
+                new["ttype"] = "支出"
+                if b.update(tx_id, new):
+                    count += 1
         messagebox.showinfo("批量修改完成", f"已改为支出: {count} 条")
         self._refresh_selection_rows(s, ids)
 
@@ -2067,24 +2008,19 @@ class DashboardListView(ttk.Frame):
             return
         s = load_state()
         count = 0
-        for tx_id in ids:
-            old = get_transaction(s, tx_id)
-            if not old:
-                continue
-            try:
-                apply_transaction_delta(s, old, -1)
+        with get_ledger_store().batch(s, label="批量改为转账") as b:
+            for tx_id in ids:
+                old = b.get(tx_id)
+                if not old:
+                    continue
                 new = dict(old)
                 new["ttype"] = "转账"
                 new["category"] = "转账"
                 new["account"] = ""
                 new["to_account"] = None
                 new["from_account"] = None
-                update_transaction(s, tx_id, type('DummyTx', (), {'to_dict': lambda self2: new})())
-                apply_transaction_delta(s, new, 1)
-                count += 1
-            except Exception:
-                pass
-        save_state(s)
+                if b.update(tx_id, new):
+                    count += 1
         messagebox.showinfo("批量修改完成", f"已修改为转账: {count} 条")
         self._refresh_selection_rows(s, ids)
 
@@ -2129,33 +2065,28 @@ class DashboardListView(ttk.Frame):
             return
         s = load_state()
         count = 0
-        for tx_id in ids:
-            old = get_transaction(s, tx_id)
-            if not old:
-                continue
-            new = dict(old)
-            if result["only_empty"]:
-                if acc_sel is not None and not new.get("account"):
-                    new["account"] = acc_sel
-                if fa is not None and not new.get("from_account"):
-                    new["from_account"] = fa
-                if ta is not None and not new.get("to_account"):
-                    new["to_account"] = ta
-            else:
-                if acc_sel is not None:
-                    new["account"] = acc_sel
-                if fa is not None:
-                    new["from_account"] = fa
-                if ta is not None:
-                    new["to_account"] = ta
-            try:
-                apply_transaction_delta(s, old, -1)
-                update_transaction(s, tx_id, type('DummyTx', (), {'to_dict': lambda self2: new})())
-                apply_transaction_delta(s, new, 1)
-                count += 1
-            except Exception:
-                pass
-        save_state(s)
+        with get_ledger_store().batch(s, label="批量修改账户") as b:
+            for tx_id in ids:
+                old = b.get(tx_id)
+                if not old:
+                    continue
+                new = dict(old)
+                if result["only_empty"]:
+                    if acc_sel is not None and not new.get("account"):
+                        new["account"] = acc_sel
+                    if fa is not None and not new.get("from_account"):
+                        new["from_account"] = fa
+                    if ta is not None and not new.get("to_account"):
+                        new["to_account"] = ta
+                else:
+                    if acc_sel is not None:
+                        new["account"] = acc_sel
+                    if fa is not None:
+                        new["from_account"] = fa
+                    if ta is not None:
+                        new["to_account"] = ta
+                if b.update(tx_id, new):
+                    count += 1
         messagebox.showinfo("批量修改完成", f"已更新账户信息: {count} 条")
         self._refresh_selection_rows(s, ids)
 
@@ -2208,25 +2139,20 @@ class DashboardListView(ttk.Frame):
         s = load_state()
         add_category(s, sc, cat_final)
         count = 0
-        for tx_id in ids:
-            old = get_transaction(s, tx_id)
-            if not old:
-                continue
-            typ = (old.get("ttype") or "").strip()
-            if sc == "收入" and typ not in ["收入","报销类收入"]:
-                continue
-            if sc == "支出" and typ not in ["支出","报销类支出"]:
-                continue
-            new = dict(old)
-            new["category"] = cat_final
-            try:
-                apply_transaction_delta(s, old, -1)
-                update_transaction(s, tx_id, type('DummyTx', (), {'to_dict': lambda self2: new})())
-                apply_transaction_delta(s, new, 1)
-                count += 1
-            except Exception:
-                pass
-        save_state(s)
+        with get_ledger_store().batch(s, label="批量修改类别") as b:
+            for tx_id in ids:
+                old = b.get(tx_id)
+                if not old:
+                    continue
+                typ = (old.get("ttype") or "").strip()
+                if sc == "收入" and typ not in ["收入","报销类收入"]:
+                    continue
+                if sc == "支出" and typ not in ["支出","报销类支出"]:
+                    continue
+                new = dict(old)
+                new["category"] = cat_final
+                if b.update(tx_id, new):
+                    count += 1
         messagebox.showinfo("批量修改完成", f"已更新消费类别: {count} 条")
         self._refresh_selection_rows(s, ids)
 
@@ -2266,26 +2192,21 @@ class DashboardListView(ttk.Frame):
             return
         s = load_state()
         count = 0
-        for tx_id in ids:
-            old = get_transaction(s, tx_id)
-            if not old:
-                continue
-            new = dict(old)
-            if res.get("only_empty"):
-                if not (new.get("record_source") or "").strip():
-                    new["record_source"] = src
-                else:
+        with get_ledger_store().batch(s, label="批量修改记账来源") as b:
+            for tx_id in ids:
+                old = b.get(tx_id)
+                if not old:
                     continue
-            else:
-                new["record_source"] = src
-            try:
-                apply_transaction_delta(s, old, -1)
-                update_transaction(s, tx_id, type('DummyTx', (), {'to_dict': lambda self2: new})())
-                apply_transaction_delta(s, new, 1)
-                count += 1
-            except Exception:
-                pass
-        save_state(s)
+                new = dict(old)
+                if res.get("only_empty"):
+                    if not (new.get("record_source") or "").strip():
+                        new["record_source"] = src
+                    else:
+                        continue
+                else:
+                    new["record_source"] = src
+                if b.update(tx_id, new):
+                    count += 1
         messagebox.showinfo("批量修改完成", f"已更新记账来源: {count} 条")
         self._refresh_selection_rows(s, ids)
 
@@ -2296,35 +2217,35 @@ class DashboardListView(ttk.Frame):
         s = load_state()
         filled = 0
         skipped = 0
-        for tx_id in ids:
-            t = get_transaction(s, tx_id)
-            if not t:
-                skipped += 1
-                continue
-            typ = normalize_ttype(t.get("ttype"))
-            if typ not in ["收入","报销类收入","支出","报销类支出"]:
-                skipped += 1
-                continue
-            cat = (t.get("category") or "").strip()
-            if cat:
-                skipped += 1
-                continue
-            text = " ".join([
-                str(t.get("note","")),
-                str(t.get("record_source","")),
-                str(t.get("account","")),
-            ]).lower()
-            scene = "收入" if typ in ["收入","报销类收入"] else "支出"
-            pred = self._predict_category_for_dashboard(text, scene, s)
-            if not pred:
-                skipped += 1
-                continue
-            new = dict(t)
-            new["category"] = pred
-            add_category(s, scene, pred)
-            update_transaction(s, tx_id, type('DummyTx', (), {'to_dict': lambda self2: new})())
-            filled += 1
-        save_state(s)
+        with get_ledger_store().batch(s, label="预填消费类别") as b:
+            for tx_id in ids:
+                t = b.get(tx_id)
+                if not t:
+                    skipped += 1
+                    continue
+                typ = normalize_ttype(t.get("ttype"))
+                if typ not in ["收入","报销类收入","支出","报销类支出"]:
+                    skipped += 1
+                    continue
+                cat = (t.get("category") or "").strip()
+                if cat:
+                    skipped += 1
+                    continue
+                text = " ".join([
+                    str(t.get("note","")),
+                    str(t.get("record_source","")),
+                    str(t.get("account","")),
+                ]).lower()
+                scene = "收入" if typ in ["收入","报销类收入"] else "支出"
+                pred = self._predict_category_for_dashboard(text, scene, s)
+                if not pred:
+                    skipped += 1
+                    continue
+                new = dict(t)
+                new["category"] = pred
+                add_category(s, scene, pred)
+                b.update(tx_id, new, apply_delta=False)
+                filled += 1
         messagebox.showinfo("AI预填完成", f"已预填: {filled} 条\n跳过: {skipped} 条")
         self._refresh_selection_rows(s, ids)
 
@@ -1,13 +1,13 @@
 import tkinter as tk
 from tkinter import ttk
 import importlib
-import help_content
 
 
 class HelpPage(ttk.Frame):
     def __init__(self, master):
         super().__init__(master)
         self._toc_index_map = {}
+        self._rendered = False
         self._build()
 
     def _build(self):
@@ -36,10 +36,14 @@ class HelpPage(ttk.Frame):
         self.text.bind("<Control-f>", self._open_find_dialog)
 
     def refresh(self):
-        try:
-            importlib.reload(help_content)
-        except Exception:
-            pass
+        import help_content
+        # 首次进入时才导入说明内容；之后每次进入重新加载以反映修改
+        if self._rendered:
+            try:
+                importlib.reload(help_content)
+            except Exception:
+                pass
+        self._rendered = True
         self._render_document(help_content.get_help_content())
 
     def _configure_text_tags(self):
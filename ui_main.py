@@ -2,24 +2,16 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
 from datetime import datetime
-from storage import load_state, save_state, backup_state, add_transaction, apply_transaction_delta, get_account_names, add_category, BASE_DIR, remove_transaction, get_transaction
+from storage import load_state, save_state, backup_state, add_transaction, apply_transaction_delta, get_account_names, add_category, BASE_DIR, remove_transaction, get_transaction, iter_transactions, get_ledger_store, get_pref
 from storage import set_ledger_path, get_user_ledger_path, load_user_index, find_user_by_name, create_user, get_current_ledger_path
 from utils import make_salt, hash_password, verify_password
 from utils import normalize_ttype
 from storage import load_state, get_category_rules
 from models import Transaction
 from utils import gen_id, parse_datetime
-from ui_bill_list import BillListPage
-from ui_account_manager import AccountManagerPage
-from ui_credit_cards import CreditCardPage
-from ui_add_dialog import AddTransactionDialog
-from importers import try_import, STANDARD_TEMPLATE_COLUMNS
-from ui_dashboard import DashboardPage
-from ui_settings import SettingsPage
 from ui_icons import create_icons
-from ui_help import HelpPage
-from import_ai import process_images, export_failures
-import zipfile
+import importlib
+import startup_trace
 
 class MainApp(ttk.Frame):
     def __init__(self, master):
@@ -30,7 +22,7 @@ class MainApp(ttk.Frame):
         self.credit_cards_enabled = bool((self.state.get("prefs", {}) or {}).get("credit_cards_enabled", True))
         self.current_user_id = None
         try:
-            self.menu_layout_mode = (self.state.get("prefs", {}) or {}).get("menu_layout", 'classic')
+            self.menu_layout_mode = get_pref("menu_layout", 'classic')
         except Exception:
             self.menu_layout_mode = 'classic'
         self.build_ui()
@@ -58,21 +50,51 @@ class MainApp(ttk.Frame):
         self.build_sidebar()
         self.content = ttk.Frame(body)
         self.content.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        from ui_record_page import RecordPage
-        self.pages = {
-            "dashboard": DashboardPage(self.content),
-            "bills": BillListPage(self.content, controller=self),
-            "accounts": AccountManagerPage(self.content),
-            "credit_cards": CreditCardPage(self.content),
-            "record": RecordPage(self.content),
-            "settings": SettingsPage(self.content, controller=self),
-            "import": self.ImportPanel(self.content, controller=self),
-            "help": HelpPage(self.content),
-            "invest": self._lazy_investments_page(),
-        }
+        self.pages = {}
+        self._current_page = None
+        startup_trace.watch_first_paint(self.winfo_toplevel(), self._show_landing)
+
+    # 页面按需导入与构建：模块名、类名、是否传入 controller
+    PAGE_SPECS = {
+        "dashboard": ("ui_dashboard", "DashboardPage", False),
+        "bills": ("ui_bill_list", "BillListPage", True),
+        "accounts": ("ui_account_manager", "AccountManagerPage", False),
+        "credit_cards": ("ui_credit_cards", "CreditCardPage", False),
+        "record": ("ui_record_page", "RecordPage", False),
+        "settings": ("ui_settings", "SettingsPage", True),
+        "help": ("ui_help", "HelpPage", False),
+    }
+
+    def _show_landing(self):
+        # 窗口首帧绘制后再构建首页；用户已先行切换页面时不覆盖
+        if self._current_page is None:
+            self.show_dashboard()
+        startup_trace.finish()
+
+    def _page(self, name):
+        page = self.pages.get(name)
+        if page is not None:
+            return page
+        with startup_trace.span("page", name):
+            if name == "import":
+                page = self.ImportPanel(self.content, controller=self)
+            elif name == "invest":
+                page = self._lazy_investments_page()
+            else:
+                mod_name, cls_name, with_controller = self.PAGE_SPECS[name]
+                cls = getattr(importlib.import_module(mod_name), cls_name)
+                page = cls(self.content, controller=self) if with_controller else cls(self.content)
+        self.pages[name] = page
+        return page
+
+    def _show_page(self, name):
+        page = self._page(name)
         for p in self.pages.values():
-            p.pack_forget()
-        self.show_dashboard()
+            if p is not page:
+                p.pack_forget()
+        page.pack(fill=tk.BOTH, expand=True)
+        self._current_page = name
+        return page
 
     def build_sidebar(self):
         for w in self.sidebar.winfo_children():
@@ -104,56 +126,39 @@ class MainApp(ttk.Frame):
         self.build_sidebar()
 
     def show_bills(self):
-        for p in self.pages.values():
-            p.pack_forget()
-        self.pages["bills"].pack(fill=tk.BOTH, expand=True)
-        self.pages["bills"].refresh()
+        self._show_page("bills").refresh()
 
     def show_dashboard(self):
-        for p in self.pages.values():
-            p.pack_forget()
-        self.pages["dashboard"].pack(fill=tk.BOTH, expand=True)
-        self.pages["dashboard"].refresh()
+        self._show_page("dashboard").refresh()
 
     def show_accounts(self):
-        for p in self.pages.values():
-            p.pack_forget()
-        self.pages["accounts"].pack(fill=tk.BOTH, expand=True)
-        self.pages["accounts"].refresh()
+        self._show_page("accounts").refresh()
 
     def show_investments(self):
         if not bool((load_state().get("prefs", {}) or {}).get("investments_enabled", True)):
             return
-        for p in self.pages.values():
-            p.pack_forget()
-        self.pages["invest"].pack(fill=tk.BOTH, expand=True)
+        page = self._show_page("invest")
         try:
-            self.pages["invest"].refresh()
+            page.refresh()
         except Exception:
             pass
 
     def show_credit_cards(self):
         if not bool((load_state().get("prefs", {}) or {}).get("credit_cards_enabled", True)):
             return
-        for p in self.pages.values():
-            p.pack_forget()
-        self.pages["credit_cards"].pack(fill=tk.BOTH, expand=True)
+        page = self._show_page("credit_cards")
         try:
-            self.pages["credit_cards"].refresh()
+            page.refresh()
         except Exception:
             pass
 
     def show_settings(self):
-        for p in self.pages.values():
-            p.pack_forget()
-        self.pages["settings"].pack(fill=tk.BOTH, expand=True)
+        self._show_page("settings")
 
     def show_help(self):
-        for p in self.pages.values():
-            p.pack_forget()
-        self.pages["help"].pack(fill=tk.BOTH, expand=True)
+        page = self._show_page("help")
         try:
-            self.pages["help"].refresh()
+            page.refresh()
         except Exception:
             pass
     def refresh_all(self):
@@ -164,19 +169,17 @@ class MainApp(ttk.Frame):
             self.build_sidebar()
         except Exception:
             pass
-        self.pages["bills"].refresh()
-        self.pages["accounts"].refresh()
+        # 未构建的页面首次进入时自会加载最新数据
+        for name in ("bills", "accounts"):
+            page = self.pages.get(name)
+            if page is not None:
+                page.refresh()
 
     def show_record_page(self):
-        for p in self.pages.values():
-            p.pack_forget()
-        self.pages["record"].pack(fill=tk.BOTH, expand=True)
-        self.pages["record"].refresh()
+        self._show_page("record").refresh()
 
     def show_import_panel(self):
-        for p in self.pages.values():
-            p.pack_forget()
-        self.pages["import"].pack(fill=tk.BOTH, expand=True)
+        self._show_page("import")
 
     def _focus_bill_search(self, e=None):
         try:
@@ -272,111 +275,123 @@ class MainApp(ttk.Frame):
     def import_records(self):
         self.show_import_panel()
 
-    def _handle_import_rows(self, rows, source_label, stats):
+    def _import_files(self, paths, source_label, platform=None, on_error=None):
+        # 后台线程中逐文件解析、分块查重提交，进度窗显示读取进度与导入条数；出错或取消时已提交的块全部回滚
+        from importers import iter_import_files
+        from storage import import_transactions
+        from ui_tasks import run_task
         s = load_state()
         account_names = get_account_names(s)
         if not account_names:
             raise ValueError("请先新增账户再导入")
-        now_iso = datetime.now().isoformat()
-        for r in rows:
-            r["record_time"] = now_iso
-            r["record_source"] = source_label
-            cat_sync = (r.get("category") or "").strip()
-            typ_sync = normalize_ttype(r.get("ttype"))
-            if cat_sync and typ_sync in ["收入","报销类收入","支出","报销类支出"]:
-                sc_sync = "收入" if typ_sync in ["收入","报销类收入"] else "支出"
-                add_category(s, sc_sync, cat_sync)
         use_ai = messagebox.askyesno("预填消费类别", "是否让系统进行预填消费类别？")
-        ai_prefill = 0
-        if use_ai:
-            for r in rows:
+        now_iso = datetime.now().isoformat()
+        ctx = {"ai_prefill": 0, "account": None}
+        # 新类别先记在本地，导入完成后在界面线程写入账本；取消或出错时类别表不变
+        new_cats = {}
+        src_stats = {}
+        total_bytes = 0
+        for p in paths:
+            try:
+                total_bytes += os.path.getsize(p)
+            except OSError:
+                pass
+
+        def work(task):
+            def prepare(r):
+                task.check()
+                r["record_time"] = now_iso
+                r["record_source"] = source_label
                 cat = (r.get("category") or "").strip()
                 typ = normalize_ttype(r.get("ttype"))
-                if not cat and typ in ["收入","报销类收入","支出","报销类支出"]:
-                    text = " ".join([str(r.get("note","")), str(r.get("record_source","")), str(r.get("account",""))]).lower()
+                if typ in ["收入","报销类收入","支出","报销类支出"]:
                     sc = "收入" if typ in ["收入","报销类收入"] else "支出"
-                    pred = self._predict_category(text, sc)
-                    if pred:
-                        r["category"] = pred
-                        add_category(s, sc, pred)
-                        ai_prefill += 1
-        if any((not r.get("account")) for r in rows):
-            acc = self.ask_default_account(account_names)
-            if not acc:
-                raise ValueError("未选择默认账户，无法完成导入")
-            for r in rows:
+                    if cat:
+                        new_cats[(sc, cat)] = None
+                    elif use_ai:
+                        text = " ".join([str(r.get("note","")), str(r.get("record_source","")), str(r.get("account",""))]).lower()
+                        pred = self._predict_category(text, sc)
+                        if pred:
+                            r["category"] = pred
+                            new_cats[(sc, pred)] = None
+                            ctx["ai_prefill"] += 1
                 if not r.get("account"):
-                    r["account"] = acc
-        from utils import tx_signature
-        from storage import sync_batch_to_db
-        existing = {tx_signature(t) for t in s.get("transactions", [])}
-        dup_rows = []
-        success = 0
-        dup = 0
-        added_rows = []
-        for r in rows:
-            sig = tx_signature(r)
-            if sig in existing:
-                dup += 1
-                dup_rows.append([
-                    r.get("time", "")[:19].replace("T"," "),
-                    str(r.get("amount", "")),
-                    r.get("category",""),
-                    r.get("ttype",""),
-                    r.get("account",""),
-                    r.get("to_account","") or "",
-                    r.get("from_account","") or "",
-                    r.get("note",""),
-                ])
-                continue
-            existing.add(sig)
-            s["transactions"].append(r)
-            apply_transaction_delta(s, r, 1)
-            added_rows.append(r)
-            success += 1
-        save_state(s)
-        sync_batch_to_db(added_rows)
-        total = len(rows)
-        skipped = total - success
-        msg = f"导入完成\n总计: {total} 条\n成功: {success} 条"
-        if dup:
-            msg += f"\n重复: {dup} 条"
-        skipped_no_io = int((stats or {}).get("skipped_no_io", 0))
-        if skipped_no_io:
-            msg += f"\n跳过（不计收支）: {skipped_no_io} 条"
-        if skipped - dup:
-            msg += f"\n其他未导入: {skipped - dup} 条"
-        if use_ai:
-            msg += f"\nAI预填类别: {ai_prefill} 条"
-        # 导出重复条目
-        if dup_rows:
-            try:
-                cols = ["交易时间","金额","消费类别","所属类别","账户","转入账户","转出账户","备注"]
-                ts = datetime.now().strftime("%Y%m%d_%H%M")
-                out_path = os.path.join(BASE_DIR, f"duplicates_{ts}.xlsx")
-                self._write_xlsx(out_path, cols, dup_rows)
-                msg += f"\n重复条目已导出: {out_path}"
-            except Exception:
-                pass
-        messagebox.showinfo("导入结果", msg)
-        self.refresh_all()
+                    if ctx["account"] is None:
+                        # 选择默认账户的对话框须在界面线程弹出
+                        ctx["account"] = task.call_ui(self.ask_default_account, account_names)
+                        if not ctx["account"]:
+                            raise ValueError("未选择默认账户，无法完成导入")
+                    r["account"] = ctx["account"]
+                return r
+            def progress(st):
+                task.report("读取并导入", src_stats.get("bytes_read", 0), total_bytes,
+                            f"已读取 {st['read']} 条，已导入 {st['imported']} 条，重复 {st['duplicates']} 条")
+                task.check()
+            task.report("读取并导入", 0, total_bytes, "正在读取…")
+            # 多个文件在进程池中并行解析，按文件顺序合并；查重与入库在本进程完成
+            rows = iter_import_files(paths, account_names, platform, src_stats)
+            stats = import_transactions(rows, s, prepare=prepare, progress=progress)
+            # 导出重复条目
+            if stats["duplicate_rows"]:
+                task.report("导出重复条目", 0, 0, f"重复 {stats['duplicates']} 条")
+                try:
+                    cols = ["交易时间","金额","消费类别","所属类别","账户","转入账户","转出账户","备注"]
+                    dup_rows = [[
+                        r.get("time", "")[:19].replace("T"," "),
+                        str(r.get("amount", "")),
+                        r.get("category",""),
+                        r.get("ttype",""),
+                        r.get("account",""),
+                        r.get("to_account","") or "",
+                        r.get("from_account","") or "",
+                        r.get("note",""),
+                    ] for r in stats["duplicate_rows"]]
+                    ts = datetime.now().strftime("%Y%m%d_%H%M")
+                    out_path = os.path.join(BASE_DIR, f"duplicates_{ts}.xlsx")
+                    self._write_xlsx(out_path, cols, dup_rows)
+                    stats["duplicates_path"] = out_path
+                except Exception:
+                    pass
+            return stats
+
+        def done(stats):
+            for sc, name in new_cats:
+                add_category(s, sc, name)
+            save_state(s)
+            total = stats["read"]
+            success = stats["imported"]
+            dup = stats["duplicates"]
+            skipped = total - success
+            msg = f"导入完成\n总计: {total} 条\n成功: {success} 条"
+            if dup:
+                msg += f"\n重复: {dup} 条"
+            skipped_no_io = int(src_stats.get("skipped_no_io", 0))
+            if skipped_no_io:
+                msg += f"\n跳过（不计收支）: {skipped_no_io} 条"
+            if skipped - dup:
+                msg += f"\n其他未导入: {skipped - dup} 条"
+            if use_ai:
+                msg += f"\nAI预填类别: {ctx['ai_prefill']} 条"
+            if src_stats.get("encodings"):
+                msg += f"\n文件编码: {'、'.join(e.upper() for e in src_stats['encodings'])}（识别用时 {src_stats.get('detect_ms', 0.0):.1f} ms）"
+            if stats.get("duplicates_path"):
+                msg += f"\n重复条目已导出: {stats['duplicates_path']}"
+            messagebox.showinfo("导入结果", msg)
+            self.refresh_all()
+
+        def cancelled():
+            messagebox.showinfo("导入结果", "已取消导入，本次已写入的账单与余额变动已全部撤回")
+            self.refresh_all()
+
+        run_task(self, f"导入{source_label}账单", work, on_done=done,
+                 on_error=on_error or (lambda e: self._show_error_dialog(str(e))), on_cancel=cancelled)
 
     def _import_alipay(self):
         paths = filedialog.askopenfilenames(title="选择支付宝账单文件", filetypes=[("所有文件","*.*"), ("CSV 文件","*.csv"), ("Excel 文件","*.xlsx")])
         if not paths:
             return
-        from importers import read_csv, read_xlsx, map_alipay
-        s = load_state()
-        account_names = get_account_names(s)
-        rows_all = []
-        stats_total = {"skipped_no_io": 0}
         try:
-            for p in paths:
-                raw = read_csv(p) if p.lower().endswith('.csv') else read_xlsx(p)
-                rows, stats = map_alipay(raw, account_names)
-                rows_all.extend(rows)
-                stats_total["skipped_no_io"] += int(stats.get("skipped_no_io", 0))
-            self._handle_import_rows(rows_all, "支付宝", stats_total)
+            self._import_files(paths, "支付宝", "alipay")
         except Exception as e:
             self._show_error_dialog(str(e))
 
@@ -384,16 +399,8 @@ class MainApp(ttk.Frame):
         paths = filedialog.askopenfilenames(title="选择微信账单文件", filetypes=[("所有文件","*.*"), ("CSV 文件","*.csv"), ("Excel 文件","*.xlsx")])
         if not paths:
             return
-        from importers import read_csv, read_xlsx, map_wechat
-        s = load_state()
-        account_names = get_account_names(s)
-        rows_all = []
         try:
-            for p in paths:
-                raw = read_csv(p) if p.lower().endswith('.csv') else read_xlsx(p)
-                rows = map_wechat(raw, account_names)
-                rows_all.extend(rows)
-            self._handle_import_rows(rows_all, "微信", {"skipped_no_io": 0})
+            self._import_files(paths, "微信", "wechat")
         except Exception as e:
             self._show_error_dialog(str(e))
 
@@ -401,16 +408,8 @@ class MainApp(ttk.Frame):
         paths = filedialog.askopenfilenames(title="选择浦发银行账单文件", filetypes=[("CSV 文件","*.csv"), ("Excel 文件","*.xlsx"), ("所有文件","*.*")])
         if not paths:
             return
-        from importers import read_csv, read_xlsx, map_spdb
-        s = load_state()
-        account_names = get_account_names(s)
-        rows_all = []
         try:
-            for p in paths:
-                raw = read_csv(p) if p.lower().endswith('.csv') else read_xlsx(p)
-                rows = map_spdb(raw, account_names)
-                rows_all.extend(rows)
-            self._handle_import_rows(rows_all, "浦发银行", {"skipped_no_io": 0})
+            self._import_files(paths, "浦发银行", "spdb", on_error=lambda e: messagebox.showerror("导入失败", str(e)))
         except Exception as e:
             messagebox.showerror("导入失败", str(e))
 
@@ -418,30 +417,14 @@ class MainApp(ttk.Frame):
         paths = filedialog.askopenfilenames(title="选择中信银行账单文件", filetypes=[("所有文件","*.*"), ("CSV 文件","*.csv"), ("Excel 文件","*.xlsx")])
         if not paths:
             return
-        from importers import read_csv, read_xlsx, map_citic
-        s = load_state()
-        account_names = get_account_names(s)
-        rows_all = []
-        for p in paths:
-            raw = read_csv(p) if p.lower().endswith('.csv') else read_xlsx(p)
-            rows = map_citic(raw, account_names)
-            rows_all.extend(rows)
-        self._handle_import_rows(rows_all, "中信银行", {"skipped_no_io": 0})
+        self._import_files(paths, "中信银行", "citic")
 
     def _import_standard(self):
         paths = filedialog.askopenfilenames(title="选择标准模版文件", filetypes=[("所有文件","*.*"), ("CSV 文件","*.csv"), ("Excel 文件","*.xlsx")])
         if not paths:
             return
-        from importers import read_csv, read_xlsx, import_standard_rows
-        s = load_state()
-        account_names = get_account_names(s)
-        rows_all = []
         try:
-            for p in paths:
-                raw = read_csv(p) if p.lower().endswith('.csv') else read_xlsx(p)
-                rows = import_standard_rows(raw, account_names)
-                rows_all.extend(rows)
-            self._handle_import_rows(rows_all, "模版导入", {"skipped_no_io": 0})
+            self._import_files(paths, "模版导入", "standard")
         except Exception as e:
             self._show_error_dialog(str(e))
 
@@ -449,26 +432,16 @@ class MainApp(ttk.Frame):
         paths = filedialog.askopenfilenames(title="选择账单文件", filetypes=[("所有文件","*.*"), ("CSV 文件","*.csv"), ("Excel 文件","*.xlsx")])
         if not paths:
             return
-        s = load_state()
-        account_names = get_account_names(s)
-        rows_all = []
-        stats_total = {"skipped_no_io": 0}
-        from importers import try_import
         try:
-            for p in paths:
-                res = try_import(p, account_names)
-                rows_all.extend(res.get("rows", []))
-                stats_total["skipped_no_io"] += int(res.get("stats", {}).get("skipped_no_io", 0))
-            self._handle_import_rows(rows_all, "其它导入", stats_total)
+            self._import_files(paths, "其它导入")
         except Exception as e:
             self._show_error_dialog(str(e))
 
     def _list_import_batches(self):
-        s = load_state()
         groups = {}
-        for t in s.get("transactions", []):
-            rt = (t.get("record_time") or "").strip()
-            src = (t.get("record_source") or "").strip()
+        for rt, src in iter_transactions(columns=("record_time", "record_source")):
+            rt = (rt or "").strip()
+            src = (src or "").strip()
             if not rt or not src:
                 continue
             k = (rt, src)
@@ -478,23 +451,13 @@ class MainApp(ttk.Frame):
         return items
 
     def _delete_import_batch(self, record_time: str, record_source: str):
-        from storage import backup_state
-        backup_state()
-        s = load_state()
         ids = []
-        for t in s.get("transactions", []):
-            if (t.get("record_time") or "").strip() == record_time and (t.get("record_source") or "").strip() == record_source:
-                ids.append(t.get("id"))
-        for tx_id in ids:
-            t = get_transaction(s, tx_id)
-            if not t:
-                continue
-            try:
-                apply_transaction_delta(s, t, -1)
-                remove_transaction(s, tx_id)
-            except Exception:
-                pass
-        save_state(s)
+        for tx_id, rt, src in iter_transactions(columns=("id", "record_time", "record_source")):
+            if (rt or "").strip() == record_time and (src or "").strip() == record_source:
+                ids.append(tx_id)
+        with get_ledger_store().batch(label=f"删除导入批次（{record_source} {record_time[:16].replace('T', ' ')}）") as b:
+            for tx_id in ids:
+                b.delete(tx_id)
 
     def _jump_to_batch(self, record_time: str, record_source: str):
         from utils import parse_datetime
@@ -515,39 +478,28 @@ class MainApp(ttk.Frame):
         path = filedialog.asksaveasfilename(title="导出账单", defaultextension=".xlsx", filetypes=[("Excel 文件","*.xlsx"), ("CSV 文件","*.csv")])
         if not path:
             return
-        s = load_state()
         cols = ["交易时间","金额","消费类别","所属类别","账户","转入账户","转出账户","备注"]
+        def export_rows(as_text):
+            for t in iter_transactions():
+                yield [
+                    (t.time or "")[:19].replace("T"," "),
+                    str(t.amount) if as_text else t.amount,
+                    t.category or "",
+                    t.ttype or "",
+                    t.account or "",
+                    t.to_account or "",
+                    t.from_account or "",
+                    t.note or "",
+                ]
         try:
             if path.lower().endswith('.csv'):
                 import csv
                 with open(path, "w", newline="", encoding="utf-8-sig") as f:
                     w = csv.writer(f)
                     w.writerow(cols)
-                    for t in s.get("transactions", []):
-                        w.writerow([
-                            t.get("time")[:19].replace("T"," "),
-                            t.get("amount"),
-                            t.get("category",""),
-                            t.get("ttype",""),
-                            t.get("account",""),
-                            t.get("to_account",""),
-                            t.get("from_account",""),
-                            t.get("note",""),
-                        ])
+                    w.writerows(export_rows(False))
             else:
-                rows = []
-                for t in s.get("transactions", []):
-                    rows.append([
-                        t.get("time")[:19].replace("T"," "),
-                        str(t.get("amount")),
-                        t.get("category",""),
-                        t.get("ttype",""),
-                        t.get("account",""),
-                        t.get("to_account",""),
-                        t.get("from_account",""),
-                        t.get("note",""),
-                    ])
-                self._write_xlsx(path, cols, rows)
+                self._write_xlsx(path, cols, export_rows(True))
             messagebox.showinfo("导出成功", "账单已导出")
         except Exception as e:
             messagebox.showerror("导出失败", str(e))
@@ -560,6 +512,7 @@ class MainApp(ttk.Frame):
         dir_path = filedialog.askdirectory(title="选择保存位置")
         if not dir_path:
             return
+        from importers import STANDARD_TEMPLATE_COLUMNS
         cols = list(STANDARD_TEMPLATE_COLUMNS)
         ts = datetime.now().strftime("%Y%m%d%H%M%S")
         fname = f"标准账单模版_{ts}.xlsx"
@@ -576,6 +529,8 @@ class MainApp(ttk.Frame):
 
     def _write_xlsx(self, path, header, rows):
         import io
+        import zipfile
+        # rows 可为任意可迭代对象：单元格用内联字符串逐行写入压缩流，内存占用不随行数增长
         def col_name(i):
             s = ""
             i += 1
@@ -583,52 +538,36 @@ class MainApp(ttk.Frame):
                 i, r = divmod(i-1, 26)
                 s = chr(65+r) + s
             return s
-        strs = []
-        def add_str(s):
-            s = str(s)
-            if s in strs:
-                return strs.index(s)
-            strs.append(s)
-            return len(strs)-1
-        for h in header:
-            add_str(h)
-        for r in rows:
-            for v in r:
-                add_str(v)
-        shared_xml = io.StringIO()
-        shared_xml.write("<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?>")
-        shared_xml.write("<sst xmlns=\"http://schemas.openxmlformats.org/spreadsheetml/2006/main\" count=\"{}\" uniqueCount=\"{}\">".format(len(strs), len(strs)))
-        for sval in strs:
-            shared_xml.write("<si><t>{}</t></si>".format(str(sval).replace("&","&amp;").replace("<","&lt;")))
-        shared_xml.write("</sst>")
-        sheet_xml = io.StringIO()
-        sheet_xml.write("<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?>")
-        sheet_xml.write("<worksheet xmlns=\"http://schemas.openxmlformats.org/spreadsheetml/2006/main\"><sheetData>")
-        row_idx = 1
-        def write_row(vals):
-            nonlocal row_idx
-            sheet_xml.write(f"<row r=\"{row_idx}\">")
-            for i, v in enumerate(vals):
-                c = f"{col_name(i)}{row_idx}"
-                idx = add_str(v)
-                sheet_xml.write(f"<c r=\"{c}\" t=\"s\"><v>{idx}</v></c>")
-            sheet_xml.write("</row>")
-            row_idx += 1
-        write_row(header)
-        for r in rows:
-            write_row(r)
-        sheet_xml.write("</sheetData></worksheet>")
+        def esc(v):
+            return str(v).replace("&","&amp;").replace("<","&lt;").replace(">","&gt;")
         workbook_xml = "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?><workbook xmlns=\"http://schemas.openxmlformats.org/spreadsheetml/2006/main\" xmlns:r=\"http://schemas.openxmlformats.org/officeDocument/2006/relationships\"><sheets><sheet name=\"Sheet1\" sheetId=\"1\" r:id=\"rId1\"/></sheets></workbook>"
-        wb_rels = "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?><Relationships xmlns=\"http://schemas.openxmlformats.org/package/2006/relationships\"><Relationship Id=\"rId1\" Type=\"http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet\" Target=\"worksheets/sheet1.xml\"/><Relationship Id=\"rId2\" Type=\"http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings\" Target=\"sharedStrings.xml\"/></Relationships>"
+        wb_rels = "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?><Relationships xmlns=\"http://schemas.openxmlformats.org/package/2006/relationships\"><Relationship Id=\"rId1\" Type=\"http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet\" Target=\"worksheets/sheet1.xml\"/></Relationships>"
         rels_root = "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?><Relationships xmlns=\"http://schemas.openxmlformats.org/package/2006/relationships\"><Relationship Id=\"rId1\" Type=\"http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument\" Target=\"xl/workbook.xml\"/></Relationships>"
-        content_types = "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?><Types xmlns=\"http://schemas.openxmlformats.org/package/2006/content-types\"><Default Extension=\"rels\" ContentType=\"application/vnd.openxmlformats-package.relationships+xml\"/><Default Extension=\"xml\" ContentType=\"application/xml\"/><Override PartName=\"/xl/workbook.xml\" ContentType=\"application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml\"/><Override PartName=\"/xl/worksheets/sheet1.xml\" ContentType=\"application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml\"/><Override PartName=\"/xl/sharedStrings.xml\" ContentType=\"application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml\"/></Types>"
+        content_types = "<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?><Types xmlns=\"http://schemas.openxmlformats.org/package/2006/content-types\"><Default Extension=\"rels\" ContentType=\"application/vnd.openxmlformats-package.relationships+xml\"/><Default Extension=\"xml\" ContentType=\"application/xml\"/><Override PartName=\"/xl/workbook.xml\" ContentType=\"application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml\"/><Override PartName=\"/xl/worksheets/sheet1.xml\" ContentType=\"application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml\"/></Types>"
         with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
             z.writestr("[Content_Types].xml", content_types)
             z.writestr("_rels/.rels", rels_root)
             z.writestr("xl/workbook.xml", workbook_xml)
             z.writestr("xl/_rels/workbook.xml.rels", wb_rels)
-            z.writestr("xl/sharedStrings.xml", shared_xml.getvalue())
-            z.writestr("xl/worksheets/sheet1.xml", sheet_xml.getvalue())
+            with z.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as raw:
+                sheet_xml = io.TextIOWrapper(raw, encoding="utf-8")
+                sheet_xml.write("<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?>")
+                sheet_xml.write("<worksheet xmlns=\"http://schemas.openxmlformats.org/spreadsheetml/2006/main\"><sheetData>")
+                row_idx = 1
+                def write_row(vals):
+                    nonlocal row_idx
+                    parts = [f"<row r=\"{row_idx}\">"]
+                    for i, v in enumerate(vals):
+                        parts.append(f"<c r=\"{col_name(i)}{row_idx}\" t=\"inlineStr\"><is><t>{esc(v)}</t></is></c>")
+                    parts.append("</row>")
+                    sheet_xml.write("".join(parts))
+                    row_idx += 1
+                write_row(header)
+                for r in rows:
+                    write_row(r)
+                sheet_xml.write("</sheetData></worksheet>")
+                sheet_xml.flush()
+                sheet_xml.detach()
 
     def _predict_category(self, text: str, scene: str) -> str:
         s = (text or "").lower()
@@ -681,46 +620,57 @@ class MainApp(ttk.Frame):
             account_names = get_account_names(s)
             if not account_names:
                 raise ValueError("请先新增账户")
+        except Exception as e:
+            messagebox.showerror("导入失败", str(e))
+            return
+        from ui_tasks import run_task
+
+        def work(task):
             now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            results, failures = process_images(paths, account_names, parse_datetime(now_str), s.get("transactions", []))
+            from import_ai import process_images, export_failures
+            from storage import import_transactions
+            def progress(i, n):
+                task.report("识别截图", i, n, f"第 {i + 1} / {n} 张")
+                task.check()
+            results, failures = process_images(paths, account_names, parse_datetime(now_str), s.get("transactions", []), progress=progress)
+            task.check()
             now_iso = datetime.now().isoformat()
             for r in results:
                 r["record_time"] = now_iso
                 r["record_source"] = "智能导入"
             if any((not r.get("account")) for r in results):
-                acc = self.ask_default_account(account_names)
+                acc = task.call_ui(self.ask_default_account, account_names)
                 if not acc:
                     raise ValueError("未选择默认账户，无法完成导入")
                 for r in results:
                     if not r.get("account"):
                         r["account"] = acc
-            from utils import tx_signature
-            existing = {tx_signature(t) for t in s.get("transactions", [])}
-            success = 0
-            dup = 0
-            for r in results:
-                sig = tx_signature(r)
-                if sig in existing:
-                    dup += 1
-                    continue
-                existing.add(sig)
-                s["transactions"].append(r)
-                apply_transaction_delta(s, r, 1)
-                success += 1
-            save_state(s)
-            import os
+            task.report("查重并写入", 0, 0, f"识别成功 {len(results)} 条")
+            # 查重与入库同文件导入，取消时回滚已写入部分
+            def check(r):
+                task.check()
+                return r
+            stats = import_transactions(results, s, prepare=check)
             fail_path = export_failures(failures, os.path.dirname(os.path.abspath(__file__))) if failures else None
-            msg = f"智能导入完成\n总计: {len(results)} 条\n成功: {success} 条"
+            return len(results), stats, failures, fail_path
+
+        def done(res):
+            total, stats, failures, fail_path = res
+            msg = f"智能导入完成\n总计: {total} 条\n成功: {stats['imported']} 条"
             if failures:
                 msg += f"\n失败: {len(failures)} 条"
-            if dup:
-                msg += f"\n重复: {dup} 条"
+            if stats["duplicates"]:
+                msg += f"\n重复: {stats['duplicates']} 条"
             messagebox.showinfo("智能导入", msg)
             if fail_path:
                 messagebox.showinfo("失败清单已生成", fail_path)
             self.refresh_all()
-        except Exception as e:
-            messagebox.showerror("导入失败", str(e))
+
+        def cancelled():
+            messagebox.showinfo("智能导入", "已取消导入，本次已写入的账单已全部撤回")
+            self.refresh_all()
+
+        run_task(self, "智能导入", work, on_done=done, on_error=lambda e: messagebox.showerror("导入失败", str(e)), on_cancel=cancelled)
     def ask_default_account(self, account_names):
         from storage import list_accounts_by_type, get_account_types, load_state
         s = load_state()
@@ -853,6 +803,8 @@ class MainApp(ttk.Frame):
             if migrate and old_path:
                 try:
                     upath = get_user_ledger_path(uid)
+                    from storage import compact_journal
+                    compact_journal()
                     with open(old_path, "r", encoding="utf-8") as src:
                         data = src.read()
                     with open(upath, "w", encoding="utf-8") as dst:
@@ -3,9 +3,8 @@ from tkinter import ttk, messagebox
 import re
 from datetime import datetime
 from models import TRANSACTION_TYPES, Transaction, Account
-from storage import load_state, save_state, get_account_names, add_transaction, apply_transaction_delta, get_categories, add_category, delete_category, rename_category, get_account_types, list_accounts_by_type, find_account, backup_state, get_record_sources, add_record_source
+from storage import load_state, save_state, get_account_names, add_transaction, apply_transaction_delta, get_categories, add_category, delete_category, rename_category, get_account_types, list_accounts_by_type, find_account, backup_state, get_record_sources, add_record_source, replace_transaction_fields
 from utils import gen_id, parse_datetime, format_amount
-from ui_bill_list import BillListDialog
 
 class RecordPage(ttk.Frame):
     def __init__(self, master):
@@ -118,6 +117,9 @@ class RecordPage(ttk.Frame):
                 if not name:
                     return
                 s2 = load_state()
+                # 选中已有来源不写账本，只有新来源才保存
+                if name in get_record_sources(s2):
+                    return
                 add_record_source(s2, name)
                 save_state(s2)
                 self.cb_record_source["values"] = get_record_sources(s2)
@@ -594,7 +596,7 @@ class RecordPage(ttk.Frame):
             backup_state()
             for t in s.get("transactions", []):
                 if (t.get("category") or "") == name:
-                    t["category"] = ""
+                    replace_transaction_fields(s, t, {"category": ""})
         delete_category(s, self.scene, name)
         save_state(s)
         if self.category == name:
@@ -603,6 +605,7 @@ class RecordPage(ttk.Frame):
 
     def open_bill_list_for_category(self, scene, name):
         filters = {"ttype": scene, "category": name}
+        from ui_bill_list import BillListDialog
         BillListDialog(self, initial_filters=filters)
 
     def on_key(self, k):
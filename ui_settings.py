@@ -1,6 +1,6 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from storage import load_state, save_state, get_categories, add_category, get_category_rules, add_category_rule, remove_category_rule, set_ledger_path, BASE_DIR
+from storage import load_state, save_state, get_categories, add_category, get_category_rules, add_category_rule, remove_category_rule, set_ledger_path, BASE_DIR, get_pref, set_pref
 from theme import setup_theme
 import os
 
@@ -9,14 +9,12 @@ class SettingsPage(ttk.Frame):
         super().__init__(master)
         self.controller = controller
         try:
-            s = load_state()
-            val = (s.get("prefs", {}) or {}).get("menu_layout", getattr(controller, 'menu_layout_mode', 'classic'))
+            val = get_pref("menu_layout", getattr(controller, 'menu_layout_mode', 'classic'))
         except Exception:
             val = getattr(controller, 'menu_layout_mode', 'classic')
         self.layout_var = tk.StringVar(value=val)
         try:
-            s = load_state()
-            self.time_fmt_var = tk.StringVar(value=((s.get("prefs", {}) or {}).get("bill_list", {}).get("time_format", "date")))
+            self.time_fmt_var = tk.StringVar(value=get_pref("bill_list.time_format", "date"))
         except Exception:
             self.time_fmt_var = tk.StringVar(value="date")
         try:
@@ -43,8 +41,7 @@ class SettingsPage(ttk.Frame):
         theme_box = ttk.LabelFrame(self, text="主题")
         theme_box.pack(fill=tk.X, padx=8, pady=8)
         try:
-            s = load_state()
-            cur_theme = (s.get("prefs", {}) or {}).get("theme", "light")
+            cur_theme = get_pref("theme", "light")
         except Exception:
             cur_theme = "light"
         self.theme_var = tk.StringVar(value=cur_theme)
@@ -66,16 +63,29 @@ class SettingsPage(ttk.Frame):
         try:
             s = load_state()
             cur_backend = (s.get("prefs", {}) or {}).get("storage_backend", "sqlite")
-            use_pagi = bool((s.get("prefs", {}) or {}).get("use_pagination", False))
+            use_pagi = bool(get_pref("use_pagination", False))
         except Exception:
             cur_backend = "sqlite"
             use_pagi = False
-        self.backend_var = tk.StringVar(value=(cur_backend if cur_backend in ("sqlite","json") else "sqlite"))
+        self.backend_var = tk.StringVar(value=(cur_backend if cur_backend in ("sqlite","sqlite_only","json") else "sqlite"))
         self.pagi_var = tk.BooleanVar(value=use_pagi)
         ttk.Radiobutton(store, text="使用SQLite存储", value="sqlite", variable=self.backend_var, command=self.on_backend_change).pack(side=tk.LEFT, padx=8, pady=6)
+        ttk.Radiobutton(store, text="仅SQLite存储账单", value="sqlite_only", variable=self.backend_var, command=self.on_backend_change).pack(side=tk.LEFT, padx=8, pady=6)
         ttk.Radiobutton(store, text="使用JSON存储", value="json", variable=self.backend_var, command=self.on_backend_change).pack(side=tk.LEFT, padx=8, pady=6)
         ttk.Checkbutton(store, text="启用分页模式", variable=self.pagi_var, command=self.on_pagination_toggle).pack(side=tk.LEFT, padx=8, pady=6)
 
+        perf = ttk.LabelFrame(self, text="数据库性能档位")
+        perf.pack(fill=tk.X, padx=8, pady=8)
+        try:
+            from storage import get_sqlite_profile_name
+            cur_prof = get_sqlite_profile_name()
+        except Exception:
+            cur_prof = "balanced"
+        self.sqlite_profile_var = tk.StringVar(value=cur_prof)
+        ttk.Radiobutton(perf, text="默认（兼容）", value="default", variable=self.sqlite_profile_var, command=self.on_sqlite_profile_change).pack(side=tk.LEFT, padx=8, pady=6)
+        ttk.Radiobutton(perf, text="均衡（WAL）", value="balanced", variable=self.sqlite_profile_var, command=self.on_sqlite_profile_change).pack(side=tk.LEFT, padx=8, pady=6)
+        ttk.Radiobutton(perf, text="高性能（大缓存+内存映射）", value="performance", variable=self.sqlite_profile_var, command=self.on_sqlite_profile_change).pack(side=tk.LEFT, padx=8, pady=6)
+
         user_mgmt = ttk.LabelFrame(self, text="用户账户管理")
         user_mgmt.pack(fill=tk.X, padx=8, pady=8)
         try:
@@ -96,6 +106,8 @@ class SettingsPage(ttk.Frame):
         tmpl.pack(fill=tk.X, padx=8, pady=8)
         ttk.Button(tmpl, text="下载标准模板", command=self.controller.download_template).pack(side=tk.LEFT, padx=6, pady=6)
         ttk.Button(tmpl, text="备份数据", command=self.controller.backup).pack(side=tk.LEFT, padx=6, pady=6)
+        ttk.Button(tmpl, text="备份管理", command=self.open_backups).pack(side=tk.LEFT, padx=6, pady=6)
+        ttk.Button(tmpl, text="导出完整账本JSON", command=self.on_export_ledger_json).pack(side=tk.LEFT, padx=6, pady=6)
 
         system = ttk.LabelFrame(self, text="系统与工具")
         system.pack(fill=tk.X, padx=8, pady=8)
@@ -162,19 +174,16 @@ class SettingsPage(ttk.Frame):
         mode = self.layout_var.get()
         self.controller.set_menu_layout(mode)
         try:
-            s = load_state()
-            s.setdefault("prefs", {})["menu_layout"] = mode
-            save_state(s)
+            set_pref("menu_layout", mode)
         except Exception:
             pass
 
     def on_theme_change(self):
         try:
-            s = load_state()
-            s.setdefault("prefs", {})["theme"] = (self.theme_var.get() if self.theme_var.get() in ("light","dark") else "light")
-            save_state(s)
+            mode = (self.theme_var.get() if self.theme_var.get() in ("light","dark") else "light")
+            set_pref("theme", mode)
             try:
-                setup_theme(self.winfo_toplevel(), s.get("prefs", {}).get("theme", "light"))
+                setup_theme(self.winfo_toplevel(), mode)
             except Exception:
                 pass
         except Exception:
@@ -206,10 +215,7 @@ class SettingsPage(ttk.Frame):
 
     def on_time_fmt_change(self):
         try:
-            s = load_state()
-            bl = s.setdefault("prefs", {}).setdefault("bill_list", {})
-            bl["time_format"] = self.time_fmt_var.get() if self.time_fmt_var.get() in ("full","date") else "date"
-            save_state(s)
+            set_pref("bill_list.time_format", self.time_fmt_var.get() if self.time_fmt_var.get() in ("full","date") else "date")
             try:
                 self.controller.refresh_all()
             except Exception:
@@ -219,12 +225,26 @@ class SettingsPage(ttk.Frame):
 
     def on_backend_change(self):
         try:
+            val = self.backend_var.get()
+            if val == "sqlite_only":
+                if not messagebox.askyesno("仅SQLite存储账单", "账单将只保存在数据库中，ledger.json 仅保留账户、类别与偏好设置。\n迁移前会自动备份，之后可随时导出完整账本JSON。是否继续？"):
+                    s = load_state()
+                    self.backend_var.set((s.get("prefs", {}) or {}).get("storage_backend", "sqlite"))
+                    return
+                from storage import migrate_to_sqlite_only
+                migrate_to_sqlite_only()
+                try:
+                    self.controller.refresh_all()
+                except Exception:
+                    pass
+                return
             s = load_state()
-            s.setdefault("prefs", {})["storage_backend"] = (self.backend_var.get() if self.backend_var.get() in ("sqlite","json") else "sqlite")
+            # 从 sqlite_only 切回时内存中已有全部账单，保存即写回完整 JSON
+            s.setdefault("prefs", {})["storage_backend"] = (val if val in ("sqlite","json") else "sqlite")
             save_state(s)
             try:
                 from storage import migrate_json_to_sqlite
-                if self.backend_var.get() == "sqlite":
+                if val == "sqlite":
                     migrate_json_to_sqlite()
             except Exception:
                 pass
@@ -235,11 +255,30 @@ class SettingsPage(ttk.Frame):
         except Exception:
             pass
 
+    def on_export_ledger_json(self):
+        path = filedialog.asksaveasfilename(title="导出完整账本", defaultextension=".json", filetypes=[("JSON 文件","*.json")])
+        if not path:
+            return
+        try:
+            from storage import export_ledger_json
+            export_ledger_json(path)
+            messagebox.showinfo("导出成功", f"账本已导出到\n{path}")
+        except Exception as e:
+            messagebox.showerror("导出失败", str(e))
+
+    def open_backups(self):
+        BackupDialog(self, controller=self.controller)
+
+    def on_sqlite_profile_change(self):
+        try:
+            from storage import set_sqlite_profile
+            set_sqlite_profile(self.sqlite_profile_var.get())
+        except Exception:
+            pass
+
     def on_pagination_toggle(self):
         try:
-            s = load_state()
-            s.setdefault("prefs", {})["use_pagination"] = bool(self.pagi_var.get())
-            save_state(s)
+            set_pref("use_pagination", bool(self.pagi_var.get()))
             try:
                 self.controller.refresh_all()
             except Exception:
@@ -323,3 +362,92 @@ class SettingsPage(ttk.Frame):
         self._reload_rules()
 
     
+
+class BackupDialog(tk.Toplevel):
+    def __init__(self, master, controller=None):
+        super().__init__(master)
+        self.controller = controller
+        self.title("备份管理")
+        self.geometry("720x420")
+        bar = ttk.Frame(self)
+        bar.pack(fill=tk.X, padx=8, pady=6)
+        from storage import get_backup_retention
+        pol = get_backup_retention()
+        self.keep_vars = {}
+        for key, label in (("last", "保留最近"), ("daily", "每日保留天数"), ("weekly", "每周保留周数")):
+            ttk.Label(bar, text=label).pack(side=tk.LEFT)
+            var = tk.StringVar(value=str(pol.get(key, 0)))
+            ttk.Spinbox(bar, from_=(1 if key == "last" else 0), to=365, width=5, textvariable=var).pack(side=tk.LEFT, padx=(2, 10))
+            self.keep_vars[key] = var
+        ttk.Button(bar, text="保存保留策略", command=self.on_save_retention).pack(side=tk.LEFT, padx=4)
+        ttk.Button(bar, text="还原所选", command=self.on_restore).pack(side=tk.RIGHT, padx=4)
+        ttk.Button(bar, text="立即备份", command=self.on_backup).pack(side=tk.RIGHT, padx=4)
+        table = ttk.Frame(self)
+        table.pack(fill=tk.BOTH, expand=True, padx=8, pady=(0, 8))
+        cols = ["备份时间", "账单条数", "月份数", "方式", "新增占用", "耗时"]
+        self.tree = ttk.Treeview(table, columns=cols, show="headings", selectmode="browse")
+        for c in cols:
+            self.tree.heading(c, text=c)
+            self.tree.column(c, width=(180 if c == "备份时间" else 90), stretch=(c == "备份时间"))
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        vbar = ttk.Scrollbar(table, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vbar.set)
+        vbar.grid(row=0, column=1, sticky="ns")
+        table.rowconfigure(0, weight=1)
+        table.columnconfigure(0, weight=1)
+        self.lbl = ttk.Label(self, text="")
+        self.lbl.pack(fill=tk.X, padx=8, pady=(0, 6))
+        self.refresh()
+
+    def refresh(self):
+        from storage import list_backups
+        self.tree.delete(*self.tree.get_children())
+        self._paths = {}
+        items = list_backups()
+        for m in items:
+            created = (m.get("created") or "")[:19].replace("T", " ")
+            kb = float(m.get("new_bytes") or 0) / 1024.0
+            iid = self.tree.insert("", tk.END, values=[created, m.get("rows", 0), len(m.get("months", [])), ("全量" if m.get("full") else "增量"), f"{kb:.1f} KB", f"{float(m.get('elapsed_ms') or 0):.0f} ms"])
+            self._paths[iid] = m["path"]
+        self.lbl.configure(text=f"共 {len(items)} 份备份；未改动的月份在各备份间共用同一份数据")
+
+    def on_backup(self):
+        try:
+            from storage import backup_state
+            backup_state()
+        except Exception as e:
+            messagebox.showerror("备份失败", str(e), parent=self)
+        self.refresh()
+
+    def on_save_retention(self):
+        try:
+            from storage import set_backup_retention
+            vals = {k: int(v.get()) for k, v in self.keep_vars.items()}
+            set_backup_retention(**vals)
+        except ValueError:
+            messagebox.showerror("保留策略", "请输入整数", parent=self)
+            return
+        except Exception as e:
+            messagebox.showerror("保留策略", str(e), parent=self)
+        self.refresh()
+
+    def on_restore(self):
+        sel = self.tree.selection()
+        if not sel:
+            return
+        path = self._paths.get(sel[0])
+        created = self.tree.item(sel[0], "values")[0]
+        if not messagebox.askyesno("还原备份", f"将账本还原到 {created} 的备份。\n还原前会先为当前数据创建一份备份，是否继续？", parent=self):
+            return
+        try:
+            from storage import restore_backup
+            n = restore_backup(path)
+        except Exception as e:
+            messagebox.showerror("还原失败", str(e), parent=self)
+            return
+        messagebox.showinfo("还原完成", f"已还原 {n} 条账单", parent=self)
+        self.refresh()
+        try:
+            self.controller.refresh_all()
+        except Exception:
+            pass
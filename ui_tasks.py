@@ -0,0 +1,183 @@
+import threading
+import tkinter as tk
+from tkinter import ttk, messagebox
+
+# 后台任务：耗时的读取、预测、查重与入库放到工作线程执行，界面线程只负责显示
+# 工作线程不直接操作 Tk：进度写入共享槽位、界面调用排入队列，由界面线程经 after() 定时取出处理
+POLL_MS = 50
+
+class TaskCancelled(Exception):
+    pass
+
+class TaskContext:
+    # 交给工作函数的句柄：report 更新进度，check 响应取消，call_ui 在界面线程执行（如弹出选择账户）并等待结果
+    def __init__(self, task):
+        self._task = task
+
+    @property
+    def cancelled(self) -> bool:
+        return self._task._cancel.is_set()
+
+    def check(self):
+        if self._task._cancel.is_set():
+            raise TaskCancelled()
+
+    def report(self, phase: str = None, done: int = None, total: int = None, text: str = None):
+        # 只保留最新一次进度，界面线程按 POLL_MS 刷新，不会因进度过密而积压
+        with self._task._lock:
+            p = self._task._progress
+            if phase is not None:
+                p["phase"] = phase
+            if done is not None:
+                p["done"] = done
+            if total is not None:
+                p["total"] = total
+            if text is not None:
+                p["text"] = text
+            self._task._dirty = True
+
+    def call_ui(self, fn, *args):
+        self.check()
+        box = {}
+        done = threading.Event()
+        with self._task._lock:
+            self._task._calls.append((fn, args, box, done))
+        while not done.wait(0.1):
+            if not self._task._thread.is_alive():
+                break
+        if "error" in box:
+            raise box["error"]
+        return box.get("value")
+
+class BackgroundTask:
+    # work(ctx) 在工作线程执行，返回值交给 on_done；出错交给 on_error（默认弹窗提示）；
+    # 取消后 work 在下一个 ctx.check() 处抛出 TaskCancelled，由 work 自行回滚已提交的部分，随后调用 on_cancel
+    def __init__(self, master, title: str, work, on_done=None, on_error=None, on_cancel=None, cancellable: bool = True):
+        self.master = master
+        self.title = title
+        self.work = work
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._progress = {"phase": "准备中", "done": 0, "total": 0, "text": ""}
+        self._dirty = True
+        self._calls = []
+        self._outcome = None
+        self._thread = threading.Thread(target=self._run, name=f"task-{title}", daemon=True)
+        self.dialog = TaskProgressDialog(master, title, self.cancel if cancellable else None)
+
+    def start(self):
+        self._thread.start()
+        self.master.after(POLL_MS, self._poll)
+        return self
+
+    def cancel(self):
+        if not self._cancel.is_set():
+            self._cancel.set()
+            self.dialog.set_cancelling()
+
+    def _run(self):
+        ctx = TaskContext(self)
+        try:
+            self._outcome = ("done", self.work(ctx))
+        except TaskCancelled:
+            self._outcome = ("cancelled", None)
+        except BaseException as e:
+            self._outcome = ("error", e)
+
+    def _poll(self):
+        with self._lock:
+            calls = self._calls
+            self._calls = []
+            progress = dict(self._progress) if self._dirty else None
+            self._dirty = False
+        for fn, args, box, done in calls:
+            try:
+                box["value"] = fn(*args)
+            except BaseException as e:
+                box["error"] = e
+            finally:
+                done.set()
+            # 界面调用中弹出的对话框会抢走输入焦点，结束后交还进度窗
+            self.dialog.regrab()
+        if progress is not None:
+            self.dialog.show(progress)
+        if self._thread.is_alive() or self._calls:
+            self.master.after(POLL_MS, self._poll)
+            return
+        self._finish()
+
+    def _finish(self):
+        self.dialog.destroy()
+        kind, value = self._outcome or ("error", RuntimeError("任务未返回结果"))
+        if kind == "done":
+            if self.on_done is not None:
+                self.on_done(value)
+        elif kind == "cancelled":
+            if self.on_cancel is not None:
+                self.on_cancel()
+            else:
+                messagebox.showinfo(self.title, "已取消，本次未导入的改动已全部撤回")
+        else:
+            if self.on_error is not None:
+                self.on_error(value)
+            else:
+                messagebox.showerror(self.title, str(value))
+
+def run_task(master, title: str, work, on_done=None, on_error=None, on_cancel=None, cancellable: bool = True) -> BackgroundTask:
+    return BackgroundTask(master, title, work, on_done, on_error, on_cancel, cancellable).start()
+
+class TaskProgressDialog(tk.Toplevel):
+    def __init__(self, master, title="处理中", on_cancel=None):
+        super().__init__(master)
+        self.title(title)
+        self.transient(master)
+        self.resizable(False, False)
+        self.lbl_phase = ttk.Label(self, text="准备中")
+        self.lbl_phase.pack(padx=16, pady=(16, 6), anchor=tk.W)
+        self.bar = ttk.Progressbar(self, mode="determinate", maximum=1000, length=360)
+        self.bar.pack(padx=16, pady=(0, 6))
+        self.lbl = ttk.Label(self, text="")
+        self.lbl.pack(padx=16, pady=(0, 8), anchor=tk.W)
+        self.on_cancel = on_cancel
+        self._cancelling = False
+        btns = ttk.Frame(self)
+        btns.pack(fill=tk.X, padx=16, pady=(0, 12))
+        self.btn_cancel = ttk.Button(btns, text="取消", command=self._cancel, state=(tk.NORMAL if on_cancel else tk.DISABLED))
+        self.btn_cancel.pack(side=tk.RIGHT, padx=4)
+        self.protocol("WM_DELETE_WINDOW", self._cancel)
+        self.grab_set()
+        self.update_idletasks()
+
+    def _cancel(self):
+        if self.on_cancel is not None:
+            self.on_cancel()
+
+    def set_cancelling(self):
+        self._cancelling = True
+        self.btn_cancel.configure(state=tk.DISABLED)
+        self.lbl_phase.configure(text="正在取消并撤回已导入的部分…")
+
+    def regrab(self):
+        try:
+            if self.winfo_exists():
+                self.grab_set()
+        except tk.TclError:
+            pass
+
+    def show(self, progress):
+        total = progress.get("total") or 0
+        done = progress.get("done") or 0
+        if total:
+            if str(self.bar["mode"]) != "determinate":
+                self.bar.stop()
+                self.bar.configure(mode="determinate")
+            self.bar["value"] = min(1000, int(done * 1000 / total))
+        elif str(self.bar["mode"]) != "indeterminate":
+            self.bar.configure(mode="indeterminate")
+            self.bar.start(15)
+        if not self._cancelling:
+            self.lbl_phase.configure(text=progress.get("phase") or "")
+        self.lbl.configure(text=progress.get("text") or "")
@@ -1,133 +1,207 @@
 import zipfile
 from xml.etree import ElementTree as ET
 
+# 流式读取：iterparse 逐行解析工作表，处理完即清除元素，内存与行数无关
+# 表头最多在前 HEADER_SCAN_ROWS 行内查找（导出文件开头的说明文字一般只有十几行），找不到按首行作表头
+HEADER_SCAN_ROWS = 200
+
+_HEADER_NAMES = ["交易时间", "格式化时间", "Formatted Time", "金额", "金额(元)", "交易金额", "Transaction Amount"]
+_local_names = {}
+
+def _local(tag):
+    # 去掉命名空间的标签名，按原标签缓存
+    name = _local_names.get(tag)
+    if name is None:
+        name = tag.rpartition('}')[2] if isinstance(tag, str) else ''
+        _local_names[tag] = name
+    return name
+
 def _col_to_index(col):
     n = 0
     for ch in col:
         n = n * 26 + (ord(ch) - 64)
     return n - 1
 
-def _parse_shared_strings(z):
-    try:
-        with z.open('xl/sharedStrings.xml') as f:
-            root = ET.fromstring(f.read())
-        strings = []
-        for si in root.iter():
-            tag = si.tag if isinstance(si.tag, str) else ''
-            if tag.endswith('si'):
-                text = ''
-                for t in si.iter():
-                    ttag = t.tag if isinstance(t.tag, str) else ''
-                    if ttag.endswith('t') and t.text is not None:
-                        text += t.text
-                strings.append(text)
-        return strings
-    except KeyError:
-        return []
+class _SharedStrings:
+    # 共享字符串按需解析：引用到第 i 个时才把 sharedStrings.xml 向后解析到第 i 个，已解析的按下标缓存
+    def __init__(self, z):
+        self._strings = []
+        self._f = None
+        self._it = None
+        self._root = None
+        try:
+            self._f = z.open('xl/sharedStrings.xml')
+        except KeyError:
+            return
+        self._it = ET.iterparse(self._f, events=("start", "end"))
+
+    def get(self, idx):
+        while idx >= len(self._strings) and self._it is not None:
+            self._advance()
+        return self._strings[idx] if 0 <= idx < len(self._strings) else ''
+
+    def _advance(self):
+        for ev, el in self._it:
+            if ev == "start":
+                if self._root is None:
+                    self._root = el
+                continue
+            if _local(el.tag) == 'si':
+                self._strings.append(''.join(t.text for t in el.iter() if _local(t.tag) == 't' and t.text is not None))
+                self._root.clear()
+                return
+        self.close()
+
+    def close(self):
+        self._it = None
+        if self._f is not None:
+            self._f.close()
+            self._f = None
 
 def _cell_value(c, shared):
     t = c.attrib.get('t')
     v = None
     for child in c:
-        tag = child.tag if isinstance(child.tag, str) else ''
-        if tag.endswith('v'):
+        tag = _local(child.tag)
+        if tag == 'v':
             v = child.text
             break
-        if tag.endswith('is'):
-            for tt in child.iter():
-                ttag = tt.tag if isinstance(tt.tag, str) else ''
-                if ttag.endswith('t') and tt.text is not None:
-                    return tt.text
+        if tag == 'is':
+            # 富文本内联字符串分成多段 <r><t>，与共享字符串一样拼接全部文本
+            return ''.join(tt.text for tt in child.iter() if _local(tt.tag) == 't' and tt.text is not None)
     if t == 's' and v is not None:
         try:
-            idx = int(v)
-            return shared[idx] if 0 <= idx < len(shared) else ''
+            return shared.get(int(v))
         except Exception:
             return ''
     return v if v is not None else ''
 
-def read_xlsx(path):
+def _row_values(row, shared):
+    # 按单元格引用（如 C5）放到对应列，缺省列补空串；没有单元格的行返回 None
+    cells = {}
+    max_idx = -1
+    for c in row:
+        if _local(c.tag) != 'c':
+            continue
+        ref = c.attrib.get('r', '')
+        col = ''.join(ch for ch in ref if ch.isalpha())
+        idx = _col_to_index(col) if col else (max_idx + 1)
+        cells[idx] = _cell_value(c, shared)
+        if idx > max_idx:
+            max_idx = idx
+    if max_idx < 0:
+        return None
+    row_vals = [''] * (max_idx + 1)
+    for i, v in cells.items():
+        row_vals[i] = v
+    return row_vals
+
+def _sheet_targets(z):
+    # 工作簿内各工作表 [(名称, 包内路径)]，按工作簿中的顺序
+    try:
+        wb = ET.fromstring(z.read('xl/workbook.xml'))
+        rels = ET.fromstring(z.read('xl/_rels/workbook.xml.rels'))
+    except KeyError:
+        return []
+    targets = {r.attrib.get('Id'): r.attrib.get('Target', '') for r in rels.iter() if _local(r.tag) == 'Relationship'}
+    out = []
+    for s in wb.iter():
+        if _local(s.tag) != 'sheet':
+            continue
+        rid = next((v for k, v in s.attrib.items() if _local(k) == 'id'), None)
+        target = targets.get(rid)
+        if not target:
+            continue
+        target = target.lstrip('/') if target.startswith('/') else 'xl/' + target
+        out.append((s.attrib.get('name', ''), target))
+    return out
+
+def list_sheets(path):
+    with zipfile.ZipFile(path) as z:
+        return [name for name, _ in _sheet_targets(z)]
+
+def _sheet_member(z, sheet):
+    # sheet 为 None 时沿用 sheet1.xml（没有则取第一个工作表），为整数时按序号，为字符串时按名称
+    if sheet is None:
+        if 'xl/worksheets/sheet1.xml' in z.namelist():
+            return 'xl/worksheets/sheet1.xml'
+        sheets = _sheet_targets(z)
+        return sheets[0][1] if sheets else None
+    sheets = _sheet_targets(z)
+    if isinstance(sheet, int):
+        if 0 <= sheet < len(sheets):
+            return sheets[sheet][1]
+    else:
+        for name, target in sheets:
+            if name == sheet:
+                return target
+    raise ValueError(f"工作表不存在：{sheet}")
+
+def iter_xlsx_rows(path, sheet=None):
+    # 逐行产出单元格值列表；path 可为文件路径或可 seek 的二进制文件对象
     with zipfile.ZipFile(path) as z:
-        shared = _parse_shared_strings(z)
-        sheet_path = 'xl/worksheets/sheet1.xml'
+        member = _sheet_member(z, sheet)
+        if member is None:
+            return
+        shared = _SharedStrings(z)
         try:
-            with z.open(sheet_path) as f:
-                root = ET.fromstring(f.read())
+            with z.open(member) as f:
+                parent = None
+                for ev, el in ET.iterparse(f, events=("start", "end")):
+                    if ev == "start":
+                        if parent is None and _local(el.tag) == 'sheetData':
+                            parent = el
+                        continue
+                    if _local(el.tag) != 'row':
+                        continue
+                    vals = _row_values(el, shared)
+                    # 已处理的行从 sheetData 中摘除，解析树不随行数增长
+                    if parent is not None:
+                        parent.clear()
+                    else:
+                        el.clear()
+                    if vals is not None:
+                        yield vals
         except KeyError:
-            return []
-    rows = []
-    for row in root.iter():
-        tag = row.tag if isinstance(row.tag, str) else ''
-        if tag.endswith('row'):
-            cells = {}
-            max_idx = -1
-            for c in row:
-                ctag = c.tag if isinstance(c.tag, str) else ''
-                if not ctag.endswith('c'):
-                    continue
-                ref = c.attrib.get('r', '')
-                col = ''.join(ch for ch in ref if ch.isalpha())
-                idx = _col_to_index(col) if col else (max_idx + 1)
-                val = _cell_value(c, shared)
-                cells[idx] = val
-                if idx > max_idx:
-                    max_idx = idx
-            if max_idx >= 0:
-                row_vals = [''] * (max_idx + 1)
-                for i, v in cells.items():
-                    row_vals[i] = v
-                rows.append(row_vals)
-    if not rows:
-        return []
+            return
+        finally:
+            shared.close()
+
+def _is_header_row(r):
+    cells = [str(x).strip() for x in r]
+    return any(h in cells for h in _HEADER_NAMES)
+
+def iter_xlsx(path, sheet=None):
+    # 逐行产出 {表头名: 值, 列i: 值}；表头前的说明行先缓存在 HEADER_SCAN_ROWS 行以内
+    it = iter_xlsx_rows(path, sheet)
+    head = []
     header_idx = None
-    for i, r in enumerate(rows):
-        lowered = [str(x).strip() for x in r]
-        if any(h in lowered for h in ["交易时间", "格式化时间", "Formatted Time", "金额", "金额(元)", "交易金额", "Transaction Amount"]):
-            header_idx = i
+    for r in it:
+        head.append(r)
+        if _is_header_row(r):
+            header_idx = len(head) - 1
             break
+        if len(head) >= HEADER_SCAN_ROWS:
+            break
+    if not head:
+        return
     if header_idx is None:
         header_idx = 0
-    header = [str(h).strip() for h in rows[header_idx]]
-    out = []
-    for r in rows[header_idx + 1:]:
+    header = [str(h).strip() for h in head[header_idx]]
+    keys = [((h if h else f"列{i}"), f"列{i}") for i, h in enumerate(header)]
+    def rows():
+        yield from head[header_idx + 1:]
+        yield from it
+    for r in rows():
         d = {}
-        for i in range(min(len(header), len(r))):
-            key = header[i] if header[i] else f"列{i}"
-            d[key] = r[i]
-            d[f"列{i}"] = r[i]
+        for (key, col), v in zip(keys, r):
+            d[key] = v
+            d[col] = v
         if any(str(v).strip() != '' for v in d.values()):
-            out.append(d)
-    return out
+            yield d
 
-def read_xlsx_rows(path):
-    with zipfile.ZipFile(path) as z:
-        shared = _parse_shared_strings(z)
-        sheet_path = 'xl/worksheets/sheet1.xml'
-        try:
-            with z.open(sheet_path) as f:
-                root = ET.fromstring(f.read())
-        except KeyError:
-            return []
-    rows = []
-    for row in root.iter():
-        tag = row.tag if isinstance(row.tag, str) else ''
-        if tag.endswith('row'):
-            cells = {}
-            max_idx = -1
-            for c in row:
-                ctag = c.tag if isinstance(c.tag, str) else ''
-                if not ctag.endswith('c'):
-                    continue
-                ref = c.attrib.get('r', '')
-                col = ''.join(ch for ch in ref if ch.isalpha())
-                idx = _col_to_index(col) if col else (max_idx + 1)
-                val = _cell_value(c, shared)
-                cells[idx] = val
-                if idx > max_idx:
-                    max_idx = idx
-            if max_idx >= 0:
-                row_vals = [''] * (max_idx + 1)
-                for i, v in cells.items():
-                    row_vals[i] = v
-                rows.append(row_vals)
-    return rows
+def read_xlsx(path, sheet=None):
+    return list(iter_xlsx(path, sheet))
+
+def read_xlsx_rows(path, sheet=None):
+    return list(iter_xlsx_rows(path, sheet))